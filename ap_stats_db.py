@@ -2,6 +2,216 @@ import os
 import sqlite3
 import re
 
+def _add_problem_metadata_columns(conn):
+    """problem_type and problem_num on problems (older databases got them from fix_database_schema.py)."""
+    columns = [column[1] for column in conn.execute("PRAGMA table_info(problems)")]
+    if 'problem_type' not in columns:
+        conn.execute("ALTER TABLE problems ADD COLUMN problem_type TEXT")
+    if 'problem_num' not in columns:
+        conn.execute("ALTER TABLE problems ADD COLUMN problem_num TEXT")
+
+
+def _create_operation_log(conn):
+    """Server-side log of the write operations done through the web app."""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS operation_log (
+        id INTEGER PRIMARY KEY,
+        created REAL NOT NULL,
+        operation TEXT NOT NULL,
+        actor TEXT,
+        counts TEXT,
+        duration_ms REAL,
+        details TEXT
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_operation_log_created ON operation_log (created)')
+
+
+def create_sessions_table(conn):
+    """Server-side web sessions (see sessions.py), keyed by the id in the session cookie."""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS sessions (
+        id TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        expires REAL NOT NULL
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires)')
+
+
+# Tables whose changes can alter a rendered page
+VERSIONED_TABLES = ('units', 'topics', 'problems', 'problem_topics')
+
+
+def _create_data_version(conn):
+    """A counter in app_meta bumped by triggers on every change to the versioned tables."""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS app_meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO app_meta (key, value) VALUES ('data_version', 0)")
+    for table in VERSIONED_TABLES:
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_data_version
+            AFTER {event} ON {table}
+            BEGIN
+                UPDATE app_meta SET value = value + 1 WHERE key = 'data_version';
+            END
+            ''')
+
+
+def _create_structure_version(conn):
+    """A counter in app_meta bumped only by changes to units and topics (the course structure)."""
+    conn.execute("INSERT OR IGNORE INTO app_meta (key, value) VALUES ('structure_version', 0)")
+    for table in ('units', 'topics'):
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_structure_version
+            AFTER {event} ON {table}
+            BEGIN
+                UPDATE app_meta SET value = value + 1 WHERE key = 'structure_version';
+            END
+            ''')
+
+
+def topic_seq(topic_number):
+    """The position of a topic in its unit as an integer: 10 for "1.10", None if it has no number."""
+    match = re.match(r'\d+\.(\d+)', topic_number or '')
+    return int(match.group(1)) if match else None
+
+
+def _add_topic_sort_columns(conn):
+    """Integer unit_number and topic_seq on topics, indexed, so topics sort as 1.9 < 1.10 in SQL."""
+    columns = [column[1] for column in conn.execute("PRAGMA table_info(topics)")]
+    if 'unit_number' not in columns:
+        conn.execute("ALTER TABLE topics ADD COLUMN unit_number INTEGER")
+    if 'topic_seq' not in columns:
+        conn.execute("ALTER TABLE topics ADD COLUMN topic_seq INTEGER")
+    conn.execute('''
+    UPDATE topics SET
+        unit_number = (SELECT unit_number FROM units WHERE units.unit_id = topics.unit_id),
+        topic_seq = CASE WHEN instr(topic_number, '.') > 0
+                         THEN CAST(substr(topic_number, instr(topic_number, '.') + 1) AS INTEGER) END
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_topics_order ON topics (unit_number, topic_seq)')
+
+
+def _add_catalog_columns(conn):
+    """FRQ group id, part number and image path on problems (kept up to date by catalog.py)."""
+    from catalog import parse_problem_filename
+
+    columns = [column[1] for column in conn.execute("PRAGMA table_info(problems)")]
+    for name, kind in (('group_id', 'TEXT'), ('part_num', 'INTEGER'), ('image_path', 'TEXT')):
+        if name not in columns:
+            conn.execute(f"ALTER TABLE problems ADD COLUMN {name} {kind}")
+
+    rows = conn.execute('SELECT problem_id, problem_number FROM problems').fetchall()
+    updates = []
+    for problem_id, problem_number in rows:
+        parsed = parse_problem_filename(problem_number or '')
+        updates.append((parsed['group_id'], parsed['part_num'], problem_id))
+    conn.executemany('UPDATE problems SET group_id = ?, part_num = ? WHERE problem_id = ?', updates)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_problems_number ON problems (problem_number)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_problems_group ON problems (group_id, part_num)')
+
+
+def _unique_problem_topics(conn):
+    """One link per problem and topic, enforced by a unique index (the target of topic upserts)."""
+    # Duplicate links are removed, keeping the oldest
+    conn.execute('''
+        DELETE FROM problem_topics
+        WHERE id NOT IN (SELECT MIN(id) FROM problem_topics GROUP BY problem_id, topic_id)
+    ''')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_problem_topics_pair ON problem_topics (problem_id, topic_id)')
+
+
+def _create_jobs(conn):
+    """Records of the background jobs started from the web app (see jobs.py)."""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        status TEXT NOT NULL,
+        params TEXT,
+        progress REAL NOT NULL DEFAULT 0,
+        message TEXT,
+        result TEXT,
+        error TEXT,
+        cancel_requested INTEGER NOT NULL DEFAULT 0,
+        pid INTEGER,
+        created REAL NOT NULL,
+        started REAL,
+        finished REAL
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, kind)')
+
+
+def _meta_value(conn, key):
+    row = conn.execute('SELECT value FROM app_meta WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else 0
+
+
+def get_data_version(conn):
+    """The current data version (see _create_data_version)."""
+    return _meta_value(conn, 'data_version')
+
+
+def get_structure_version(conn):
+    """The current course structure version (see _create_structure_version)."""
+    return _meta_value(conn, 'structure_version')
+
+
+# Schema changes applied to existing databases, in order. The number of
+# migrations applied is kept in PRAGMA user_version. Never reorder or remove
+# entries; add new ones at the end.
+MIGRATIONS = [
+    _add_problem_metadata_columns,
+    _create_operation_log,
+    create_sessions_table,
+    _create_data_version,
+    _create_structure_version,
+    _add_topic_sort_columns,
+    _add_catalog_columns,
+    _unique_problem_topics,
+    _create_jobs,
+]
+
+
+def migrate(conn):
+    """Apply the migrations the database has not had yet. Returns how many were applied."""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+        migration(conn)
+        conn.execute(f'PRAGMA user_version = {number}')
+        conn.commit()
+    return max(len(MIGRATIONS) - version, 0)
+
+
+class SchemaOutOfDate(RuntimeError):
+    """The database has not had every schema migration yet."""
+
+
+def check_schema(conn):
+    """Raise SchemaOutOfDate unless every migration has been applied (for tools that only read)."""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version < len(MIGRATIONS):
+        raise SchemaOutOfDate(f"The database schema is at version {version} of {len(MIGRATIONS)}: "
+                              f"run the app or migrate first (python catalog.py migrates it)")
+
+
+def ensure_schema(db_path='ap_stats.db'):
+    """Bring the database at db_path up to the current schema."""
+    conn = sqlite3.connect(db_path)
+    try:
+        return migrate(conn)
+    finally:
+        conn.close()
+
+
 class APStatsDatabase:
     def __init__(self, db_name='ap_stats.db'):
         """Initialize the database connection and create tables if they don't exist."""
@@ -59,6 +269,7 @@ class APStatsDatabase:
         ''')
         
         self.conn.commit()
+        migrate(self.conn)
     
     def import_knowledge_tree(self, tree_file='APStats-StructuredTree.txt'):
         """Import the knowledge tree structure from the structured file."""
@@ -70,6 +281,7 @@ class APStatsDatabase:
             lines = file.readlines()
         
         current_unit_id = None
+        current_unit_number = None
         
         for line in lines:
             line = line.strip()
@@ -98,6 +310,7 @@ class APStatsDatabase:
                     
                     self.conn.commit()
                     current_unit_id = self.cursor.lastrowid
+                    current_unit_number = unit_number
                     print(f"Added unit: {unit_name}")
             
             # Process topic lines
@@ -117,9 +330,10 @@ class APStatsDatabase:
                         
                         # Insert topic into database
                         self.cursor.execute('''
-                        INSERT INTO topics (unit_id, topic_number, topic_name, full_path)
-                        VALUES (?, ?, ?, ?)
-                        ''', (current_unit_id, topic_number, topic_name, full_path))
+                        INSERT INTO topics (unit_id, topic_number, topic_name, full_path, unit_number, topic_seq)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ''', (current_unit_id, topic_number, topic_name, full_path,
+                              current_unit_number, topic_seq(topic_number)))
                         
                         self.conn.commit()
                         print(f"Added topic: {topic}")
@@ -194,7 +408,7 @@ class APStatsDatabase:
                                     
                                     # Create the problem-topic relationship
                                     self.cursor.execute('''
-                                    INSERT INTO problem_topics (problem_id, topic_id, relevance_score)
+                                    INSERT OR IGNORE INTO problem_topics (problem_id, topic_id, relevance_score)
                                     VALUES (?, ?, ?)
                                     ''', (problem_id, topic_id, 5))  # Default high relevance
                                     
@@ -1,22 +1,56 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, jsonify, session
+from flask import Flask, current_app, render_template, request, redirect, url_for, flash, send_from_directory, jsonify, session
+from jinja2 import FileSystemBytecodeCache
 import sqlite3
 import os
 import re
 import glob
+import io
 import time
+from urllib.parse import urlencode
 
-app = Flask(__name__)
-app.secret_key = 'apstats_secret_key'  # For flash messages and session
+import db_writer
+import instrumentation
+import jobs
+import metrics
+import operation_log
+import page_cache
+import profiling
+import sessions
+from ap_stats_db import ensure_schema
+from assignments import AssignmentError, apply_assignments, count_results, parse_items
+from catalog import DEFAULT_COURSE_DIR, parse_problem_filename, sync_catalog
+from course_tree import get_course_tree
+from backup_database import BackupScheduler, get_backup_metrics, list_backups
+from bulk_metadata import MetadataError, export_metadata, plan_and_apply, read_rows, summarize, update_metadata
+from instrumentation import timed_scan
+from operation_log import record_operation
+from queries import get_group_detail, get_problem_detail
+
+# Routes as (rule, view function, options), added to the app by create_app()
+ROUTES = []
+
+def route(rule, **options):
+    """Like app.route, for the app create_app() makes; endpoints keep the function names."""
+    def decorator(view):
+        ROUTES.append((rule, view, options))
+        return view
+    return decorator
+
+def database_path():
+    return current_app.config['DATABASE']
+
+def course_dir():
+    return current_app.config['COURSE_DIR']
 
 # Database connection helper
 def get_db_connection():
-    conn = sqlite3.connect('ap_stats.db')
+    conn = instrumentation.connect(database_path())
     conn.row_factory = sqlite3.Row  # This enables column access by name
     return conn
 
-# Function to get all problem images from Unit1 folder
+# Function to get all problem images from the unit folders
 def get_problem_images():
-    base_path = 'AP_Statistics_Course'
+    base_path = course_dir()
     image_files = []
     
     # Connect to database to get stored metadata
@@ -34,31 +68,33 @@ def get_problem_images():
             'difficulty': problem['difficulty'],
             'source': problem['source'],
             'problem_type': problem['problem_type'] if 'problem_type' in problem.keys() else None,
-            'problem_num': problem['problem_num'] if 'problem_num' in problem.keys() else None
+            'problem_num': problem['problem_num'] if 'problem_num' in problem.keys() else None,
+            'group_id': problem['group_id']
         }
     
     conn.close()
     
-    # Get all unit directories
-    unit_dirs = [d for d in os.listdir(base_path) if os.path.isdir(os.path.join(base_path, d)) and d.startswith('Unit')]
-    
-    # Scan each unit directory for PNG files
-    for unit_dir in unit_dirs:
-        unit_path = os.path.join(base_path, unit_dir)
-        
-        # Extract unit number for reference
-        unit_match = re.search(r'Unit (\d+)', unit_dir)
-        unit_number = unit_match.group(1) if unit_match else "Unknown"
+    with timed_scan('catalog'):
+        # Get all unit directories
+        unit_dirs = [d for d in os.listdir(base_path) if os.path.isdir(os.path.join(base_path, d)) and d.startswith('Unit')]
         
-        # Get all PNG files directly in the unit folder
-        for file in glob.glob(os.path.join(unit_path, '*.png')):
-            process_image_file(file, unit_number, problem_metadata, image_files)
+        # Scan each unit directory for PNG files
+        for unit_dir in unit_dirs:
+            unit_path = os.path.join(base_path, unit_dir)
             
-        # Also check subdirectories within each unit
-        for subdir, _, _ in os.walk(unit_path):
-            if subdir != unit_path:  # Skip the main unit directory (already processed)
-                for file in glob.glob(os.path.join(subdir, '*.png')):
-                    process_image_file(file, unit_number, problem_metadata, image_files)
+            # Extract unit number for reference
+            unit_match = re.search(r'Unit (\d+)', unit_dir)
+            unit_number = unit_match.group(1) if unit_match else "Unknown"
+            
+            # Get all PNG files directly in the unit folder
+            for file in glob.glob(os.path.join(unit_path, '*.png')):
+                process_image_file(file, unit_number, problem_metadata, image_files)
+                
+            # Also check subdirectories within each unit
+            for subdir, _, _ in os.walk(unit_path):
+                if subdir != unit_path:  # Skip the main unit directory (already processed)
+                    for file in glob.glob(os.path.join(subdir, '*.png')):
+                        process_image_file(file, unit_number, problem_metadata, image_files)
     
     # Sort by year, then by problem number, then by part number
     image_files.sort(key=lambda x: (
@@ -124,6 +160,7 @@ def process_image_file(file, unit_number, problem_metadata, image_files):
         'number': problem_num,
         'part': part_num,
         'group_id': group_id,
+        'catalog_group_id': stored_metadata.get('group_id'),  # the group page's id, kept by catalog.py
         'description': description,
         'display_name': display_name,
         'unit': unit_number  # Add unit number for reference
@@ -152,31 +189,77 @@ def group_problem_images(problem_images):
     
     return grouped_problems, standalone_problems
 
-@app.route('/')
-def index():
-    """Home page showing problems with images."""
-    # Check if we should only show uncategorized problems - use session for persistence
-    show_uncategorized = request.args.get('show_uncategorized')
+def find_frq_parts(conn, filename):
+    """All problems of the FRQ group filename belongs to (same year and FRQ number), in one query."""
+    group_id = parse_problem_filename(filename)['group_id']
+    if not group_id:
+        return []
+    return conn.execute('''
+        SELECT * FROM problems
+        WHERE group_id = ?
+        ORDER BY problem_number
+    ''', (group_id,)).fetchall()
+
+# Query parameters of the index filters, in canonical order
+INDEX_FILTERS = ('show_uncategorized', 'unit_filter')
+
+def index_filter_params(show_uncategorized=False, unit_filter=None):
+    """Canonical query parameters for the index filters: defaults are left out."""
+    params = {}
+    if show_uncategorized:
+        params['show_uncategorized'] = 'true'
+    if unit_filter:
+        params['unit_filter'] = unit_filter
+    return params
+
+def index_url(show_uncategorized=False, unit_filter=None):
+    if not current_app.config['URL_FILTERS']:
+        # Both filters are given, so a link also replaces the ones kept in the session
+        return url_for('index', show_uncategorized='true' if show_uncategorized else 'false',
+                       unit_filter=unit_filter or '')
+    return url_for('index', **index_filter_params(show_uncategorized, unit_filter))
+
+def session_index_filters():
+    """The index filters given in the URL, remembered in the session for the next visits."""
+    show_uncategorized = (request.args.get('show_uncategorized') or '').lower()
+    if show_uncategorized in ('true', 'false'):
+        session['show_uncategorized'] = show_uncategorized == 'true'
     unit_filter = request.args.get('unit_filter')
-    
-    # If parameters are provided in the URL, update the session
-    if show_uncategorized is not None:
-        if show_uncategorized.lower() == 'true':
-            session['show_uncategorized'] = True
-        elif show_uncategorized.lower() == 'false':
-            session['show_uncategorized'] = False
-    elif 'show_uncategorized' not in session:
-        session['show_uncategorized'] = False
-    
     if unit_filter is not None:
-        session['unit_filter'] = unit_filter
-    elif 'unit_filter' not in session:
-        session['unit_filter'] = None
-    
-    # Use session values for filtering
-    show_uncategorized = session['show_uncategorized']
-    unit_filter = session['unit_filter']
-    
+        session['unit_filter'] = unit_filter.strip() or None
+    return session.get('show_uncategorized', False), session.get('unit_filter')
+
+@route('/')
+def index():
+    """Home page showing problems with images."""
+    if not current_app.config['URL_FILTERS']:
+        # The filters are kept in the session: the rendered page is still cached,
+        # but the response depends on this browser's session and is not shared
+        show_uncategorized, unit_filter = session_index_filters()
+        return page_cache.cached_page(('index', show_uncategorized, unit_filter),
+                                      lambda: render_index(show_uncategorized, unit_filter), shared=False)
+
+    # With URL_FILTERS the filters live only in the URL, so the page depends on
+    # nothing but the URL and the data and can be shared; the browser remembers the last ones
+    show_uncategorized = (request.args.get('show_uncategorized') or '').lower() == 'true'
+    unit_filter = (request.args.get('unit_filter') or '').strip() or None
+    
+    # Redirect other spellings of the same filters to the canonical URL
+    params = index_filter_params(show_uncategorized, unit_filter)
+    given = [(key, value) for key, value in request.args.items(multi=True) if key in INDEX_FILTERS]
+    if given != list(params.items()):
+        # Built by hand: url_for() would take keys such as 'endpoint' as its own arguments
+        query = list(params.items()) + [(key, value) for key, value in request.args.items(multi=True)
+                                        if key not in INDEX_FILTERS]
+        return redirect(url_for('index') + ('?' + urlencode(query) if query else ''))
+    
+    return page_cache.cached_page(('index', show_uncategorized, unit_filter),
+                                  lambda: render_index(show_uncategorized, unit_filter))
+
+def render_index(show_uncategorized, unit_filter):
+    """The HTML of the home page for the given filters."""
+    # A pure read: new images get their problems row from the catalog sync at startup,
+    # in the catalog sync job or on their first visit, not here
     # Get all problem images
     problem_images = get_problem_images()
     
@@ -212,8 +295,9 @@ def index():
         }
     
     # Get all unit directories for the filter dropdown
-    unit_dirs = [d for d in os.listdir('AP_Statistics_Course') 
-                if os.path.isdir(os.path.join('AP_Statistics_Course', d)) and d.startswith('Unit')]
+    with timed_scan('unit_dirs'):
+        unit_dirs = [d for d in os.listdir(course_dir()) 
+                    if os.path.isdir(os.path.join(course_dir(), d)) and d.startswith('Unit')]
     unit_dirs.sort(key=lambda x: int(re.search(r'Unit (\d+)', x).group(1)))
     
     conn.close()
@@ -351,169 +435,103 @@ def index():
                           grouped_problems=filtered_grouped_problems,
                           show_uncategorized=show_uncategorized,
                           unit_filter=unit_filter,
+                          url_filters=current_app.config['URL_FILTERS'],
+                          filter_query=urlencode(index_filter_params(show_uncategorized, unit_filter)),
+                          index_url=index_url,
                           unit_dirs=unit_dirs)
 
-@app.route('/images/<path:filename>')
-def serve_image(filename):
-    """Serve images from any unit folder."""
-    # Find the file in any unit directory
-    for unit_dir in os.listdir('AP_Statistics_Course'):
-        if not os.path.isdir(os.path.join('AP_Statistics_Course', unit_dir)) or not unit_dir.startswith('Unit'):
+# Function to find the folder holding a problem image
+def find_image_directory(filename):
+    """Return the unit folder or subfolder containing filename, or None."""
+    base_path = course_dir()
+    for unit_dir in os.listdir(base_path):
+        if not os.path.isdir(os.path.join(base_path, unit_dir)) or not unit_dir.startswith('Unit'):
             continue
             
-        unit_path = os.path.join('AP_Statistics_Course', unit_dir)
+        unit_path = os.path.join(base_path, unit_dir)
         
         # Check if file exists directly in the unit folder
-        full_path = os.path.join(unit_path, filename)
-        if os.path.exists(full_path):
-            return send_from_directory(unit_path, filename)
+        if os.path.exists(os.path.join(unit_path, filename)):
+            return unit_path
             
         # Check subdirectories
         for subdir, _, _ in os.walk(unit_path):
             if subdir != unit_path:  # Skip the main unit directory (already checked)
                 if os.path.exists(os.path.join(subdir, filename)):
-                    return send_from_directory(subdir, filename)
+                    return subdir
+    
+    return None
+
+@route('/images/<path:filename>')
+def serve_image(filename):
+    """Serve images from any unit folder."""
+    # Find the file in any unit directory
+    with timed_scan('image_lookup'):
+        image_dir = find_image_directory(filename)
+    
+    # send_from_directory resolves relative folders against the app's root
+    # path, so use absolute ones in case the app runs from another directory
+    if image_dir:
+        return send_from_directory(os.path.abspath(image_dir), filename)
     
     # If not found, default to Unit 1 for backward compatibility
-    unit1_path = os.path.join('AP_Statistics_Course', 'Unit 1- Exploring One-Variable Data')
-    return send_from_directory(unit1_path, filename)
+    unit1_path = os.path.join(course_dir(), 'Unit 1- Exploring One-Variable Data')
+    return send_from_directory(os.path.abspath(unit1_path), filename)
 
-@app.route('/problem/<path:filename>')
+@route('/problem/<path:filename>')
 def problem_detail(filename):
     """Show details for a specific problem, including related topics."""
-    # Find the problem image in any unit directory
-    file_path = None
-    
-    for unit_dir in os.listdir('AP_Statistics_Course'):
-        if not os.path.isdir(os.path.join('AP_Statistics_Course', unit_dir)) or not unit_dir.startswith('Unit'):
-            continue
-            
-        unit_path = os.path.join('AP_Statistics_Course', unit_dir)
-        
-        # Check if file exists directly in the unit folder
-        full_path = os.path.join(unit_path, filename)
-        if os.path.exists(full_path):
-            file_path = full_path
-            break
-            
-        # Check subdirectories
-        for subdir, _, _ in os.walk(unit_path):
-            if subdir != unit_path:  # Skip the main unit directory (already checked)
-                full_path = os.path.join(subdir, filename)
-                if os.path.exists(full_path):
-                    file_path = full_path
-                    break
-        
-        if file_path:
-            break
-    
-    if not file_path:
+    # One query for the problem, its topics and its group parts; problems are
+    # created by the catalog sync, so this page only reads
+    conn = get_db_connection()
+    detail = get_problem_detail(conn, filename)
+
+    if not detail or not detail['problem']['image_path']:
+        # An image added since the last sync is registered on its first visit
+        with timed_scan('image_lookup'):
+            image_dir = find_image_directory(filename)
+        if image_dir:
+            images_dir = course_dir()
+            db_writer.write(lambda db: sync_catalog(db, images_dir, commit=False), conn)
+            detail = get_problem_detail(conn, filename)
+
+    if not detail or not detail['problem']['image_path']:
+        conn.close()
         flash('Problem image not found!')
         return redirect(url_for('index'))
     
-    # Check if this problem exists in the database
-    conn = get_db_connection()
-    problem = conn.execute('SELECT * FROM problems WHERE problem_number = ?', (filename,)).fetchone()
-    
-    # If not in database, create a new entry
-    if not problem:
-        # Extract problem info from filename
-        year_match = re.search(r'(\d{4})', filename)
-        year = year_match.group(1) if year_match else None
-        
-        conn.execute('''
-            INSERT INTO problems (problem_number, description, source, year)
-            VALUES (?, ?, ?, ?)
-        ''', (filename, f"Problem from {year} AP Statistics Exam", "AP Statistics Exam", year))
-        
-        conn.commit()
-        problem = conn.execute('SELECT * FROM problems WHERE problem_number = ?', (filename,)).fetchone()
-    
-    # Get topics related to this problem
-    topics = conn.execute('''
-        SELECT t.*, u.unit_number, u.unit_name, pt.relevance_score, pt.notes
-        FROM topics t
-        JOIN units u ON t.unit_id = u.unit_id
-        JOIN problem_topics pt ON t.topic_id = pt.topic_id
-        WHERE pt.problem_id = ?
-        ORDER BY u.unit_number, t.topic_number
-    ''', (problem['problem_id'],)).fetchall()
-    
-    # Get all topics for adding new relationships
-    all_topics = conn.execute('''
-        SELECT t.*, u.unit_number, u.unit_name
-        FROM topics t
-        JOIN units u ON t.unit_id = u.unit_id
-        ORDER BY u.unit_number, t.topic_number
-    ''').fetchall()
+    course_tree = get_course_tree(conn, database_path(), detail['structure_version'])
+    conn.close()
     
-    # Check if this is part of an FRQ group
-    is_frq = 'FRQ' in filename or 'Frq' in filename
-    group_id = None
-    group_parts = []
+    problem = detail['problem']
+    group_id = problem['group_id']
+    is_frq = group_id is not None
     
-    if is_frq:
-        # Extract year and FRQ number to form group_id
-        year_match = re.search(r'(\d{4})', filename)
-        num_match = re.search(r'(?:FRQ|Frq)(\d+)', filename)
-        
-        if year_match and num_match:
-            year = year_match.group(1)
-            frq_num = num_match.group(1)
-            group_id = f"{year}_FRQ_{frq_num}"
-            
-            # Find all parts of this FRQ
-            part_pattern = f"{year}.*(?:FRQ|Frq){frq_num}"
-            group_parts = conn.execute('''
-                SELECT * FROM problems 
-                WHERE problem_number LIKE ? AND problem_number != ?
-                ORDER BY problem_number
-            ''', (f"%{part_pattern}%", filename)).fetchall()
-    
-    # Use stored values if available
+    # Use stored values if available, otherwise what the file name says
+    parsed = parse_problem_filename(filename)
     year = problem['year'] or "Unknown"
-    
-    # Use stored problem_type if available
-    if 'problem_type' in problem.keys() and problem['problem_type']:
-        problem_type = problem['problem_type']
-    elif 'MCQ' in filename:
-        problem_type = 'Multiple Choice'
-    elif 'FRQ' in filename or 'Frq' in filename:
-        problem_type = 'Free Response'
-    else:
-        problem_type = 'Unknown'
-    
-    # Use stored problem_num if available
-    if 'problem_num' in problem.keys() and problem['problem_num']:
-        problem_num = problem['problem_num']
-    else:
-        num_match = re.search(r'(?:MCQ|FRQ|Frq)(\d+)', filename)
-        problem_num = num_match.group(1) if num_match else ""
-    
-    # Extract part number for FRQs
-    part_match = re.search(r'(?:FRQ|Frq)(\d+)-(\d+)', filename)
-    part_num = part_match.group(2) if part_match else ""
+    problem_type = problem['problem_type'] or parsed['problem_type'] or 'Unknown'
+    problem_num = problem['problem_num'] or parsed['problem_num'] or ""
+    part_num = str(problem['part_num']) if problem['part_num'] is not None else ""
     
     # Create display name using stored values
-    display_name = f"{year} {problem_type} #{problem_num}" + (f" (Part {part_num})" if part_match else "")
-    
-    conn.close()
+    display_name = f"{year} {problem_type} #{problem_num}" + (f" (Part {part_num})" if part_num else "")
     
     return render_template('problem.html', 
                           problem=problem, 
-                          topics=topics, 
-                          all_topics=all_topics,
+                          topics=course_tree.linked_topics(detail['topic_links']), 
+                          all_topics=course_tree.topics,
                           filename=filename,
                           display_name=display_name,
                           is_frq=is_frq,
                           group_id=group_id,
-                          group_parts=group_parts,
+                          group_parts=detail['group_parts'],
                           year=year,
                           problem_type=problem_type,
                           problem_num=problem_num,
                           part_num=part_num)
 
-@app.route('/update_problem_metadata', methods=['POST'])
+@route('/update_problem_metadata', methods=['POST'])
 def update_problem_metadata():
     """Update problem metadata (year, type, number, etc.)."""
     problem_id = request.form['problem_id']
@@ -526,22 +544,9 @@ def update_problem_metadata():
     if difficulty == '':
         difficulty = None
     
+    started = time.perf_counter()
     conn = get_db_connection()
     
-    # Check if the problem_type and problem_num columns exist
-    cursor = conn.cursor()
-    cursor.execute("PRAGMA table_info(problems)")
-    columns = [column[1] for column in cursor.fetchall()]
-    
-    # Add the columns if they don't exist
-    if 'problem_type' not in columns:
-        cursor.execute("ALTER TABLE problems ADD COLUMN problem_type TEXT")
-    
-    if 'problem_num' not in columns:
-        cursor.execute("ALTER TABLE problems ADD COLUMN problem_num TEXT")
-    
-    conn.commit()
-    
     # Get the problem
     problem = conn.execute('SELECT * FROM problems WHERE problem_id = ?', (problem_id,)).fetchone()
     
@@ -549,46 +554,40 @@ def update_problem_metadata():
         flash('Problem not found!')
         return redirect(url_for('index'))
     
-    # Update the problem metadata
-    conn.execute('''
-        UPDATE problems 
-        SET year = ?, description = ?, difficulty = ?, source = ?, problem_type = ?, problem_num = ?
-        WHERE problem_id = ?
-    ''', (year, description, difficulty, f"Problem from {year} AP Statistics {problem_type}", problem_type, problem_num, problem_id))
-    
-    conn.commit()
-    
     # If this is part of an FRQ group, update all parts with the same year and type
+    part_ids = []
     if 'FRQ' in problem['problem_number'] or 'Frq' in problem['problem_number']:
-        # Extract FRQ number
-        num_match = re.search(r'(?:FRQ|Frq)(\d+)', problem['problem_number'])
+        part_ids = [part['problem_id'] for part in find_frq_parts(conn, problem['problem_number'])
+                    if part['problem_id'] != problem['problem_id']]
+    
+    def save(db):
+        # Update the problem metadata
+        db.execute('''
+            UPDATE problems 
+            SET year = ?, description = ?, difficulty = ?, source = ?, problem_type = ?, problem_num = ?
+            WHERE problem_id = ?
+        ''', (year, description, difficulty, f"Problem from {year} AP Statistics {problem_type}", problem_type, problem_num, problem_id))
         
-        if num_match:
-            frq_num = num_match.group(1)
-            
-            # Find all parts of this FRQ
-            part_pattern = f"%(?:FRQ|Frq){frq_num}%"
-            group_parts = conn.execute('''
-                SELECT * FROM problems 
-                WHERE problem_number LIKE ? AND problem_id != ?
-            ''', (part_pattern, problem_id)).fetchall()
-            
-            # Update year and type for all parts
-            for part in group_parts:
-                conn.execute('''
-                    UPDATE problems 
-                    SET year = ?, source = ?, problem_type = ?, problem_num = ?
-                    WHERE problem_id = ?
-                ''', (year, f"Problem from {year} AP Statistics {problem_type}", problem_type, problem_num, part['problem_id']))
-            
-            conn.commit()
-    
+        # Update year and type for all parts at once
+        if part_ids:
+            placeholders = ', '.join('?' * len(part_ids))
+            db.execute(f'''
+                UPDATE problems 
+                SET year = ?, source = ?, problem_type = ?, problem_num = ?
+                WHERE problem_id IN ({placeholders})
+            ''', (year, f"Problem from {year} AP Statistics {problem_type}", problem_type, problem_num, *part_ids))
+    
+    db_writer.write(save, conn)
+    
+    record_operation('update_problem_metadata', {'parts_updated': len(part_ids)},
+                     {'problem': problem['problem_number'], 'year': year, 'problem_type': problem_type,
+                      'problem_num': problem_num, 'part_ids': part_ids}, started)
     flash('Problem metadata updated successfully!')
     conn.close()
     
     return redirect(url_for('problem_detail', filename=problem['problem_number']))
 
-@app.route('/add_problem_topic', methods=['POST'])
+@route('/add_problem_topic', methods=['POST'])
 def add_problem_topic():
     """Add a topic relationship to an existing problem."""
     problem_id = request.form['problem_id']
@@ -597,6 +596,7 @@ def add_problem_topic():
     notes = request.form.get('notes', '')
     apply_to_group = request.form.get('apply_to_group') == 'on'
     
+    started = time.perf_counter()
     conn = get_db_connection()
     
     # Get the problem to check if it's part of a group
@@ -609,66 +609,45 @@ def add_problem_topic():
     # Check if this is part of an FRQ group
     group_parts = []
     if apply_to_group and ('FRQ' in problem['problem_number'] or 'Frq' in problem['problem_number']):
-        # Extract year and FRQ number
-        year_match = re.search(r'(\d{4})', problem['problem_number'])
+        # Get ALL parts including the current one
+        group_parts = find_frq_parts(conn, problem['problem_number'])
         num_match = re.search(r'(?:FRQ|Frq)(\d+)', problem['problem_number'])
-        
-        if year_match and num_match:
-            year = year_match.group(1)
-            frq_num = num_match.group(1)
-            
-            # Find all parts of this FRQ
-            part_pattern = f"{year}.*(?:FRQ|Frq){frq_num}"
-            
-            # Log the pattern for debugging
-            print(f"Searching for FRQ parts with pattern: {part_pattern}")
-            
-            # Get ALL parts including the current one
-            group_parts = conn.execute('''
-                SELECT * FROM problems 
-                WHERE problem_number LIKE ?
-                ORDER BY problem_number
-            ''', (f"%{part_pattern}%",)).fetchall()
-            
-            # Log the number of parts found for debugging
-            print(f"Found {len(group_parts)} parts for FRQ #{frq_num}")
     
-    # If applying to a group, add the topic to all parts
+    # If applying to a group, add the topic to all parts that don't have it yet
     if apply_to_group and group_parts:
-        for part in group_parts:
-            # Check if relationship already exists
-            existing = conn.execute('''
-                SELECT * FROM problem_topics 
-                WHERE problem_id = ? AND topic_id = ?
-            ''', (part['problem_id'], topic_id)).fetchone()
-            
-            if not existing:
-                conn.execute('''
-                    INSERT INTO problem_topics (problem_id, topic_id, relevance_score, notes)
-                    VALUES (?, ?, ?, ?)
-                ''', (part['problem_id'], topic_id, relevance_score, notes))
-                print(f"Added topic to part {part['problem_number']}")
+        part_ids = [part['problem_id'] for part in group_parts]
+        placeholders = ', '.join('?' * len(part_ids))
+        added = db_writer.write(lambda db: db.execute(f'''
+            INSERT INTO problem_topics (problem_id, topic_id, relevance_score, notes)
+            SELECT p.problem_id, ?, ?, ?
+            FROM problems p
+            WHERE p.problem_id IN ({placeholders})
+              AND NOT EXISTS (
+                  SELECT 1 FROM problem_topics pt
+                  WHERE pt.problem_id = p.problem_id AND pt.topic_id = ?
+              )
+        ''', (topic_id, relevance_score, notes, *part_ids, topic_id)).rowcount, conn)
         
-        conn.commit()
         flash(f'Topic added to all parts of FRQ #{num_match.group(1)} successfully!')
     else:
-        # Check if relationship already exists
-        existing = conn.execute('''
-            SELECT * FROM problem_topics 
-            WHERE problem_id = ? AND topic_id = ?
-        ''', (problem_id, topic_id)).fetchone()
+        # Insert unless the relationship already exists
+        added = db_writer.write(lambda db: db.execute('''
+            INSERT INTO problem_topics (problem_id, topic_id, relevance_score, notes)
+            SELECT ?, ?, ?, ?
+            WHERE NOT EXISTS (
+                SELECT 1 FROM problem_topics
+                WHERE problem_id = ? AND topic_id = ?
+            )
+        ''', (problem_id, topic_id, relevance_score, notes, problem_id, topic_id)).rowcount, conn)
         
-        if existing:
+        if not added:
             flash('This topic is already linked to the problem!')
         else:
-            conn.execute('''
-                INSERT INTO problem_topics (problem_id, topic_id, relevance_score, notes)
-                VALUES (?, ?, ?, ?)
-            ''', (problem_id, topic_id, relevance_score, notes))
-            
-            conn.commit()
             flash('Topic added to problem successfully!')
     
+    record_operation('add_problem_topic', {'parts': len(group_parts) or 1, 'added': added},
+                     {'problem': problem['problem_number'], 'topic_id': topic_id,
+                      'parts': [part['problem_number'] for part in group_parts]}, started)
     conn.close()
     
     # Clear any cached data in the session that might affect display
@@ -677,20 +656,14 @@ def add_problem_topic():
     
     return redirect(url_for('problem_detail', filename=problem['problem_number'], _=time.time()))
 
-@app.route('/reapply_topics', methods=['POST'])
+@route('/reapply_topics', methods=['POST'])
 def reapply_topics():
     """Reapply all topics from one part to all parts of an FRQ."""
     problem_id = request.form['problem_id']
     
-    # Add debug info to flash messages so we can see it in the UI
+    started = time.perf_counter()
     conn = get_db_connection()
     
-    # Check the structure of the problem_topics table
-    cursor = conn.cursor()
-    cursor.execute("PRAGMA table_info(problem_topics)")
-    columns = [column[1] for column in cursor.fetchall()]
-    flash(f"problem_topics columns: {columns}")
-    
     # Get the problem to check if it's part of a group
     problem = conn.execute('SELECT * FROM problems WHERE problem_id = ?', (problem_id,)).fetchone()
     
@@ -700,106 +673,43 @@ def reapply_topics():
     
     # Check if this is part of an FRQ group
     if 'FRQ' in problem['problem_number'] or 'Frq' in problem['problem_number']:
-        # Extract year and FRQ number
-        year_match = re.search(r'(\d{4})', problem['problem_number'])
-        num_match = re.search(r'(?:FRQ|Frq)(\d+)', problem['problem_number'])
+        all_parts = find_frq_parts(conn, problem['problem_number'])
         
-        if year_match and num_match:
-            year = year_match.group(1)
-            frq_num = num_match.group(1)
-            
-            # Show the current problem details
-            flash(f"Current problem: {problem['problem_number']} (ID: {problem['problem_id']})")
-            
-            # Try a different approach - extract the FRQ number and find all problems with the same FRQ number
-            # This is more reliable than pattern matching
-            all_problems = conn.execute('SELECT * FROM problems').fetchall()
-            all_parts = []
-            
-            for p in all_problems:
-                if 'FRQ' in p['problem_number'] or 'Frq' in p['problem_number']:
-                    p_year_match = re.search(r'(\d{4})', p['problem_number'])
-                    p_num_match = re.search(r'(?:FRQ|Frq)(\d+)', p['problem_number'])
-                    
-                    if p_year_match and p_num_match:
-                        p_year = p_year_match.group(1)
-                        p_frq_num = p_num_match.group(1)
-                        
-                        if p_year == year and p_frq_num == frq_num:
-                            all_parts.append(p)
+        if all_parts:
+            frq_num = re.search(r'(?:FRQ|Frq)(\d+)', problem['problem_number']).group(1)
             
-            # Debug log
-            part_numbers = [p['problem_number'] for p in all_parts]
-            debug_msg = f"Found {len(all_parts)} total parts for FRQ #{frq_num}: {part_numbers}"
-            print(debug_msg)
-            flash(debug_msg)
-            
-            # Get all topics for the current part - just get the raw topic_id, relevance_score, and notes
+            # Get all topics for the current part
             topics = conn.execute('''
-                SELECT * FROM problem_topics 
+                SELECT topic_id, relevance_score, notes FROM problem_topics 
                 WHERE problem_id = ?
-            ''', (problem_id,)).fetchall()
-            
-            # Convert SQLite Row objects to dictionaries
-            topics_dict = []
-            for topic in topics:
-                topic_dict = {}
-                for key in topic.keys():
-                    topic_dict[key] = topic[key]
-                topics_dict.append(topic_dict)
-            
-            # Debug log
-            topic_ids = [t['topic_id'] for t in topics_dict]
-            debug_msg = f"Found {len(topics_dict)} topics to apply: {topic_ids}"
-            print(debug_msg)
-            flash(debug_msg)
-            
-            # Show the first topic's structure if available
-            if topics_dict:
-                flash(f"First topic structure: {topics_dict[0]}")
+            ''', (problem['problem_id'],)).fetchall()
             
-            # Apply each topic to all parts
+            # Copy every topic of the current part to the other parts in one
+            # statement, skipping the pairs that already exist
+            other_ids = [p['problem_id'] for p in all_parts if p['problem_id'] != problem['problem_id']]
             topics_applied = 0
-            topics_skipped = 0
-            
-            # For each part (except the current one)
-            for part in all_parts:
-                if part['problem_id'] == problem_id:
-                    flash(f"Skipping current part {part['problem_number']} (ID: {part['problem_id']})")
-                    continue
-                
-                flash(f"Checking part {part['problem_number']} (ID: {part['problem_id']})")
-                
-                # For each topic to apply
-                for topic in topics_dict:
-                    # Check if relationship already exists
-                    existing = conn.execute('''
-                        SELECT * FROM problem_topics 
-                        WHERE problem_id = ? AND topic_id = ?
-                    ''', (part['problem_id'], topic['topic_id'])).fetchone()
-                    
-                    if existing:
-                        topics_skipped += 1
-                        flash(f"Topic {topic['topic_id']} already exists for part {part['problem_number']} - skipping")
-                    else:
-                        try:
-                            # Use direct values from the dictionary
-                            conn.execute('''
-                                INSERT INTO problem_topics (problem_id, topic_id, relevance_score, notes)
-                                VALUES (?, ?, ?, ?)
-                            ''', (
-                                part['problem_id'], 
-                                topic['topic_id'], 
-                                topic['relevance_score'],
-                                topic['notes']
-                            ))
-                            topics_applied += 1
-                            flash(f"Added topic {topic['topic_id']} to part {part['problem_number']}")
-                        except Exception as e:
-                            flash(f"Error adding topic: {str(e)}")
+            if other_ids and topics:
+                placeholders = ', '.join('?' * len(other_ids))
+                topics_applied = db_writer.write(lambda db: db.execute(f'''
+                    INSERT INTO problem_topics (problem_id, topic_id, relevance_score, notes)
+                    SELECT p.problem_id, src.topic_id, src.relevance_score, src.notes
+                    FROM problems p
+                    JOIN problem_topics src ON src.problem_id = ?
+                    WHERE p.problem_id IN ({placeholders})
+                      AND NOT EXISTS (
+                          SELECT 1 FROM problem_topics pt
+                          WHERE pt.problem_id = p.problem_id AND pt.topic_id = src.topic_id
+                      )
+                ''', (problem['problem_id'], *other_ids)).rowcount, conn)
+            topics_skipped = len(other_ids) * len(topics) - topics_applied
             
-            conn.commit()
-            flash(f'Topics reapplied to all parts of FRQ #{frq_num} successfully! ({topics_applied} topic assignments added, {topics_skipped} skipped)')
+            record_operation('reapply_topics',
+                             {'parts': len(other_ids), 'topics': len(topics),
+                              'added': topics_applied, 'skipped': topics_skipped},
+                             {'problem': problem['problem_number'],
+                              'parts': [p['problem_number'] for p in all_parts],
+                              'topics': [dict(topic) for topic in topics]}, started)
+            flash(f'Topics reapplied to all parts of FRQ #{frq_num}: {topics_applied} added, {topics_skipped} already linked.')
     else:
         flash('This is not part of an FRQ group!')
     
@@ -811,13 +721,14 @@ def reapply_topics():
     
     return redirect(url_for('problem_detail', filename=problem['problem_number'], _=time.time()))
 
-@app.route('/remove_problem_topic', methods=['POST'])
+@route('/remove_problem_topic', methods=['POST'])
 def remove_problem_topic():
     """Remove a topic relationship from a problem."""
     problem_id = request.form['problem_id']
     topic_id = request.form['topic_id']
     remove_from_group = request.form.get('remove_from_group') == 'on'
     
+    started = time.perf_counter()
     conn = get_db_connection()
     
     # Get the problem to check if it's part of a group
@@ -830,66 +741,31 @@ def remove_problem_topic():
     # Check if this is part of an FRQ group
     group_parts = []
     if remove_from_group and ('FRQ' in problem['problem_number'] or 'Frq' in problem['problem_number']):
-        # Extract year and FRQ number
-        year_match = re.search(r'(\d{4})', problem['problem_number'])
+        group_parts = find_frq_parts(conn, problem['problem_number'])
         num_match = re.search(r'(?:FRQ|Frq)(\d+)', problem['problem_number'])
-        
-        if year_match and num_match:
-            year = year_match.group(1)
-            frq_num = num_match.group(1)
-            
-            # Find all parts of this FRQ using the same approach as in reapply_topics
-            all_problems = conn.execute('SELECT * FROM problems').fetchall()
-            group_parts = []
-            
-            for p in all_problems:
-                if 'FRQ' in p['problem_number'] or 'Frq' in p['problem_number']:
-                    p_year_match = re.search(r'(\d{4})', p['problem_number'])
-                    p_num_match = re.search(r'(?:FRQ|Frq)(\d+)', p['problem_number'])
-                    
-                    if p_year_match and p_num_match:
-                        p_year = p_year_match.group(1)
-                        p_frq_num = p_num_match.group(1)
-                        
-                        if p_year == year and p_frq_num == frq_num:
-                            group_parts.append(p)
-            
-            # Debug log
-            part_numbers = [p['problem_number'] for p in group_parts]
-            debug_msg = f"Found {len(group_parts)} total parts for FRQ #{frq_num}: {part_numbers}"
-            print(debug_msg)
-            flash(debug_msg)
     
     # If removing from a group, remove the topic from all parts
+    part_ids = [part['problem_id'] for part in group_parts]
     if remove_from_group and group_parts:
-        topics_removed = 0
-        for part in group_parts:
-            # Check if the relationship exists before trying to delete
-            existing = conn.execute('''
-                SELECT * FROM problem_topics 
-                WHERE problem_id = ? AND topic_id = ?
-            ''', (part['problem_id'], topic_id)).fetchone()
-            
-            if existing:
-                conn.execute('''
-                    DELETE FROM problem_topics 
-                    WHERE problem_id = ? AND topic_id = ?
-                ''', (part['problem_id'], topic_id))
-                topics_removed += 1
-                flash(f"Removed topic from part {part['problem_number']}")
+        placeholders = ', '.join('?' * len(part_ids))
+        topics_removed = db_writer.write(lambda db: db.execute(f'''
+            DELETE FROM problem_topics 
+            WHERE topic_id = ? AND problem_id IN ({placeholders})
+        ''', (topic_id, *part_ids)).rowcount, conn)
         
-        conn.commit()
-        flash(f'Topic removed from all parts of FRQ #{num_match.group(1)} successfully! ({topics_removed} topic relationships removed)')
+        flash(f'Topic removed from all parts of FRQ #{num_match.group(1)} ({topics_removed} links removed).')
     else:
         # Just remove from the current problem
-        conn.execute('''
+        topics_removed = db_writer.write(lambda db: db.execute('''
             DELETE FROM problem_topics 
             WHERE problem_id = ? AND topic_id = ?
-        ''', (problem_id, topic_id))
+        ''', (problem_id, topic_id)).rowcount, conn)
         
-        conn.commit()
         flash('Topic removed from problem successfully!')
     
+    record_operation('remove_problem_topic', {'parts': len(part_ids) or 1, 'removed': topics_removed},
+                     {'problem': problem['problem_number'], 'topic_id': topic_id,
+                      'parts': [part['problem_number'] for part in group_parts]}, started)
     conn.close()
     
     # Clear any cached data in the session that might affect display
@@ -898,43 +774,129 @@ def remove_problem_topic():
     
     return redirect(url_for('problem_detail', filename=problem['problem_number']))
 
-@app.route('/topics')
+@route('/group/<group_id>')
+def group_detail(group_id):
+    """Show every part of an FRQ group with the topics of each, for tagging them together."""
+    # One query for all parts and their topics
+    conn = get_db_connection()
+    detail = get_group_detail(conn, group_id)
+
+    if not detail:
+        conn.close()
+        flash('FRQ group not found!')
+        return redirect(url_for('index'))
+
+    course_tree = get_course_tree(conn, database_path(), detail['structure_version'])
+    conn.close()
+
+    parts = detail['parts']
+    for part in parts:
+        part['topics'] = course_tree.linked_topics(part['topic_links'])
+
+    # Union of the parts' topics in course order, with each part's relevance score
+    coverage = {}
+    for part in parts:
+        for topic in part['topics']:
+            coverage.setdefault(topic.topic_id, {})[part['problem_id']] = topic.relevance_score
+    topics = [{'topic': topic,
+               'parts': coverage[topic.topic_id],
+               'on_all_parts': len(coverage[topic.topic_id]) == len(parts)}
+              for topic in course_tree.topics if topic.topic_id in coverage]
+
+    # Use stored values if available, otherwise what the file name says
+    first = parts[0]
+    parsed = parse_problem_filename(first['problem_number'])
+    year = first['year'] or parsed['year'] or "Unknown"
+    problem_type = first['problem_type'] or parsed['problem_type'] or 'Free Response'
+    problem_num = first['problem_num'] or parsed['problem_num'] or ""
+
+    return render_template('group.html',
+                          group_id=group_id,
+                          display_name=f"{year} {problem_type} #{problem_num}",
+                          parts=parts,
+                          topics=topics,
+                          all_topics=course_tree.topics)
+
+@route('/group/<group_id>/add_topic', methods=['POST'])
+def add_group_topic(group_id):
+    """Add a topic to the selected parts of an FRQ group (every part if none is selected)."""
+    topic_id = request.form['topic_id']
+    relevance_score = request.form.get('relevance_score', 5)
+    notes = request.form.get('notes', '')
+    part_ids = request.form.getlist('problem_id')
+
+    started = time.perf_counter()
+    conn = get_db_connection()
+
+    # One statement for the whole group, skipping the parts that already have the topic
+    part_filter = f"AND p.problem_id IN ({', '.join('?' * len(part_ids))})" if part_ids else ''
+    added = db_writer.write(lambda db: db.execute(f'''
+        INSERT INTO problem_topics (problem_id, topic_id, relevance_score, notes)
+        SELECT p.problem_id, ?, ?, ?
+        FROM problems p
+        WHERE p.group_id = ? {part_filter}
+          AND NOT EXISTS (
+              SELECT 1 FROM problem_topics pt
+              WHERE pt.problem_id = p.problem_id AND pt.topic_id = ?
+          )
+    ''', (topic_id, relevance_score, notes, group_id, *part_ids, topic_id)).rowcount, conn)
+
+    record_operation('add_group_topic', {'parts': len(part_ids), 'added': added},
+                     {'group_id': group_id, 'topic_id': topic_id, 'part_ids': part_ids}, started)
+    conn.close()
+
+    if added:
+        flash(f'Topic added to {added} part(s) of this FRQ.')
+    else:
+        flash('This topic is already linked to the selected parts!')
+
+    return redirect(url_for('group_detail', group_id=group_id))
+
+@route('/group/<group_id>/remove_topic', methods=['POST'])
+def remove_group_topic(group_id):
+    """Remove a topic from one part of an FRQ group, or from every part if no part is given."""
+    topic_id = request.form['topic_id']
+    part_id = request.form.get('problem_id')
+
+    started = time.perf_counter()
+    conn = get_db_connection()
+
+    part_filter = 'AND problem_id = ?' if part_id else ''
+    removed = db_writer.write(lambda db: db.execute(f'''
+        DELETE FROM problem_topics
+        WHERE topic_id = ?
+          AND problem_id IN (SELECT problem_id FROM problems WHERE group_id = ? {part_filter})
+    ''', (topic_id, group_id, *([part_id] if part_id else []))).rowcount, conn)
+
+    record_operation('remove_group_topic', {'removed': removed},
+                     {'group_id': group_id, 'topic_id': topic_id, 'part_id': part_id}, started)
+    conn.close()
+
+    flash(f'Topic removed from {removed} part(s) of this FRQ.')
+    return redirect(url_for('group_detail', group_id=group_id))
+
+@route('/topics')
 def topics():
     """Page showing all topics in the knowledge tree."""
     conn = get_db_connection()
-    
-    # Get all units
-    units = conn.execute('SELECT * FROM units ORDER BY unit_number').fetchall()
-    
-    # Get topics for each unit
-    units_with_topics = []
-    for unit in units:
-        topics = conn.execute(
-            'SELECT * FROM topics WHERE unit_id = ? ORDER BY topic_number', 
-            (unit['unit_id'],)
-        ).fetchall()
-        units_with_topics.append({
-            'unit': unit,
-            'topics': topics
-        })
-    
+    course_tree = get_course_tree(conn, database_path())
     conn.close()
-    return render_template('topics.html', units_with_topics=units_with_topics)
+    return render_template('topics.html', units=course_tree.units)
 
-@app.route('/topic/<topic_id>')
+@route('/topic/<topic_id>')
 def topic_detail(topic_id):
     """Show details for a specific topic, including related problems."""
     conn = get_db_connection()
     
-    # Get topic details
-    topic = conn.execute('SELECT * FROM topics WHERE topic_id = ?', (topic_id,)).fetchone()
+    # Get topic details and its unit from the course tree
+    topic = get_course_tree(conn, database_path()).topic(topic_id)
     
     if not topic:
+        conn.close()
         flash('Topic not found!')
         return redirect(url_for('topics'))
     
-    # Get unit information
-    unit = conn.execute('SELECT * FROM units WHERE unit_id = ?', (topic['unit_id'],)).fetchone()
+    unit = topic.unit
     
     # Get problems related to this topic
     problems = conn.execute('''
@@ -943,12 +905,12 @@ def topic_detail(topic_id):
         JOIN problem_topics pt ON p.problem_id = pt.problem_id
         WHERE pt.topic_id = ?
         ORDER BY p.year DESC, p.problem_number
-    ''', (topic_id,)).fetchall()
+    ''', (topic.topic_id,)).fetchall()
     
     conn.close()
     return render_template('topic.html', topic=topic, unit=unit, problems=problems)
 
-@app.route('/search', methods=['GET'])
+@route('/search', methods=['GET'])
 def search():
     """Search for problems or topics."""
     query = request.args.get('query', '')
@@ -965,13 +927,7 @@ def search():
     ''', (f'%{query}%', f'%{query}%')).fetchall()
     
     # Search topics
-    topics = conn.execute('''
-        SELECT t.*, u.unit_number, u.unit_name
-        FROM topics t
-        JOIN units u ON t.unit_id = u.unit_id
-        WHERE t.topic_number LIKE ? OR t.topic_name LIKE ?
-        ORDER BY u.unit_number, t.topic_number
-    ''', (f'%{query}%', f'%{query}%')).fetchall()
+    topics = get_course_tree(conn, database_path()).search_topics(query)
     
     conn.close()
     
@@ -980,738 +936,257 @@ def search():
                           problems=problems, 
                           topics=topics)
 
-@app.route('/api/knowledge_tree_data')
+@route('/api/knowledge_tree_data')
 def knowledge_tree_data():
     """API endpoint to provide knowledge tree data for 3D visualization."""
     conn = get_db_connection()
     
-    # Get all units
-    units = conn.execute('SELECT * FROM units ORDER BY unit_number').fetchall()
+    # Units and topics come from the course tree, problem links from one query
+    course_tree = get_course_tree(conn, database_path())
+    
+    problems_by_topic = {}
+    for problem in conn.execute('''
+        SELECT p.*, pt.topic_id, pt.relevance_score
+        FROM problems p
+        JOIN problem_topics pt ON p.problem_id = pt.problem_id
+        ORDER BY p.year DESC, p.problem_number
+    '''):
+        # Extract display name
+        if 'problem_type' in problem.keys() and problem['problem_type'] and 'problem_num' in problem.keys() and problem['problem_num']:
+            display_name = f"{problem['year']} {problem['problem_type']} #{problem['problem_num']}"
+        else:
+            display_name = problem['problem_number']
+        
+        problems_by_topic.setdefault(problem['topic_id'], []).append({
+            'problem_id': problem['problem_id'],
+            'filename': problem['problem_number'],
+            'display_name': display_name,
+            'relevance_score': problem['relevance_score']
+        })
     
     # Build the tree structure
     tree_data = {
         'units': []
     }
     
-    for unit in units:
+    for unit in course_tree.units:
         unit_data = {
-            'unit_id': unit['unit_id'],
-            'unit_number': unit['unit_number'],
-            'unit_name': unit['unit_name'],
+            'unit_id': unit.unit_id,
+            'unit_number': unit.unit_number,
+            'unit_name': unit.unit_name,
             'has_problems': False,  # Will be set to True if any topic has problems
             'topics': []
         }
         
-        # Get topics for this unit
-        topics = conn.execute(
-            'SELECT * FROM topics WHERE unit_id = ? ORDER BY topic_number', 
-            (unit['unit_id'],)
-        ).fetchall()
-        
-        for topic in topics:
-            # Check if this topic has any problems
-            problems_count = conn.execute('''
-                SELECT COUNT(*) as count
-                FROM problem_topics pt
-                JOIN problems p ON pt.problem_id = p.problem_id
-                WHERE pt.topic_id = ?
-            ''', (topic['topic_id'],)).fetchone()['count']
-            
-            has_problems = problems_count > 0
+        for topic in unit.topics:
+            problems = problems_by_topic.get(topic.topic_id, [])
+            has_problems = len(problems) > 0
             
             # If this topic has problems, mark the unit as having problems too
             if has_problems:
                 unit_data['has_problems'] = True
             
-            topic_data = {
-                'topic_id': topic['topic_id'],
-                'topic_number': topic['topic_number'],
-                'topic_name': topic['topic_name'],
+            unit_data['topics'].append({
+                'topic_id': topic.topic_id,
+                'topic_number': topic.topic_number,
+                'topic_name': topic.topic_name,
                 'has_problems': has_problems,
-                'problems': []
-            }
-            
-            # If this topic has problems, get them
-            if has_problems:
-                problems = conn.execute('''
-                    SELECT p.*, pt.relevance_score
-                    FROM problems p
-                    JOIN problem_topics pt ON p.problem_id = pt.problem_id
-                    WHERE pt.topic_id = ?
-                    ORDER BY p.year DESC, p.problem_number
-                ''', (topic['topic_id'],)).fetchall()
-                
-                for problem in problems:
-                    # Extract display name
-                    if 'problem_type' in problem.keys() and problem['problem_type'] and 'problem_num' in problem.keys() and problem['problem_num']:
-                        display_name = f"{problem['year']} {problem['problem_type']} #{problem['problem_num']}"
-                    else:
-                        display_name = problem['problem_number']
-                    
-                    problem_data = {
-                        'problem_id': problem['problem_id'],
-                        'filename': problem['problem_number'],
-                        'display_name': display_name,
-                        'relevance_score': problem['relevance_score']
-                    }
-                    
-                    topic_data['problems'].append(problem_data)
-            
-            unit_data['topics'].append(topic_data)
+                'problems': problems
+            })
         
         tree_data['units'].append(unit_data)
     
     conn.close()
     return jsonify(tree_data)
 
-@app.route('/knowledge_tree_3d')
+@route('/api/assignments', methods=['POST'])
+def assign_topics():
+    """API endpoint linking topics to many problems in one transaction (see assignments.py)."""
+    try:
+        items = parse_items(request.get_json(silent=True))
+    except AssignmentError as e:
+        return jsonify({'error': str(e)}), 400
+
+    started = time.perf_counter()
+    conn = get_db_connection()
+    try:
+        course_tree = get_course_tree(conn, database_path())
+        applied, results = db_writer.write(
+            lambda db: apply_assignments(db, items, course_tree.topics_by_number), conn)
+    finally:
+        conn.close()
+
+    counts = count_results(results)
+    if applied:
+        record_operation('assign_topics', counts, {'items': len(items)}, started)
+    return jsonify({'applied': applied, 'counts': counts, 'results': results}), 200 if applied else 422
+
+def run_bulk_metadata(text, format=None, apply=False):
+    """Plan (and apply) bulk metadata rows, logging an applied update."""
+    rows = read_rows(text, format)
+    started = time.perf_counter()
+    conn = get_db_connection()
+    try:
+        if apply:
+            plan = db_writer.write(lambda db: plan_and_apply(db, rows), conn)
+        else:
+            plan = update_metadata(conn, rows)
+    finally:
+        conn.close()
+    if plan['applied']:
+        record_operation('bulk_metadata', summarize(plan),
+                         {'rows': len(rows), 'problems': [entry['problem_number'] for entry in plan['diff']]},
+                         started)
+    return plan
+
+@route('/api/metadata', methods=['POST'])
+def bulk_metadata_api():
+    """API endpoint previewing, or with ?apply=1 applying, CSV or JSON metadata rows (see bulk_metadata.py)."""
+    uploaded = request.files.get('file')
+    text = uploaded.read().decode('utf-8-sig') if uploaded else request.get_data(as_text=True)
+    format = 'csv' if request.mimetype == 'text/csv' else 'json' if request.is_json else None
+    apply = request.args.get('apply') in ('1', 'true')
+    try:
+        plan = run_bulk_metadata(text, format, apply)
+    except MetadataError as e:
+        return jsonify({'error': str(e)}), 400
+
+    response = {'applied': plan['applied'], 'counts': summarize(plan),
+                'results': plan['results'], 'diff': plan['diff']}
+    return jsonify(response), 200 if plan['valid'] else 422
+
+@route('/metadata', methods=['GET', 'POST'])
+def bulk_metadata_page():
+    """Page for uploading a metadata CSV, previewing its changes and applying them."""
+    if request.method == 'GET':
+        return render_template('bulk_metadata.html', plan=None, data='')
+
+    uploaded = request.files.get('file')
+    data = uploaded.read().decode('utf-8-sig') if uploaded and uploaded.filename else request.form.get('data', '')
+    apply = request.form.get('apply') == '1'
+    try:
+        plan = run_bulk_metadata(data, apply=apply)
+    except MetadataError as e:
+        flash(str(e))
+        return redirect(url_for('bulk_metadata_page'))
+
+    if plan['applied']:
+        flash(f"Metadata updated for {len(plan['diff'])} problem(s).")
+        return redirect(url_for('bulk_metadata_page'))
+    return render_template('bulk_metadata.html', plan=plan, counts=summarize(plan), data=data)
+
+@route('/metadata/export.csv')
+def export_metadata_csv():
+    """The current metadata of every problem as a CSV to edit and upload again."""
+    out = io.StringIO()
+    conn = get_db_connection()
+    try:
+        export_metadata(conn, out)
+    finally:
+        conn.close()
+    return current_app.response_class(out.getvalue(), mimetype='text/csv',
+                                      headers={'Content-Disposition': 'attachment; filename=metadata.csv'})
+
+@route('/api/backups')
+def backup_status():
+    """API endpoint reporting online backup metrics and the backups on disk."""
+    backups = [{'path': path, 'size_bytes': os.path.getsize(path), 'created': os.path.getmtime(path)}
+               for path in list_backups(database_path(), current_app.extensions['jobs'].backup_dir)]
+    return jsonify({'metrics': get_backup_metrics(), 'backups': backups})
+
+@route('/knowledge_tree_3d')
 def knowledge_tree_3d():
     """Page showing the 3D visualization of the knowledge tree."""
     return render_template('knowledge_tree_3d.html')
 
-@app.route('/knowledge_tree_racer')
+@route('/knowledge_tree_racer')
 def knowledge_tree_racer():
     """Page showing the 3D racer game through the knowledge tree."""
     return render_template('knowledge_tree_racer.html')
 
+def warm_up(app):
+    """
+    Do the work the first requests after a start would otherwise do.
+
+    Every template is compiled (or loaded from the bytecode cache), the course
+    tree is loaded and the home page is rendered into the page cache. Run
+    before serving, and before forking workers, which then share the result.
+    Returns the time it took in seconds.
+    """
+    started = time.perf_counter()
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(name)
+
+    if os.path.exists(app.config['DATABASE']):
+        with app.test_request_context('/'):
+            conn = get_db_connection()
+            get_course_tree(conn, database_path())
+            conn.close()
+            index()
+    return time.perf_counter() - started
+
+def create_app(config=None):
+    """
+    Create the web app.
+
+    config (a dict) overrides the defaults: DATABASE and COURSE_DIR (also set
+    by APSTATS_DB and APSTATS_COURSE_DIR), TEMPLATE_CACHE_DIR for the compiled
+    templates (default instance/jinja_cache, None to keep them in memory only),
+    WARM_UP, URL_FILTERS (also set by APSTATS_URL_FILTERS=1) to keep the home
+    page filters only in the URL instead of the session, so the page can be
+    shared, EXPORT_DIR and BACKUP_DIR for the export and backup jobs (default
+    questions_export/ and backups/ next to the database), and the settings of
+    the modules set up here.
+    """
+    app = Flask(__name__)
+    app.config.update(
+        SECRET_KEY='apstats_secret_key',  # For flash messages and session
+        DATABASE=os.environ.get('APSTATS_DB', 'ap_stats.db'),
+        COURSE_DIR=os.environ.get('APSTATS_COURSE_DIR', DEFAULT_COURSE_DIR),
+        TEMPLATE_CACHE_DIR=os.path.join(app.instance_path, 'jinja_cache'),
+        WARM_UP=True,
+        URL_FILTERS=os.environ.get('APSTATS_URL_FILTERS', '') in ('1', 'true'),
+    )
+    app.config.update(config or {})
+    db_path = app.config['DATABASE']
+
+    # Compiled templates are kept on disk, so a new process does not compile them again
+    if app.config['TEMPLATE_CACHE_DIR']:
+        os.makedirs(app.config['TEMPLATE_CACHE_DIR'], exist_ok=True)
+        app.jinja_options = {**app.jinja_options,
+                             'bytecode_cache': FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR'])}
+
+    instrumentation.init_app(app)  # Per-request timing, SQL tracing and /debug/metrics
+    metrics.init_app(app, db_path)  # Prometheus metrics at /metrics
+    profiling.init_app(app)  # Opt-in request profiles at /debug/profiles
+    db_writer.init_app(app, db_path)  # Writes run in one transaction each, or batched by a writer thread if enabled
+    operation_log.init_app(app, db_path)  # Server-side log of write operations at /debug/operations
+    sessions.init_app(app, db_path)  # Session data in SQLite; the cookie only holds the session id
+    page_cache.init_app(app, db_path, app.config['COURSE_DIR'])  # Rendered pages shared by everyone, keyed by URL and data version
+
+    # Apply pending schema migrations once at startup instead of checking in every request,
+    # and register images added while the app was not running
+    if os.path.exists(db_path):
+        ensure_schema(db_path)
+        with app.app_context():
+            images_dir = app.config['COURSE_DIR']
+            db_writer.write(lambda db: sync_catalog(db, images_dir, commit=False))
+
+    jobs.init_app(app, db_path, app.config['COURSE_DIR'])  # Maintenance jobs run by a worker thread, at /jobs and /api/jobs
+
+    for rule, view, options in ROUTES:
+        app.add_url_rule(rule, view_func=view, **options)
+
+    if app.config['WARM_UP']:
+        warm_up(app)
+    return app
+
 if __name__ == '__main__':
-    # Create templates directory if it doesn't exist
-    if not os.path.exists('templates'):
-        os.makedirs('templates')
-    
-    # Create the necessary template files if they don't exist
-    template_files = {
-        'index.html': '''
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>AP Statistics Problems</title>
-            <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/bootstrap@5.2.3/dist/css/bootstrap.min.css">
-            <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/bootstrap-icons@1.8.1/font/bootstrap-icons.css">
-            <style>
-                .problem-card { margin-bottom: 15px; }
-                .problem-image { max-width: 100%; height: auto; }
-                .card-with-topics { border: 2px solid #28a745; }
-                .card-no-topics { border: 2px solid #dc3545; }
-                .topic-badge { position: absolute; top: 10px; right: 10px; }
-                .group-card { background-color: #f8f9fa; padding: 15px; margin-bottom: 20px; border-radius: 5px; }
-                .group-header { margin-bottom: 15px; border-bottom: 1px solid #dee2e6; padding-bottom: 10px; }
-                .group-parts { display: flex; flex-wrap: wrap; }
-                .part-card { flex: 0 0 calc(33.333% - 10px); margin: 5px; }
-            </style>
-        </head>
-        <body>
-            <div class="container mt-4">
-                <h1>AP Statistics Problems</h1>
-                
-                <div class="row mb-4">
-                    <div class="col">
-                        <a href="{{ url_for('topics') }}" class="btn btn-primary">View Knowledge Tree</a>
-                        <a href="{{ url_for('search') }}" class="btn btn-secondary">Search</a>
-                        <a href="{{ url_for('knowledge_tree_3d') }}" class="btn btn-success">
-                            <i class="bi bi-diagram-3"></i> View 3D Knowledge Tree
-                        </a>
-                    </div>
-                </div>
-                
-                <!-- Filter Controls -->
-                <div class="row mb-3">
-                    <div class="col">
-                        <!-- Unit Filter Dropdown -->
-                        <div class="dropdown d-inline-block me-2">
-                            <button class="btn btn-info dropdown-toggle" type="button" id="unitFilterDropdown" data-bs-toggle="dropdown" aria-expanded="false">
-                                <i class="bi bi-filter"></i> 
-                                {% if unit_filter %}
-                                Unit {{ unit_filter }} Filter
-                                {% else %}
-                                Filter by Unit
-                                {% endif %}
-                            </button>
-                            <ul class="dropdown-menu" aria-labelledby="unitFilterDropdown">
-                                <li><a class="dropdown-item {% if not unit_filter %}active{% endif %}" href="{{ url_for('index', show_uncategorized=show_uncategorized) }}">All Units</a></li>
-                                {% for unit_dir in unit_dirs %}
-                                {% set unit_num = unit_dir.split(' ')[1].split('-')[0] %}
-                                <li><a class="dropdown-item {% if unit_filter == unit_num %}active{% endif %}" href="{{ url_for('index', unit_filter=unit_num, show_uncategorized=show_uncategorized) }}">{{ unit_dir }}</a></li>
-                                {% endfor %}
-                            </ul>
-                        </div>
-                        
-                        <!-- Uncategorized Filter -->
-                        {% if show_uncategorized %}
-                        <a href="{{ url_for('index', unit_filter=unit_filter, show_uncategorized='false') }}" class="btn btn-danger">
-                            <i class="bi bi-funnel-fill"></i> Show All Problems
-                        </a>
-                        {% else %}
-                        <a href="{{ url_for('index', show_uncategorized='true', unit_filter=unit_filter) }}" class="btn btn-warning">
-                            <i class="bi bi-funnel"></i> Show Only Uncategorized
-                        </a>
-                        {% endif %}
-                    </div>
-                </div>
-                
-                <div class="row mb-3">
-                    <div class="col">
-                        <div class="alert alert-info">
-                            <strong>Legend:</strong>
-                            <span class="badge bg-success">YES</span> Problem has topics assigned
-                            <span class="badge bg-danger">NO</span> Problem has no topics assigned
-                            {% if show_uncategorized %}
-                            <br><strong>Filter:</strong> Showing only problems without topics assigned
-                            {% endif %}
-                            {% if unit_filter %}
-                            <br><strong>Unit Filter:</strong> Showing only Unit {{ unit_filter }} problems
-                            {% endif %}
-                        </div>
-                    </div>
-                </div>
-                
-                {% for flash_message in get_flashed_messages() %}
-                <div class="alert alert-info">{{ flash_message }}</div>
-                {% endfor %}
-                
-                {% for year in years %}
-                <h2>{{ year }} AP Statistics Exam</h2>
-                
-                <!-- Display grouped FRQ problems -->
-                {% if problems_by_year[year].groups %}
-                <h3>Free Response Questions</h3>
-                {% for group in problems_by_year[year].groups %}
-                <div class="group-card {% if group.has_topics %}card-with-topics{% else %}card-no-topics{% endif %}">
-                    <div class="group-header d-flex justify-content-between align-items-center">
-                        <h4>{{ group.display_name }}</h4>
-                        {% if group.has_topics %}
-                        <span class="badge bg-success">YES - {{ group.topic_count }} topic(s)</span>
-                        {% else %}
-                        <span class="badge bg-danger">NO TOPICS</span>
-                        {% endif %}
-                    </div>
-                    <div class="group-parts">
-                        {% for part in group.parts %}
-                        <div class="part-card">
-                            <div class="card">
-                                <a href="{{ url_for('problem_detail', filename=part.filename) }}">
-                                    <img src="{{ url_for('serve_image', filename=part.filename) }}" class="card-img-top problem-image" alt="{{ part.display_name }}">
-                                </a>
-                                <div class="card-body">
-                                    <h5 class="card-title">Part {{ part.part }}</h5>
-                                    <a href="{{ url_for('problem_detail', filename=part.filename) }}" class="btn btn-sm btn-primary">View Details</a>
-                                </div>
-                            </div>
-                        </div>
-                        {% endfor %}
-                    </div>
-                </div>
-                {% endfor %}
-                {% endif %}
-                
-                <!-- Display standalone problems (mostly MCQs) -->
-                {% if problems_by_year[year].standalone %}
-                <h3>Multiple Choice Questions</h3>
-                <div class="row">
-                    {% for problem in problems_by_year[year].standalone %}
-                    <div class="col-md-4">
-                        <div class="card problem-card position-relative {% if problem.has_topics %}card-with-topics{% else %}card-no-topics{% endif %}">
-                            {% if problem.has_topics %}
-                            <span class="badge bg-success topic-badge">YES - {{ problem.topic_count }} topic(s)</span>
-                            {% else %}
-                            <span class="badge bg-danger topic-badge">NO TOPICS</span>
-                            {% endif %}
-                            <a href="{{ url_for('problem_detail', filename=problem.filename) }}">
-                                <img src="{{ url_for('serve_image', filename=problem.filename) }}" class="card-img-top problem-image" alt="{{ problem.display_name }}">
-                            </a>
-                            <div class="card-body">
-                                <h5 class="card-title">{{ problem.display_name }}</h5>
-                                <a href="{{ url_for('problem_detail', filename=problem.filename) }}" class="btn btn-sm btn-primary">View Details</a>
-                            </div>
-                        </div>
-                    </div>
-                    {% endfor %}
-                </div>
-                {% endif %}
-                
-                {% endfor %}
-            </div>
-            
-            <!-- Bootstrap JS for dropdown functionality -->
-            <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.2.3/dist/js/bootstrap.bundle.min.js"></script>
-        </body>
-        </html>
-        ''',
-        
-        'problem.html': '''
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Problem: {{ display_name }}</title>
-            <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/bootstrap@5.2.3/dist/css/bootstrap.min.css">
-            <style>
-                .problem-image { max-width: 100%; height: auto; border: 1px solid #ddd; margin-bottom: 20px; }
-                .no-topics-alert { background-color: #f8d7da; border-color: #f5c6cb; color: #721c24; }
-                .group-part { border: 1px solid #ddd; margin-bottom: 10px; padding: 10px; border-radius: 5px; }
-                .group-part img { max-width: 100%; height: auto; }
-            </style>
-        </head>
-        <body>
-            <div class="container mt-4">
-                <nav aria-label="breadcrumb">
-                    <ol class="breadcrumb">
-                        <li class="breadcrumb-item"><a href="{{ url_for('index') }}">Home</a></li>
-                        <li class="breadcrumb-item active">{{ display_name }}</li>
-                    </ol>
-                </nav>
-                
-                {% for flash_message in get_flashed_messages() %}
-                <div class="alert alert-info">{{ flash_message }}</div>
-                {% endfor %}
-                
-                <h1>{{ display_name }}</h1>
-                
-                {% if is_frq and group_id %}
-                <div class="alert alert-info">
-                    <strong>Note:</strong> This is part of a Free Response Question group. Topic assignments can be applied to all parts of this FRQ.
-                    {% if topics %}
-                    <form method="post" action="{{ url_for('reapply_topics') }}" class="mt-2">
-                        <input type="hidden" name="problem_id" value="{{ problem.problem_id }}">
-                        <button type="submit" class="btn btn-warning">
-                            <i class="bi bi-arrow-repeat"></i> Reapply Topics to All Parts
-                        </button>
-                    </form>
-                    {% endif %}
-                </div>
-                {% endif %}
-                
-                <div class="row">
-                    <div class="col-md-8">
-                        <img src="{{ url_for('serve_image', filename=filename) }}" class="problem-image" alt="{{ display_name }}">
-                        
-                        {% if is_frq and group_parts %}
-                        <h3 class="mt-4">Other Parts of This FRQ</h3>
-                        <div class="row">
-                            {% for part in group_parts %}
-                            <div class="col-md-6 mb-3">
-                                <div class="group-part">
-                                    <h5>{{ part.problem_number }}</h5>
-                                    <a href="{{ url_for('problem_detail', filename=part.problem_number) }}">
-                                        <img src="{{ url_for('serve_image', filename=part.problem_number) }}" alt="{{ part.problem_number }}">
-                                    </a>
-                                    <div class="mt-2">
-                                        <a href="{{ url_for('problem_detail', filename=part.problem_number) }}" class="btn btn-sm btn-primary">View This Part</a>
-                                    </div>
-                                </div>
-                            </div>
-                            {% endfor %}
-                        </div>
-                        {% endif %}
-                    </div>
-                    <div class="col-md-4">
-                        <div class="card mb-4">
-                            <div class="card-header d-flex justify-content-between align-items-center">
-                                <span>Problem Details</span>
-                                <button class="btn btn-sm btn-outline-primary" type="button" data-bs-toggle="collapse" data-bs-target="#editMetadataForm">
-                                    Edit Metadata
-                                </button>
-                            </div>
-                            <div class="card-body">
-                                <div class="collapse mb-3" id="editMetadataForm">
-                                    <form method="post" action="{{ url_for('update_problem_metadata') }}">
-                                        <input type="hidden" name="problem_id" value="{{ problem.problem_id }}">
-                                        
-                                        <div class="mb-2">
-                                            <label for="year" class="form-label">Year</label>
-                                            <input type="text" class="form-control" id="year" name="year" value="{{ year }}">
-                                        </div>
-                                        
-                                        <div class="mb-2">
-                                            <label for="problem_type" class="form-label">Problem Type</label>
-                                            <select class="form-select" id="problem_type" name="problem_type">
-                                                <option value="Multiple Choice" {% if problem_type == 'Multiple Choice' %}selected{% endif %}>Multiple Choice</option>
-                                                <option value="Free Response" {% if problem_type == 'Free Response' %}selected{% endif %}>Free Response</option>
-                                                <option value="Other" {% if problem_type not in ['Multiple Choice', 'Free Response'] %}selected{% endif %}>Other</option>
-                                            </select>
-                                        </div>
-                                        
-                                        <div class="mb-2">
-                                            <label for="problem_num" class="form-label">Problem Number</label>
-                                            <input type="text" class="form-control" id="problem_num" name="problem_num" value="{{ problem_num }}">
-                                        </div>
-                                        
-                                        <div class="mb-2">
-                                            <label for="description" class="form-label">Description</label>
-                                            <textarea class="form-control" id="description" name="description" rows="2">{{ problem.description }}</textarea>
-                                        </div>
-                                        
-                                        <div class="mb-2">
-                                            <label for="difficulty" class="form-label">Difficulty (1-5)</label>
-                                            <input type="number" class="form-control" id="difficulty" name="difficulty" min="1" max="5" value="{{ problem.difficulty or '' }}">
-                                        </div>
-                                        
-                                        <button type="submit" class="btn btn-primary">Update Metadata</button>
-                                    </form>
-                                </div>
-                                
-                                <p><strong>Source:</strong> {{ problem.source }}</p>
-                                {% if problem.year %}
-                                <p><strong>Year:</strong> {{ problem.year }}</p>
-                                {% endif %}
-                                {% if problem.difficulty %}
-                                <p><strong>Difficulty:</strong> {{ problem.difficulty }}/5</p>
-                                {% endif %}
-                                <p><strong>Description:</strong> {{ problem.description }}</p>
-                            </div>
-                        </div>
-                        
-                        <div class="card">
-                            <div class="card-header">Add Topic to This Problem</div>
-                            <div class="card-body">
-                                <form method="post" action="{{ url_for('add_problem_topic') }}">
-                                    <input type="hidden" name="problem_id" value="{{ problem.problem_id }}">
-                                    
-                                    <div class="mb-3">
-                                        <label for="topic_id" class="form-label">Select Topic</label>
-                                        <select class="form-select" id="topic_id" name="topic_id" required>
-                                            <option value="">-- Select a Topic --</option>
-                                            {% for topic in all_topics %}
-                                            <option value="{{ topic.topic_id }}">
-                                                {{ topic.topic_number }} {{ topic.topic_name }} (Unit {{ topic.unit_number }})
-                                            </option>
-                                            {% endfor %}
-                                        </select>
-                                    </div>
-                                    
-                                    <div class="mb-3">
-                                        <label for="relevance_score" class="form-label">Relevance Score (1-5)</label>
-                                        <input type="number" class="form-control" id="relevance_score" name="relevance_score" min="1" max="5" value="5">
-                                        <div class="form-text">How relevant is this topic to the problem?</div>
-                                    </div>
-                                    
-                                    <div class="mb-3">
-                                        <label for="notes" class="form-label">Notes</label>
-                                        <textarea class="form-control" id="notes" name="notes" rows="2"></textarea>
-                                    </div>
-                                    
-                                    {% if is_frq and group_id %}
-                                    <div class="mb-3 form-check">
-                                        <input type="checkbox" class="form-check-input" id="apply_to_group" name="apply_to_group" checked>
-                                        <label class="form-check-label" for="apply_to_group">Apply to all parts of this FRQ</label>
-                                    </div>
-                                    {% endif %}
-                                    
-                                    <button type="submit" class="btn btn-primary">Add Topic</button>
-                                </form>
-                            </div>
-                        </div>
-                    </div>
-                </div>
-                
-                <h2 class="mt-4">Related Topics</h2>
-                {% if topics %}
-                <div class="list-group">
-                    {% for topic in topics %}
-                    <div class="list-group-item">
-                        <div class="d-flex w-100 justify-content-between">
-                            <h5 class="mb-1">
-                                <a href="{{ url_for('topic_detail', topic_id=topic.topic_id) }}">
-                                    {{ topic.topic_number }} {{ topic.topic_name }}
-                                </a>
-                            </h5>
-                            <small>Relevance: {{ topic.relevance_score }}/5</small>
-                        </div>
-                        <p class="mb-1">Unit {{ topic.unit_number }}: {{ topic.unit_name }}</p>
-                        {% if topic.notes %}
-                        <small>Notes: {{ topic.notes }}</small>
-                        {% endif %}
-                        <form method="post" action="{{ url_for('remove_problem_topic') }}" class="mt-2">
-                            <input type="hidden" name="problem_id" value="{{ problem.problem_id }}">
-                            <input type="hidden" name="topic_id" value="{{ topic.topic_id }}">
-                            
-                            {% if is_frq and group_id %}
-                            <div class="form-check mb-2">
-                                <input type="checkbox" class="form-check-input" id="remove_from_group" name="remove_from_group" checked>
-                                <label class="form-check-label" for="remove_from_group">Remove from all parts of this FRQ</label>
-                            </div>
-                            {% endif %}
-                            
-                            <button type="submit" class="btn btn-sm btn-danger">Remove Topic</button>
-                        </form>
-                    </div>
-                    {% endfor %}
-                </div>
-                {% else %}
-                <div class="alert alert-danger no-topics-alert">
-                    <h4 class="alert-heading">No Topics Assigned!</h4>
-                    <p>This problem doesn't have any topics associated with it yet. Please use the form on the right to add relevant topics.</p>
-                </div>
-                {% endif %}
-                
-                <div class="mt-4">
-                    <a href="{{ url_for('index') }}" class="btn btn-secondary">Back to Problems</a>
-                </div>
-            </div>
-            
-            <!-- Bootstrap JS for collapsible elements -->
-            <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.2.3/dist/js/bootstrap.bundle.min.js"></script>
-        </body>
-        </html>
-        ''',
-        
-        'topics.html': '''
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>AP Statistics Knowledge Tree</title>
-            <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/bootstrap@5.2.3/dist/css/bootstrap.min.css">
-            <style>
-                .unit-card { margin-bottom: 20px; }
-                .topic-item { margin: 5px 0; }
-            </style>
-        </head>
-        <body>
-            <div class="container mt-4">
-                <nav aria-label="breadcrumb">
-                    <ol class="breadcrumb">
-                        <li class="breadcrumb-item"><a href="{{ url_for('index') }}">Home</a></li>
-                        <li class="breadcrumb-item active">Knowledge Tree</li>
-                    </ol>
-                </nav>
-                
-                <h1>AP Statistics Knowledge Tree</h1>
-                
-                {% for flash_message in get_flashed_messages() %}
-                <div class="alert alert-info">{{ flash_message }}</div>
-                {% endfor %}
-                
-                <div class="row">
-                    {% for unit_data in units_with_topics %}
-                    <div class="col-md-6">
-                        <div class="card unit-card">
-                            <div class="card-header bg-primary text-white">
-                                Unit {{ unit_data.unit.unit_number }}: {{ unit_data.unit.unit_name }}
-                            </div>
-                            <div class="card-body">
-                                <ul class="list-group">
-                                    {% for topic in unit_data.topics %}
-                                    <li class="list-group-item topic-item">
-                                        <a href="{{ url_for('topic_detail', topic_id=topic.topic_id) }}">
-                                            {{ topic.topic_number }} {{ topic.topic_name }}
-                                        </a>
-                                    </li>
-                                    {% endfor %}
-                                </ul>
-                            </div>
-                        </div>
-                    </div>
-                    {% endfor %}
-                </div>
-                
-                <div class="mt-4">
-                    <a href="{{ url_for('index') }}" class="btn btn-secondary">Back to Problems</a>
-                </div>
-            </div>
-        </body>
-        </html>
-        ''',
-        
-        'topic.html': '''
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Topic: {{ topic.topic_name }}</title>
-            <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/bootstrap@5.2.3/dist/css/bootstrap.min.css">
-            <style>
-                .problem-image { max-width: 100%; height: auto; border: 1px solid #ddd; }
-            </style>
-        </head>
-        <body>
-            <div class="container mt-4">
-                <nav aria-label="breadcrumb">
-                    <ol class="breadcrumb">
-                        <li class="breadcrumb-item"><a href="{{ url_for('index') }}">Home</a></li>
-                        <li class="breadcrumb-item"><a href="{{ url_for('topics') }}">Knowledge Tree</a></li>
-                        <li class="breadcrumb-item active">{{ topic.topic_number }} {{ topic.topic_name }}</li>
-                    </ol>
-                </nav>
-                
-                {% for flash_message in get_flashed_messages() %}
-                <div class="alert alert-info">{{ flash_message }}</div>
-                {% endfor %}
-                
-                <h1>{{ topic.topic_number }} {{ topic.topic_name }}</h1>
-                <p class="text-muted">Unit {{ unit.unit_number }}: {{ unit.unit_name }}</p>
-                
-                <h2>Related Problems</h2>
-                {% if problems %}
-                <div class="row">
-                    {% for problem in problems %}
-                    <div class="col-md-4 mb-4">
-                        <div class="card">
-                            {% if problem.problem_number.endswith('.png') %}
-                            <a href="{{ url_for('problem_detail', filename=problem.problem_number) }}">
-                                <img src="{{ url_for('serve_image', filename=problem.problem_number) }}" class="card-img-top problem-image" alt="{{ problem.problem_number }}">
-                            </a>
-                            {% endif %}
-                            <div class="card-body">
-                                <h5 class="card-title">{{ problem.problem_number }}</h5>
-                                <p class="card-text">{{ problem.description }}</p>
-                                <p class="card-text"><small class="text-muted">Relevance: {{ problem.relevance_score }}/5</small></p>
-                                <a href="{{ url_for('problem_detail', filename=problem.problem_number) }}" class="btn btn-primary">View Problem</a>
-                            </div>
-                        </div>
-                    </div>
-                    {% endfor %}
-                </div>
-                {% else %}
-                <p>No problems associated with this topic yet.</p>
-                {% endif %}
-                
-                <div class="mt-4">
-                    <a href="{{ url_for('topics') }}" class="btn btn-secondary">Back to Knowledge Tree</a>
-                    <a href="{{ url_for('index') }}" class="btn btn-outline-secondary">Back to Problems</a>
-                </div>
-            </div>
-        </body>
-        </html>
-        ''',
-        
-        'search.html': '''
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Search</title>
-            <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/bootstrap@5.2.3/dist/css/bootstrap.min.css">
-            <style>
-                .problem-image { max-width: 100%; height: auto; border: 1px solid #ddd; }
-            </style>
-        </head>
-        <body>
-            <div class="container mt-4">
-                <nav aria-label="breadcrumb">
-                    <ol class="breadcrumb">
-                        <li class="breadcrumb-item"><a href="{{ url_for('index') }}">Home</a></li>
-                        <li class="breadcrumb-item active">Search</li>
-                    </ol>
-                </nav>
-                
-                <h1>Search</h1>
-                
-                <form method="get" class="mb-4">
-                    <div class="input-group">
-                        <input type="text" class="form-control" name="query" placeholder="Search for problems or topics..." value="{{ query }}">
-                        <button class="btn btn-primary" type="submit">Search</button>
-                    </div>
-                </form>
-                
-                {% if query %}
-                <h2>Results for "{{ query }}"</h2>
-                
-                {% if problems %}
-                <h3>Problems</h3>
-                <div class="row">
-                    {% for problem in problems %}
-                    <div class="col-md-4 mb-4">
-                        <div class="card">
-                            {% if problem.problem_number.endswith('.png') %}
-                            <a href="{{ url_for('problem_detail', filename=problem.problem_number) }}">
-                                <img src="{{ url_for('serve_image', filename=problem.problem_number) }}" class="card-img-top problem-image" alt="{{ problem.problem_number }}">
-                            </a>
-                            {% endif %}
-                            <div class="card-body">
-                                <h5 class="card-title">{{ problem.problem_number }}</h5>
-                                <p class="card-text">{{ problem.description }}</p>
-                                <a href="{{ url_for('problem_detail', filename=problem.problem_number) }}" class="btn btn-primary">View Problem</a>
-                            </div>
-                        </div>
-                    </div>
-                    {% endfor %}
-                </div>
-                {% endif %}
-                
-                {% if topics %}
-                <h3>Topics</h3>
-                <div class="list-group">
-                    {% for topic in topics %}
-                    <a href="{{ url_for('topic_detail', topic_id=topic.topic_id) }}" class="list-group-item list-group-item-action">
-                        <div class="d-flex w-100 justify-content-between">
-                            <h5 class="mb-1">{{ topic.topic_number }} {{ topic.topic_name }}</h5>
-                        </div>
-                        <p class="mb-1">Unit {{ topic.unit_number }}: {{ topic.unit_name }}</p>
-                    </a>
-                    {% endfor %}
-                </div>
-                {% endif %}
-                
-                {% if not problems and not topics %}
-                <div class="alert alert-info">No results found for "{{ query }}"</div>
-                {% endif %}
-                
-                {% endif %}
-                
-                <div class="mt-4">
-                    <a href="{{ url_for('index') }}" class="btn btn-secondary">Back to Problems</a>
-                </div>
-            </div>
-        </body>
-        </html>
-        ''',
-        
-        'knowledge_tree_3d.html': '''
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>AP Statistics Knowledge Tree - 3D Visualization</title>
-            <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/bootstrap@5.2.3/dist/css/bootstrap.min.css">
-            <style>
-                body { margin: 0; overflow: hidden; }
-                #tree-container { position: absolute; top: 0; left: 0; width: 100%; height: 100%; }
-                .controls { position: absolute; top: 10px; left: 10px; z-index: 100; background: rgba(255,255,255,0.7); padding: 10px; border-radius: 5px; }
-                .legend { position: absolute; bottom: 10px; left: 10px; z-index: 100; background: rgba(255,255,255,0.7); padding: 10px; border-radius: 5px; }
-                .legend-item { display: flex; align-items: center; margin-bottom: 5px; }
-                .legend-color { width: 20px; height: 20px; margin-right: 10px; border-radius: 50%; }
-                .active-branch { background-color: #00aa00; }
-                .inactive-branch { background-color: #aaaaaa; }
-                .highlight { background-color: #ff9900; }
-            </style>
-        </head>
-        <body>
-            <div id="tree-container"></div>
-            
-            <div class="controls">
-                <a href="{{ url_for('index') }}" class="btn btn-primary">Back to Problems</a>
-                <a href="{{ url_for('topics') }}" class="btn btn-secondary">View Knowledge Tree</a>
-            </div>
-            
-            <div class="legend">
-                <h5>Legend</h5>
-                <div class="legend-item">
-                    <div class="legend-color active-branch"></div>
-                    <span>Active Topic (Has Problems)</span>
-                </div>
-                <div class="legend-item">
-                    <div class="legend-color inactive-branch"></div>
-                    <span>Inactive Topic (No Problems)</span>
-                </div>
-                <div class="legend-item">
-                    <div class="legend-color highlight"></div>
-                    <span>Selected Node</span>
-                </div>
-                <p class="mt-2">
-                    <small>Tip: Click on a topic node to view its problems, or click on a problem node to view its details.</small>
-                </p>
-            </div>
-            
-            <!-- Three.js library -->
-            <script src="https://cdn.jsdelivr.net/npm/three@0.132.2/build/three.min.js"></script>
-            <script src="https://cdn.jsdelivr.net/npm/three@0.132.2/examples/js/controls/OrbitControls.js"></script>
-            
-            <!-- Knowledge Tree Visualization Script -->
-            <script src="{{ url_for('static', filename='knowledge_tree_3d.js') }}"></script>
-        </body>
-        </html>
-        '''
-    }
+    app = create_app()
     
-    for filename, content in template_files.items():
-        filepath = os.path.join('templates', filename)
-        with open(filepath, 'w') as f:
-            f.write(content)
+    # Optionally take scheduled online backups (only in the reloader's serving process)
+    backup_interval = os.environ.get('APSTATS_BACKUP_INTERVAL')
+    if backup_interval and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        BackupScheduler(float(backup_interval), app.config['DATABASE'], app.extensions['jobs'].backup_dir).start()
     
-    app.run(debug=True) 
\ No newline at end of file
+    app.run(debug=True) 
@@ -0,0 +1,155 @@
+"""
+Bulk topic assignment for the /api/assignments endpoint.
+
+A batch is a list of items, each naming a problem (problem_id or
+filename) and a topic (topic_number) with an optional relevance_score and
+notes. All problems are resolved with one query and all topics from the
+course tree, the links that already exist are read with one query, and
+every new or changed link is written by a single upsert on the
+(problem_id, topic_id) unique index, all in one transaction run by
+db_writer.write. A batch with any invalid item writes nothing.
+
+Fields left out of an item keep their stored value when the link already
+exists; new links get relevance 5 and no notes.
+"""
+
+import json
+
+DEFAULT_RELEVANCE = 5
+MAX_ITEMS = 5000
+
+
+class AssignmentError(ValueError):
+    """The request body is not a batch of assignment items."""
+
+
+def parse_items(payload):
+    """The items of a request body: a list, or an object with an "items" list."""
+    items = payload.get('items') if isinstance(payload, dict) else payload
+    if not isinstance(items, list):
+        raise AssignmentError('Expected a list of items or an object with an "items" list')
+    if len(items) > MAX_ITEMS:
+        raise AssignmentError(f"At most {MAX_ITEMS} items can be assigned in one request")
+    return items
+
+
+def _check_item(item):
+    """Error message for an item that is malformed on its own, or None."""
+    if not isinstance(item, dict):
+        return 'item must be an object'
+    if item.get('problem_id') is None and not item.get('filename'):
+        return 'problem_id or filename is required'
+    # bool is a subclass of int, but true is not problem 1
+    if item.get('problem_id') is not None and (not isinstance(item['problem_id'], int)
+                                               or isinstance(item['problem_id'], bool)):
+        return 'problem_id must be an integer'
+    if item.get('problem_id') is None and not isinstance(item['filename'], str):
+        return 'filename must be a string'
+    if not item.get('topic_number'):
+        return 'topic_number is required'
+    if not isinstance(item['topic_number'], str):
+        return 'topic_number must be a string'
+    score = item.get('relevance_score')
+    if score is not None and (not isinstance(score, int) or isinstance(score, bool) or not 1 <= score <= 5):
+        return 'relevance_score must be an integer from 1 to 5'
+    if item.get('notes') is not None and not isinstance(item['notes'], str):
+        return 'notes must be a string'
+    return None
+
+
+def apply_assignments(conn, items, topics_by_number):
+    """
+    Link topics to problems as described by items, in the caller's transaction.
+
+    topics_by_number maps topic numbers to topics (see course_tree.py).
+    Returns (applied, results): applied is False if any item was invalid,
+    in which case nothing was written. results has one dict per item with
+    its index, status (created, updated, unchanged, duplicate, error, or
+    skipped when another item was invalid), problem_id and topic_id, and
+    an error message for invalid items.
+    """
+    results = [{'index': index, 'status': None} for index in range(len(items))]
+    for result, item in zip(results, items):
+        error = _check_item(item)
+        if error:
+            result.update(status='error', error=error)
+
+    valid = [(result, item) for result, item in zip(results, items) if result['status'] is None]
+    problem_ids = sorted({item['problem_id'] for _, item in valid if item.get('problem_id') is not None})
+    filenames = sorted({item['filename'] for _, item in valid if item.get('problem_id') is None})
+
+    # Reads and the write share the caller's transaction, so no link changes in between
+    by_id = set()
+    by_filename = {}
+    for problem_id, problem_number in conn.execute('''
+        SELECT problem_id, problem_number FROM problems
+        WHERE problem_id IN (SELECT value FROM json_each(?))
+           OR problem_number IN (SELECT value FROM json_each(?))
+        ORDER BY problem_id
+    ''', (json.dumps(problem_ids), json.dumps(filenames))):
+        by_id.add(problem_id)
+        by_filename.setdefault(problem_number, problem_id)
+
+    pairs = {}
+    for result, item in valid:
+        problem_id = item['problem_id'] if item.get('problem_id') is not None else by_filename.get(item['filename'])
+        topic = topics_by_number.get(item['topic_number'])
+        if problem_id is None or (item.get('problem_id') is not None and problem_id not in by_id):
+            result.update(status='error', error='unknown problem')
+        elif topic is None:
+            result.update(status='error', error='unknown topic_number')
+        else:
+            result.update(problem_id=problem_id, topic_id=topic.topic_id)
+            # A later item for the same link replaces an earlier one
+            previous = pairs.get((problem_id, topic.topic_id))
+            if previous:
+                previous[0]['status'] = 'duplicate'
+            pairs[(problem_id, topic.topic_id)] = (result, item)
+
+    if any(result['status'] == 'error' for result in results):
+        for result in results:
+            if result['status'] != 'error':
+                result['status'] = 'skipped'
+        return False, results
+
+    existing = {}
+    for problem_id, topic_id, relevance_score, notes in conn.execute('''
+        SELECT pt.problem_id, pt.topic_id, pt.relevance_score, pt.notes
+        FROM json_each(?) pair
+        JOIN problem_topics pt ON pt.problem_id = json_extract(pair.value, '$[0]')
+                              AND pt.topic_id = json_extract(pair.value, '$[1]')
+    ''', (json.dumps(list(pairs)),)):
+        existing[(problem_id, topic_id)] = (relevance_score, notes)
+
+    rows = []
+    for pair, (result, item) in pairs.items():
+        stored = existing.get(pair) or (None, None)
+        wanted = (item['relevance_score'] if item.get('relevance_score') is not None
+                  else stored[0] or DEFAULT_RELEVANCE,
+                  item['notes'] if 'notes' in item else stored[1] if pair in existing else '')
+        if pair not in existing:
+            result['status'] = 'created'
+        else:
+            result['status'] = 'updated' if wanted != stored else 'unchanged'
+        if result['status'] != 'unchanged':
+            rows.append([*pair, *wanted])
+
+    if rows:
+        conn.execute('''
+            INSERT INTO problem_topics (problem_id, topic_id, relevance_score, notes)
+            SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]'),
+                   json_extract(value, '$[2]'), json_extract(value, '$[3]')
+            FROM json_each(?) WHERE true
+            ON CONFLICT (problem_id, topic_id) DO UPDATE
+            SET relevance_score = excluded.relevance_score, notes = excluded.notes
+        ''', (json.dumps(rows),))
+
+    return True, results
+
+
+def count_results(results):
+    """{status: number of items} for a list of item results."""
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    return counts
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Online backups of the AP Stats database using the sqlite3 backup API.
+
+Backups are copied page by page from a live connection, so they are always a
+consistent snapshot even while the web app is writing. The copy yields between
+steps so writers are only ever blocked for a single step. Finished backups are
+timestamped, verified and rotated so only the newest ones are kept.
+"""
+
+import argparse
+import glob
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+DEFAULT_DB_PATH = 'ap_stats.db'
+DEFAULT_BACKUP_DIR = 'backups'
+DEFAULT_KEEP = 10
+DEFAULT_PAGES_PER_STEP = 64
+DEFAULT_STEP_SLEEP = 0.005  # seconds to yield to writers between steps
+
+# Metrics about the backups taken by this process
+backup_metrics = {
+    'backups_total': 0,
+    'failures_total': 0,
+    'last_duration_seconds': None,
+    'last_size_bytes': None,
+    'last_pages': None,
+    'last_backup_path': None,
+    'last_backup_time': None,
+    'last_error': None,
+}
+_metrics_lock = threading.Lock()
+
+
+def get_backup_metrics():
+    """Return a snapshot of the backup metrics."""
+    with _metrics_lock:
+        return dict(backup_metrics)
+
+
+def _backup_name(db_path, backup_dir):
+    """Build a timestamped backup path that does not exist yet."""
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    backup_path = os.path.join(backup_dir, f"{stem}-{timestamp}.db")
+
+    counter = 1
+    while os.path.exists(backup_path):
+        backup_path = os.path.join(backup_dir, f"{stem}-{timestamp}-{counter}.db")
+        counter += 1
+
+    return backup_path
+
+
+def list_backups(db_path=DEFAULT_DB_PATH, backup_dir=DEFAULT_BACKUP_DIR):
+    """List existing backups of a database, newest first."""
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    backups = glob.glob(os.path.join(backup_dir, f"{stem}-*.db"))
+    backups.sort(key=os.path.getmtime, reverse=True)
+    return backups
+
+
+def rotate_backups(db_path=DEFAULT_DB_PATH, backup_dir=DEFAULT_BACKUP_DIR, keep=DEFAULT_KEEP):
+    """Delete all but the newest `keep` backups. Returns the removed paths."""
+    removed = []
+    for old_backup in list_backups(db_path, backup_dir)[keep:]:
+        os.remove(old_backup)
+        removed.append(old_backup)
+    return removed
+
+
+def backup_database(db_path=DEFAULT_DB_PATH, backup_dir=DEFAULT_BACKUP_DIR, keep=DEFAULT_KEEP,
+                    pages=DEFAULT_PAGES_PER_STEP, step_sleep=DEFAULT_STEP_SLEEP, on_progress=None):
+    """
+    Take an online backup of the database and rotate old backups.
+
+    The database is copied `pages` pages at a time, sleeping `step_sleep`
+    seconds between steps. The copy is written to a temporary file, checked
+    with PRAGMA quick_check and only then renamed into place, so a backup
+    file that exists is always complete. Returns the path of the new backup.
+
+    on_progress, if given, is called with (copied pages, total pages) after
+    every step; an exception it raises aborts the backup.
+    """
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"Database file '{db_path}' not found.")
+
+    os.makedirs(backup_dir, exist_ok=True)
+    backup_path = _backup_name(db_path, backup_dir)
+    partial_path = backup_path + '.partial'
+    start_time = time.perf_counter()
+    copied_pages = 0
+
+    def progress(status, remaining, total):
+        nonlocal copied_pages
+        copied_pages = total - remaining
+        if on_progress:
+            on_progress(copied_pages, total)
+        if remaining and step_sleep:
+            time.sleep(step_sleep)
+
+    try:
+        source = sqlite3.connect(db_path)
+        try:
+            destination = sqlite3.connect(partial_path)
+            try:
+                source.backup(destination, pages=pages, progress=progress, sleep=step_sleep)
+                result = destination.execute('PRAGMA quick_check').fetchone()[0]
+                if result != 'ok':
+                    raise sqlite3.DatabaseError(f"Backup failed integrity check: {result}")
+            finally:
+                destination.close()
+        finally:
+            source.close()
+
+        os.replace(partial_path, backup_path)
+    except Exception as e:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        with _metrics_lock:
+            backup_metrics['failures_total'] += 1
+            backup_metrics['last_error'] = str(e)
+        raise
+
+    duration = time.perf_counter() - start_time
+    size = os.path.getsize(backup_path)
+    rotate_backups(db_path, backup_dir, keep)
+
+    with _metrics_lock:
+        backup_metrics['backups_total'] += 1
+        backup_metrics['last_duration_seconds'] = duration
+        backup_metrics['last_size_bytes'] = size
+        backup_metrics['last_pages'] = copied_pages
+        backup_metrics['last_backup_path'] = backup_path
+        backup_metrics['last_backup_time'] = time.time()
+        backup_metrics['last_error'] = None
+
+    return backup_path
+
+
+class BackupScheduler(threading.Thread):
+    """Background thread that takes an online backup every `interval` seconds."""
+
+    def __init__(self, interval, db_path=DEFAULT_DB_PATH, backup_dir=DEFAULT_BACKUP_DIR, keep=DEFAULT_KEEP,
+                 pages=DEFAULT_PAGES_PER_STEP, step_sleep=DEFAULT_STEP_SLEEP):
+        super().__init__(name='backup-scheduler', daemon=True)
+        self.interval = interval
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.pages = pages
+        self.step_sleep = step_sleep
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                backup_path = backup_database(self.db_path, self.backup_dir, self.keep,
+                                              self.pages, self.step_sleep)
+                print(f"Scheduled backup written to {backup_path}")
+            except Exception as e:
+                print(f"Scheduled backup failed: {e}")
+
+    def stop(self):
+        """Stop the scheduler after the current backup (if any) finishes."""
+        self._stop_event.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Take online backups of the AP Stats database.')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help='database to back up')
+    parser.add_argument('--dest', default=DEFAULT_BACKUP_DIR, help='directory for backup files')
+    parser.add_argument('--keep', type=int, default=DEFAULT_KEEP, help='number of backups to keep')
+    parser.add_argument('--pages', type=int, default=DEFAULT_PAGES_PER_STEP, help='pages copied per step')
+    parser.add_argument('--sleep', type=float, default=DEFAULT_STEP_SLEEP, help='seconds to sleep between steps')
+    parser.add_argument('--interval', type=float, help='keep running and back up every INTERVAL seconds')
+    args = parser.parse_args()
+
+    backup_path = backup_database(args.db, args.dest, args.keep, args.pages, args.sleep)
+    metrics = get_backup_metrics()
+    print(f"Backed up {args.db} to {backup_path}")
+    print(f"  - Size: {metrics['last_size_bytes']} bytes ({metrics['last_pages']} pages)")
+    print(f"  - Duration: {metrics['last_duration_seconds']:.3f}s")
+
+    if args.interval:
+        scheduler = BackupScheduler(args.interval, args.db, args.dest, args.keep, args.pages, args.sleep)
+        scheduler.start()
+        print(f"Backing up every {args.interval} seconds (Ctrl+C to stop)")
+        try:
+            while scheduler.is_alive():
+                scheduler.join(1)
+        except KeyboardInterrupt:
+            scheduler.stop()
+
+
+if __name__ == "__main__":
+    main()
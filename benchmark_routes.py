@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Benchmark the main routes of the web app against a synthetic corpus.
+
+Each route is requested through the Flask test client, with the app running
+from a corpus built by synthetic_data.py. For every route the benchmark
+records latency percentiles, the number of SQL statements per request (from
+the request instrumentation) and the peak memory allocated while handling
+one request (from tracemalloc). Results can be saved as a JSON baseline, and
+later runs are compared against it: a route is flagged as a regression when
+it runs more queries, or when its latency or allocations grow by more than
+the tolerance.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.parse import quote
+
+import instrumentation
+import synthetic_data
+
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+DEFAULT_REPEAT = 20
+DEFAULT_WARMUP = 2
+DEFAULT_TOLERANCE = 0.25  # relative growth allowed before a route is flagged
+
+# Growth below these is treated as noise whatever the relative change
+MIN_LATENCY_DELTA_MS = 2.0
+MIN_ALLOC_DELTA_KB = 64.0
+
+ALLOCATION_SAMPLES = 3
+
+# Corpus settings that must match for two runs to be compared
+CORPUS_KEYS = ('seed', 'years', 'images', 'links')
+
+
+def pick_targets(db_path):
+    """Choose the URL benchmarked for every route from the corpus."""
+    conn = sqlite3.connect(db_path)
+    try:
+        mcq = conn.execute('''
+            SELECT problem_number FROM problems
+            WHERE problem_type = 'Multiple Choice' ORDER BY problem_id LIMIT 1
+        ''').fetchone()[0]
+        frq = conn.execute('''
+            SELECT problem_number FROM problems
+            WHERE problem_type = 'Free Response' ORDER BY problem_id DESC LIMIT 1
+        ''').fetchone()[0]
+        # The busiest topic is the worst case for topic_detail
+        topic_id = conn.execute('''
+            SELECT topic_id FROM problem_topics
+            GROUP BY topic_id ORDER BY COUNT(*) DESC, topic_id LIMIT 1
+        ''').fetchone()[0]
+    finally:
+        conn.close()
+
+    return [
+        ('index', '/'),
+        ('index_render', '/'),  # The home page with the page cache cleared before each request
+        ('problem_detail', f'/problem/{quote(mcq)}'),
+        ('serve_image', f'/images/{quote(frq)}'),
+        ('topic_detail', f'/topic/{topic_id}'),
+        ('search', '/search?query=regression'),
+        ('knowledge_tree_data', '/api/knowledge_tree_data'),
+    ]
+
+
+@contextmanager
+def running_from(corpus_dir):
+    """Run the block with the corpus as working directory, where the app looks for its data."""
+    previous_dir = os.getcwd()
+    os.chdir(corpus_dir)
+    try:
+        yield
+    finally:
+        os.chdir(previous_dir)
+
+
+def measure_route(client, path, captured, repeat, warmup, before=None):
+    """
+    Latency and query count of one URL, requested `repeat` times after `warmup` requests.
+
+    before, if given, is called before every request (e.g. to clear a cache).
+    """
+    before = before or (lambda: None)
+    for _ in range(warmup):
+        before()
+        client.get(path).close()
+
+    durations = []
+    queries = []
+    status = None
+    for _ in range(repeat):
+        before()
+        captured.clear()
+        start = time.perf_counter()
+        response = client.get(path)
+        response.get_data()
+        durations.append((time.perf_counter() - start) * 1000)
+        status = response.status_code
+        response.close()
+        if captured:
+            queries.append(captured[-1][1])
+
+    allocations = []
+    tracemalloc.start()
+    try:
+        for _ in range(ALLOCATION_SAMPLES):
+            before()
+            tracemalloc.reset_peak()
+            allocated = tracemalloc.get_traced_memory()[0]
+            response = client.get(path)
+            response.get_data()
+            response.close()
+            allocations.append((tracemalloc.get_traced_memory()[1] - allocated) / 1024)
+    finally:
+        tracemalloc.stop()
+
+    durations.sort()
+    return {
+        'path': path,
+        'status': status,
+        'requests': repeat,
+        'mean_ms': round(statistics.mean(durations), 3),
+        'p50_ms': round(statistics.median(durations), 3),
+        'p95_ms': round(instrumentation.percentile(durations, 0.95), 3),
+        'max_ms': round(durations[-1], 3),
+        'queries': max(queries) if queries else None,
+        'peak_alloc_kb': round(statistics.median(allocations), 1),
+    }
+
+
+def run_benchmark(corpus_dir, repeat=DEFAULT_REPEAT, warmup=DEFAULT_WARMUP, routes=None):
+    """Benchmark the routes against the corpus in corpus_dir and return the results."""
+    corpus_dir = os.path.abspath(corpus_dir)
+    targets = pick_targets(os.path.join(corpus_dir, 'ap_stats.db'))
+    if routes:
+        targets = [(name, path) for name, path in targets if name in routes]
+
+    with running_from(corpus_dir), instrumentation.count_queries() as captured:
+        from app import create_app
+
+        app = create_app({'TESTING': True, 'DATABASE': os.path.join(corpus_dir, 'ap_stats.db'),
+                          'COURSE_DIR': os.path.join(corpus_dir, 'AP_Statistics_Course')})
+        with app.test_client() as client:
+            # index measures page cache hits, index_render the rendering behind them
+            clear_pages = app.extensions['page_cache'].clear
+            results = {name: measure_route(client, path, captured, repeat, warmup,
+                                           clear_pages if name == 'index_render' else None)
+                       for name, path in targets}
+
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'corpus': synthetic_data.load_manifest(corpus_dir),
+        'routes': results,
+    }
+
+
+def compare_results(baseline, results, tolerance=DEFAULT_TOLERANCE):
+    """List the regressions of results against baseline as (route, message) pairs."""
+    regressions = []
+
+    # Runs on different corpora are not comparable
+    old = {key: (baseline.get('corpus') or {}).get(key) for key in CORPUS_KEYS}
+    new = {key: (results.get('corpus') or {}).get(key) for key in CORPUS_KEYS}
+    if old != new:
+        regressions.append(('*', f"corpus differs from the baseline ({old} vs {new})"))
+        return regressions
+
+    for name, current in results['routes'].items():
+        previous = baseline['routes'].get(name)
+        if previous is None:
+            continue
+
+        if current['status'] != previous['status'] and current['status'] >= 400:
+            regressions.append((name, f"status {previous['status']} -> {current['status']}"))
+        if previous['queries'] is not None and current['queries'] is not None \
+                and current['queries'] > previous['queries']:
+            regressions.append((name, f"queries {previous['queries']} -> {current['queries']}"))
+
+        for key, unit, slack in (('p50_ms', 'ms', MIN_LATENCY_DELTA_MS),
+                                 ('peak_alloc_kb', 'KB', MIN_ALLOC_DELTA_KB)):
+            old, new = previous[key], current[key]
+            if new - old > slack and new > old * (1 + tolerance):
+                regressions.append((name, f"{key} {old:.1f}{unit} -> {new:.1f}{unit} "
+                                          f"(+{(new / old - 1) * 100 if old else float('inf'):.0f}%)"))
+
+    return regressions
+
+
+def print_results(results, baseline=None):
+    """Print a table of the results, with the baseline p50 if there is one."""
+    corpus = results['corpus'] or {}
+    print(f"=== Route benchmark ({corpus.get('images')} images, {corpus.get('links')} links, "
+          f"{corpus.get('years')} years) ===")
+    print(f"{'route':<22}{'status':>7}{'p50 ms':>10}{'p95 ms':>10}{'queries':>9}{'alloc KB':>11}{'base p50':>10}")
+    for name, route in results['routes'].items():
+        previous = (baseline or {}).get('routes', {}).get(name)
+        base = f"{previous['p50_ms']:.2f}" if previous else '-'
+        print(f"{name:<22}{route['status']:>7}{route['p50_ms']:>10.2f}{route['p95_ms']:>10.2f}"
+              f"{route['queries'] if route['queries'] is not None else '-':>9}"
+              f"{route['peak_alloc_kb']:>11.1f}{base:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the web app routes on a synthetic corpus.')
+    parser.add_argument('--corpus', help='existing corpus directory (default: generate one in a temp dir)')
+    parser.add_argument('--years', type=int, default=synthetic_data.DEFAULT_YEARS, help='exam years to generate')
+    parser.add_argument('--images', type=int, default=synthetic_data.DEFAULT_IMAGES, help='images to generate')
+    parser.add_argument('--links', type=int, default=synthetic_data.DEFAULT_LINKS, help='topic links to generate')
+    parser.add_argument('--seed', type=int, default=synthetic_data.DEFAULT_SEED, help='generator seed')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='timed requests per route')
+    parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP, help='untimed requests per route')
+    parser.add_argument('--route', action='append', help='only benchmark this route (repeatable)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline file to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='save the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='relative latency/allocation growth allowed (default 0.25)')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    baseline_path = os.path.abspath(args.baseline)
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    with tempfile.TemporaryDirectory(prefix='apstats-corpus-') as temp_dir:
+        corpus_dir = args.corpus
+        if not corpus_dir:
+            corpus_dir = temp_dir
+            print(f"Generating corpus ({args.images} images, {args.links} links) in {corpus_dir}...")
+            synthetic_data.generate_corpus(corpus_dir, args.years, args.images, args.links, args.seed)
+        results = run_benchmark(corpus_dir, args.repeat, args.warmup, args.route)
+
+    baseline = None
+    if os.path.exists(baseline_path) and not args.save_baseline:
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    print_results(results, baseline)
+
+    if output_path:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved baseline to {baseline_path}")
+        return 0
+
+    if baseline is None:
+        print(f"\nNo baseline at {baseline_path}; run with --save-baseline to create one.")
+        return 0
+
+    regressions = compare_results(baseline, results, args.tolerance)
+    if not regressions:
+        print(f"\nNo regressions against {baseline_path} (created {baseline.get('created')}).")
+        return 0
+
+    print(f"\n{len(regressions)} regression(s) against {baseline_path}:")
+    for name, message in regressions:
+        print(f"  - {name}: {message}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+Bulk problem metadata updates from CSV or JSON rows.
+
+Each row names a problem (problem_id or filename) and the fields to set:
+year, problem_type, problem_num, difficulty and description. Empty or
+missing fields are left as they are. Year, type and number belong to the
+whole FRQ, so for a problem in an FRQ group they are set on every part,
+as the metadata form on the problem page does.
+
+Rows are checked against the catalog first and the changes they would make
+are listed as a diff, problem by problem. Nothing is written while any row
+is invalid. Applying writes the per-problem fields with one executemany
+and the group fields with one set-based UPDATE per group, in a single
+transaction.
+
+Run it to preview or apply a file, or to export the current metadata as a
+CSV to edit:
+    python bulk_metadata.py rows.csv
+    python bulk_metadata.py rows.csv --apply
+    python bulk_metadata.py --export metadata.csv
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sqlite3
+import sys
+
+from ap_stats_db import migrate
+
+DEFAULT_DB_PATH = 'ap_stats.db'
+MAX_ROWS = 5000
+
+FIELDS = ('year', 'problem_type', 'problem_num', 'difficulty', 'description')
+GROUP_FIELDS = ('year', 'problem_type', 'problem_num')  # shared by all parts of an FRQ
+PART_FIELDS = ('difficulty', 'description')
+PROBLEM_TYPES = ('Multiple Choice', 'Free Response', 'Other')
+
+# Columns of an exported file that identify a problem but cannot be changed
+READ_ONLY_COLUMNS = ('problem_id', 'filename', 'group_id', 'part_num')
+
+
+class MetadataError(ValueError):
+    """The uploaded rows cannot be read."""
+
+
+def read_rows(text, format=None):
+    """The rows of a CSV or JSON document (a list, or an object with a "rows" list)."""
+    if format is None:
+        format = 'json' if text.lstrip().startswith(('[', '{')) else 'csv'
+
+    if format == 'json':
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            raise MetadataError(f"Invalid JSON: {e}")
+        rows = data.get('rows') if isinstance(data, dict) else data
+        if not isinstance(rows, list):
+            raise MetadataError('Expected a list of rows or an object with a "rows" list')
+    else:
+        reader = csv.DictReader(io.StringIO(text.lstrip('﻿')))
+        if not reader.fieldnames:
+            raise MetadataError('The CSV file has no header row')
+        rows = [{key.strip(): value.strip() for key, value in row.items() if key is not None and value is not None}
+                for row in reader]
+
+    if len(rows) > MAX_ROWS:
+        raise MetadataError(f"At most {MAX_ROWS} rows can be updated at once")
+    return rows
+
+
+def _integer(value, field):
+    """value as an int: an int, an integral float or a string of digits (from CSV)."""
+    # bool is a subclass of int, and int() would truncate 1.7 to 1
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f"{field} must be an integer")
+    if not isinstance(value, (int, float, str)):
+        raise ValueError(f"{field} must be an integer")
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{field} must be an integer")
+
+
+def _clean_row(row):
+    """(problem_id, filename, values) for a row, raising ValueError if it is invalid."""
+    if not isinstance(row, dict):
+        raise ValueError('row must be an object')
+    unknown = set(row) - set(FIELDS) - set(READ_ONLY_COLUMNS)
+    if unknown:
+        raise ValueError(f"unknown column(s): {', '.join(sorted(unknown))}")
+
+    problem_id = row.get('problem_id')
+    if problem_id in ('', None):
+        problem_id = None
+    else:
+        problem_id = _integer(problem_id, 'problem_id')
+    filename = row.get('filename') or None
+    if filename is not None and not isinstance(filename, str):
+        raise ValueError('filename must be a string')
+    if problem_id is None and filename is None:
+        raise ValueError('problem_id or filename is required')
+
+    values = {}
+    for field in FIELDS:
+        value = row.get(field)
+        if value is None or (isinstance(value, str) and not value.strip()):
+            continue
+        if field in ('year', 'difficulty'):
+            value = _integer(value, field)
+            if field == 'year' and not 1990 <= value <= 2100:
+                raise ValueError('year must be between 1990 and 2100')
+            if field == 'difficulty' and not 1 <= value <= 5:
+                raise ValueError('difficulty must be from 1 to 5')
+        else:
+            value = str(value).strip()
+            if field == 'problem_type' and value not in PROBLEM_TYPES:
+                raise ValueError(f"problem_type must be one of: {', '.join(PROBLEM_TYPES)}")
+        values[field] = value
+    return problem_id, filename, values
+
+
+def problem_source(year, problem_type):
+    """The source text the metadata form stores with a year and type."""
+    return f"Problem from {'' if year is None else year} AP Statistics {problem_type or ''}"
+
+
+def plan_changes(conn, rows):
+    """
+    Check rows against the catalog and work out what applying them would change.
+
+    Returns a plan dict with:
+      results  one dict per row: index, problem_id, status (changed,
+               unchanged or error) and the error message
+      diff     one dict per problem that would change: problem_id,
+               problem_number, group_id, via_group (changed only as another
+               part of its group) and changes {field: [old, new]}
+      valid    False if any row is invalid
+    and the per-problem and per-group updates used by apply_plan.
+    """
+    results = []
+    cleaned = []
+    for index, row in enumerate(rows):
+        result = {'index': index, 'status': None}
+        results.append(result)
+        try:
+            cleaned.append((result, *_clean_row(row)))
+        except ValueError as e:
+            result.update(status='error', error=str(e))
+
+    # The named problems and every part of their groups, in one query
+    problem_ids = sorted({problem_id for _, problem_id, _, _ in cleaned if problem_id is not None})
+    filenames = sorted({filename for _, problem_id, filename, _ in cleaned if problem_id is None})
+    cursor = conn.execute('''
+        WITH named AS (
+            SELECT problem_id, group_id FROM problems
+            WHERE problem_id IN (SELECT value FROM json_each(?))
+               OR problem_number IN (SELECT value FROM json_each(?))
+        )
+        SELECT problem_id, problem_number, group_id, year, problem_type, problem_num,
+               difficulty, description, source
+        FROM problems
+        WHERE problem_id IN (SELECT problem_id FROM named)
+           OR group_id IN (SELECT group_id FROM named WHERE group_id IS NOT NULL)
+        ORDER BY problem_id
+    ''', (json.dumps(problem_ids), json.dumps(filenames)))
+    columns = [column[0] for column in cursor.description]
+    current = {}
+    by_filename = {}
+    for row in cursor:
+        problem = dict(zip(columns, row))
+        current[problem['problem_id']] = problem
+        by_filename.setdefault(problem['problem_number'], problem['problem_id'])
+
+    part_values = {}  # problem_id -> {field: value} for the per-problem fields
+    group_values = {}  # group_id -> {field: (value, row index)} for the FRQ fields
+    for result, problem_id, filename, values in cleaned:
+        if problem_id is None:
+            problem_id = by_filename.get(filename)
+        problem = current.get(problem_id)
+        if problem is None or (filename and problem['problem_number'] != filename):
+            result.update(status='error', error='unknown problem')
+            continue
+        result['problem_id'] = problem_id
+
+        group_id = problem['group_id']
+        shared = group_values.setdefault(group_id, {}) if group_id else None
+        for field, value in values.items():
+            if shared is not None and field in GROUP_FIELDS:
+                if field in shared and shared[field][0] != value:
+                    result.update(status='error',
+                                  error=f"{field} conflicts with row {shared[field][1] + 1} for FRQ {group_id}")
+                    break
+                shared[field] = (value, result['index'])
+            else:
+                part_values.setdefault(problem_id, {})[field] = value
+
+    # The metadata every affected problem would have afterwards
+    updated = {problem_id: dict(problem) for problem_id, problem in current.items()}
+    for problem_id, values in part_values.items():
+        updated[problem_id].update(values)
+    for problem in updated.values():
+        shared = group_values.get(problem['group_id']) if problem['group_id'] else None
+        if shared:
+            problem.update({field: value for field, (value, _) in shared.items()})
+        fields = set(part_values.get(problem['problem_id'], ())) | set(shared or ())
+        if fields & {'year', 'problem_type'}:
+            problem['source'] = problem_source(problem['year'], problem['problem_type'])
+
+    # Sets built once, so marking the diff and the results stays linear in the rows
+    result_problem_ids = {result['problem_id'] for result in results if 'problem_id' in result}
+    diff = []
+    for problem_id, problem in updated.items():
+        changes = {field: [current[problem_id][field], problem[field]]
+                   for field in FIELDS + ('source',) if problem[field] != current[problem_id][field]}
+        if changes:
+            diff.append({'problem_id': problem_id,
+                         'problem_number': problem['problem_number'],
+                         'group_id': problem['group_id'],
+                         'via_group': problem_id not in part_values and problem_id not in result_problem_ids,
+                         'changes': changes})
+    changed = {entry['problem_id'] for entry in diff}
+    touched_group_ids = {entry['group_id'] for entry in diff if entry['group_id']}
+
+    for result in results:
+        if result['status'] is None:
+            group_id = current[result['problem_id']]['group_id']
+            touched = result['problem_id'] in changed or group_id in touched_group_ids
+            result['status'] = 'changed' if touched else 'unchanged'
+
+    valid = not any(result['status'] == 'error' for result in results)
+
+    # Problems outside a group get all their fields from one executemany row;
+    # grouped parts only their own fields, the rest comes from the group UPDATE
+    problem_updates = []
+    for problem_id in sorted(changed):
+        problem = updated[problem_id]
+        fields = PART_FIELDS if problem['group_id'] else FIELDS + ('source',)
+        if any(problem[field] != current[problem_id][field] for field in fields):
+            problem_updates.append((fields, problem_id, [problem[field] for field in fields]))
+    group_updates = [(group_id, {field: value for field, (value, _) in shared.items()})
+                     for group_id, shared in sorted(group_values.items()) if shared]
+
+    return {'results': results, 'diff': diff, 'valid': valid,
+            'problem_updates': problem_updates, 'group_updates': group_updates}
+
+
+def apply_plan(conn, plan):
+    """Write a valid plan's updates (the transaction is left to the caller)."""
+    grouped = [(problem_id, values) for fields, problem_id, values in plan['problem_updates'] if fields == PART_FIELDS]
+    single = [(problem_id, values) for fields, problem_id, values in plan['problem_updates'] if fields != PART_FIELDS]
+    if single:
+        conn.executemany('''
+            UPDATE problems
+            SET year = ?, problem_type = ?, problem_num = ?, difficulty = ?, description = ?, source = ?
+            WHERE problem_id = ?
+        ''', [(*values, problem_id) for problem_id, values in single])
+    if grouped:
+        conn.executemany('UPDATE problems SET difficulty = ?, description = ? WHERE problem_id = ?',
+                         [(*values, problem_id) for problem_id, values in grouped])
+
+    # One UPDATE per FRQ group, skipping the parts that already match; the
+    # source is rebuilt from the new year and type as problem_source does
+    for group_id, values in plan['group_updates']:
+        assignments = [f"{field} = ?" for field in values]
+        tests = [f"{field} IS NOT ?" for field in values]
+        parameters = list(values.values())
+        test_parameters = list(values.values())
+        if 'year' in values or 'problem_type' in values:
+            year = '?' if 'year' in values else 'year'
+            problem_type = '?' if 'problem_type' in values else 'problem_type'
+            source = f"'Problem from ' || COALESCE({year}, '') || ' AP Statistics ' || COALESCE({problem_type}, '')"
+            source_parameters = [values[field] for field in ('year', 'problem_type') if field in values]
+            assignments.append(f"source = {source}")
+            tests.append(f"source IS NOT {source}")
+            parameters += source_parameters
+            test_parameters += source_parameters
+        conn.execute(f'''
+            UPDATE problems SET {', '.join(assignments)}
+            WHERE group_id = ? AND ({' OR '.join(tests)})
+        ''', (*parameters, group_id, *test_parameters))
+
+
+def plan_and_apply(conn, rows):
+    """Plan rows and apply them if every row is valid, in the caller's transaction."""
+    plan = plan_changes(conn, rows)
+    if plan['valid']:
+        apply_plan(conn, plan)
+    plan['applied'] = plan['valid']
+    return plan
+
+
+def update_metadata(conn, rows, apply=False):
+    """Plan rows and, if apply is set and every row is valid, apply them in one transaction."""
+    if not apply:
+        plan = plan_changes(conn, rows)
+        plan['applied'] = False
+        return plan
+
+    # The plan is made inside the transaction, so it is exactly what gets written
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        plan = plan_and_apply(conn, rows)
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+    return plan
+
+
+def summarize(plan):
+    """Counts for a plan: rows by status and problems changed."""
+    counts = {}
+    for result in plan['results']:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    counts['problems_changed'] = len(plan['diff'])
+    return counts
+
+
+def export_metadata(conn, out):
+    """Write the metadata of every problem to out as CSV, in the format read_rows accepts."""
+    writer = csv.writer(out)
+    writer.writerow(READ_ONLY_COLUMNS + FIELDS)
+    writer.writerows(conn.execute('''
+        SELECT problem_id, problem_number, group_id, part_num, year, problem_type, problem_num,
+               difficulty, description
+        FROM problems
+        ORDER BY problem_number
+    '''))
+
+
+def print_plan(plan):
+    for result in plan['results']:
+        if result['status'] == 'error':
+            print(f"Row {result['index'] + 1}: {result['error']}")
+    for entry in plan['diff']:
+        suffix = f" (via FRQ {entry['group_id']})" if entry['via_group'] else ''
+        print(f"{entry['problem_number']}{suffix}")
+        for field, (old, new) in entry['changes'].items():
+            print(f"    {field}: {old!r} -> {new!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Preview or apply bulk problem metadata updates.')
+    parser.add_argument('file', nargs='?', help='CSV or JSON file with one row per problem')
+    parser.add_argument('--format', choices=['csv', 'json'], help='file format (default: from the content)')
+    parser.add_argument('--apply', action='store_true', help='write the changes (default: only show them)')
+    parser.add_argument('--export', metavar='FILE', help='write the current metadata to FILE as CSV instead')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help='database to update')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"Database file '{args.db}' not found.")
+        return 1
+
+    conn = sqlite3.connect(args.db)
+    try:
+        migrate(conn)
+        if args.export:
+            with open(args.export, 'w', newline='', encoding='utf-8') as f:
+                export_metadata(conn, f)
+            print(f"Exported the metadata to {args.export}")
+            return 0
+        if not args.file:
+            parser.error('a file to read is required unless --export is given')
+
+        with open(args.file, encoding='utf-8') as f:
+            rows = read_rows(f.read(), args.format)
+        plan = update_metadata(conn, rows, apply=args.apply)
+    except MetadataError as e:
+        print(f"Error: {e}")
+        return 1
+    finally:
+        conn.close()
+
+    print_plan(plan)
+    counts = summarize(plan)
+    if not plan['valid']:
+        print(f"{counts.get('error', 0)} invalid row(s); nothing was changed.")
+        return 1
+    verb = 'Updated' if plan['applied'] else 'Would update'
+    print(f"{verb} {counts['problems_changed']} problem(s) from {len(plan['results'])} row(s).")
+    if not plan['applied'] and plan['diff']:
+        print("Run again with --apply to write the changes.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
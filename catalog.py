@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Sync the problems table with the images in the course folders.
+
+Every image in a unit folder gets a problems row, created with the year
+from its file name as the problem page used to do on a first visit. The
+FRQ group id ("2019_FRQ_1") and part number parsed from the file name
+are stored with it, and so is the image's path inside the course folder,
+which is cleared when the image is gone. The rest of the metadata is left
+to the editing pages. Only rows that actually change are written, so syncing an
+unchanged catalog makes no writes.
+
+The web app syncs at startup (and so whenever serve.py reloads) and when
+a catalog sync job runs, so the pages can be pure reads. Run this script
+after adding images to sync straight away.
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import sys
+
+from ap_stats_db import migrate
+
+DEFAULT_DB_PATH = 'ap_stats.db'
+DEFAULT_COURSE_DIR = 'AP_Statistics_Course'
+
+YEAR_PATTERN = re.compile(r'(\d{4})')
+NUMBER_PATTERN = re.compile(r'(?:MCQ|FRQ|Frq)(\d+)')
+FRQ_PATTERN = re.compile(r'(?:FRQ|Frq)(\d+)')
+PART_PATTERN = re.compile(r'(?:FRQ|Frq)(\d+)-(\d+)')
+
+
+def parse_problem_filename(filename):
+    """Year, type, number, FRQ group id and part number of a problem image file name."""
+    year_match = YEAR_PATTERN.search(filename)
+    num_match = NUMBER_PATTERN.search(filename)
+    frq_match = FRQ_PATTERN.search(filename)
+    part_match = PART_PATTERN.search(filename)
+
+    if 'MCQ' in filename:
+        problem_type = 'Multiple Choice'
+    elif 'FRQ' in filename or 'Frq' in filename:
+        problem_type = 'Free Response'
+    else:
+        problem_type = None
+
+    return {
+        'year': int(year_match.group(1)) if year_match else None,
+        'problem_type': problem_type,
+        'problem_num': num_match.group(1) if num_match else None,
+        'group_id': f"{year_match.group(1)}_FRQ_{frq_match.group(1)}" if year_match and frq_match else None,
+        'part_num': int(part_match.group(2)) if part_match else None,
+    }
+
+
+def scan_images(course_dir=DEFAULT_COURSE_DIR):
+    """{filename: path relative to course_dir} of the PNG images in the unit folders.
+
+    An image copied into several unit folders is listed once, from the first
+    folder in name order.
+    """
+    images = {}
+    if not os.path.isdir(course_dir):
+        return images
+    for unit_dir in sorted(os.listdir(course_dir)):
+        unit_path = os.path.join(course_dir, unit_dir)
+        if not unit_dir.startswith('Unit') or not os.path.isdir(unit_path):
+            continue
+        for folder, subfolders, files in os.walk(unit_path):
+            subfolders.sort()
+            for filename in sorted(files):
+                if filename.lower().endswith('.png') and filename not in images:
+                    images[filename] = os.path.relpath(os.path.join(folder, filename), course_dir)
+    return images
+
+
+def sync_catalog(conn, course_dir=DEFAULT_COURSE_DIR, commit=True):
+    """
+    Bring the problems table in line with the course images. Returns counts of what changed.
+
+    With commit=False the caller owns the transaction (see db_writer.write).
+    """
+    images = scan_images(course_dir)
+    existing = {}
+    for row in conn.execute('''
+        SELECT problem_id, problem_number, group_id, part_num, image_path
+        FROM problems
+    '''):
+        existing.setdefault(row[1], row)
+
+    new_rows = []
+    updates = []
+    for filename, image_path in images.items():
+        parsed = parse_problem_filename(filename)
+        row = existing.get(filename)
+        if row is None:
+            year = parsed['year']
+            new_rows.append((filename, f"Problem from {year} AP Statistics Exam", "AP Statistics Exam", year,
+                             parsed['group_id'], parsed['part_num'], image_path))
+            continue
+        wanted = (parsed['group_id'], parsed['part_num'], image_path)
+        if wanted != row[2:]:
+            updates.append((*wanted, row[0]))
+
+    # Problems whose image is gone keep their row but lose the path
+    for filename, row in existing.items():
+        if filename not in images and row[4] is not None:
+            updates.append((row[2], row[3], None, row[0]))
+
+    if new_rows:
+        conn.executemany('''
+            INSERT INTO problems (problem_number, description, source, year, group_id, part_num, image_path)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', new_rows)
+    if updates:
+        conn.executemany('''
+            UPDATE problems
+            SET group_id = ?, part_num = ?, image_path = ?
+            WHERE problem_id = ?
+        ''', updates)
+    if commit and (new_rows or updates):
+        conn.commit()
+
+    return {'images': len(images), 'added': len(new_rows), 'updated': len(updates)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sync the problems table with the course images.')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help='database to sync')
+    parser.add_argument('--course-dir', default=DEFAULT_COURSE_DIR, help='course folder with the unit folders')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"Database file '{args.db}' not found.")
+        return 1
+
+    conn = sqlite3.connect(args.db)
+    try:
+        migrate(conn)
+        counts = sync_catalog(conn, args.course_dir)
+    finally:
+        conn.close()
+
+    print(f"Synced {counts['images']} images: {counts['added']} problems added, {counts['updated']} updated.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,45 +3,19 @@ import sqlite3
 import re
 import glob
 
+from ap_stats_db import SchemaOutOfDate, check_schema
+from integrity import check_integrity, print_report
+
 def get_db_connection():
     """Connect to the SQLite database."""
     conn = sqlite3.connect('ap_stats.db')
     conn.row_factory = sqlite3.Row
     return conn
 
-def list_all_problems():
-    """List all problems in the database."""
-    conn = get_db_connection()
-    problems = conn.execute('SELECT * FROM problems ORDER BY problem_id').fetchall()
-    
-    print(f"\n=== Problems in Database ({len(problems)}) ===")
-    for problem in problems:
-        print(f"ID: {problem['problem_id']}, Number: {problem['problem_number']}, Year: {problem['year']}")
-    
-    conn.close()
-
-def list_all_problem_topic_relationships():
-    """List all problem-topic relationships in the database."""
-    conn = get_db_connection()
-    relationships = conn.execute('''
-        SELECT pt.id, p.problem_id, p.problem_number, t.topic_id, t.topic_number, t.topic_name, u.unit_number, pt.relevance_score
-        FROM problem_topics pt
-        JOIN problems p ON pt.problem_id = p.problem_id
-        JOIN topics t ON pt.topic_id = t.topic_id
-        JOIN units u ON t.unit_id = u.unit_id
-        ORDER BY p.problem_id, t.topic_number
-    ''').fetchall()
-    
-    print(f"\n=== Problem-Topic Relationships ({len(relationships)}) ===")
-    current_problem_id = None
-    for rel in relationships:
-        if rel['problem_id'] != current_problem_id:
-            print(f"\nProblem: {rel['problem_number']} (ID: {rel['problem_id']})")
-            current_problem_id = rel['problem_id']
-        
-        print(f"  - Topic: {rel['topic_number']} {rel['topic_name']} (Unit {rel['unit_number']}, Relevance: {rel['relevance_score']})")
-    
-    conn.close()
+def run_integrity_checks():
+    """Check problems, relationships and images for problems (see integrity.py)."""
+    print()
+    print_report(check_integrity())
 
 def list_all_topics():
     """List all topics in the database."""
@@ -50,7 +24,7 @@ def list_all_topics():
         SELECT t.topic_id, t.topic_number, t.topic_name, u.unit_number, u.unit_name
         FROM topics t
         JOIN units u ON t.unit_id = u.unit_id
-        ORDER BY u.unit_number, t.topic_number
+        ORDER BY t.unit_number, t.topic_seq
     ''').fetchall()
     
     print(f"\n=== Topics in Database ({len(topics)}) ===")
@@ -88,7 +62,7 @@ def manually_assign_topic():
         SELECT t.topic_id, t.topic_number, t.topic_name, u.unit_number, u.unit_name
         FROM topics t
         JOIN units u ON t.unit_id = u.unit_id
-        ORDER BY u.unit_number, t.topic_number
+        ORDER BY t.unit_number, t.topic_seq
     ''').fetchall()
     
     print("\n=== Available Topics ===")
@@ -124,12 +98,16 @@ def manually_assign_topic():
     notes = input("\nEnter notes (optional): ")
     
     # Create the relationship
-    conn.execute('''
-        INSERT INTO problem_topics (problem_id, topic_id, relevance_score, notes)
+    added = conn.execute('''
+        INSERT OR IGNORE INTO problem_topics (problem_id, topic_id, relevance_score, notes)
         VALUES (?, ?, ?, ?)
-    ''', (selected_problem['problem_id'], selected_topic['topic_id'], relevance_score, notes))
+    ''', (selected_problem['problem_id'], selected_topic['topic_id'], relevance_score, notes)).rowcount
     
     conn.commit()
+    if not added:
+        print(f"\nProblem {selected_problem['problem_number']} is already linked to topic {selected_topic['topic_number']}")
+        conn.close()
+        return
     print(f"\nSuccessfully linked problem {selected_problem['problem_number']} to topic {selected_topic['topic_number']}")
     
     conn.close()
@@ -155,28 +133,35 @@ def fix_missing_relationships():
     print("\nFix attempt completed.")
 
 def main():
+    # The listings and checks read columns added by the schema migrations
+    conn = get_db_connection()
+    try:
+        check_schema(conn)
+    except SchemaOutOfDate as e:
+        print(e)
+        return
+    finally:
+        conn.close()
+
     while True:
         print("\n=== Database Check Tool ===")
-        print("1. List all problems")
-        print("2. List all problem-topic relationships")
-        print("3. List all topics")
-        print("4. Manually assign a topic to a problem")
-        print("5. Fix missing relationships")
-        print("6. Exit")
+        print("1. Run integrity checks")
+        print("2. List all topics")
+        print("3. Manually assign a topic to a problem")
+        print("4. Fix missing relationships")
+        print("5. Exit")
         
-        choice = input("\nEnter your choice (1-6): ")
+        choice = input("\nEnter your choice (1-5): ")
         
         if choice == '1':
-            list_all_problems()
+            run_integrity_checks()
         elif choice == '2':
-            list_all_problem_topic_relationships()
-        elif choice == '3':
             list_all_topics()
-        elif choice == '4':
+        elif choice == '3':
             manually_assign_topic()
-        elif choice == '5':
+        elif choice == '4':
             fix_missing_relationships()
-        elif choice == '6':
+        elif choice == '5':
             break
         else:
             print("Invalid choice")
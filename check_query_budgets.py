@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Check that every route stays within its SQL query budget.
+
+Each route is requested once through the Flask test client on a small and
+on a large synthetic corpus, counting the statements it executes (after one
+untimed request to every page, so shared caches are loaded). A route
+fails when it runs more statements than its budget, or when it runs more
+statements on the large corpus than on the small one: the number of
+queries a request makes must not depend on how much data there is, so a
+reintroduced per-row query (N+1) fails this check.
+
+The test suite runs the same check (tests/test_query_budgets.py) on a
+smaller large corpus; run this script to check the full-size one. It exits
+with status 1 on any failure.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+from urllib.parse import quote
+
+import instrumentation
+import synthetic_data
+from benchmark_routes import running_from
+
+# Maximum number of SQL statements per request, including BEGIN/COMMIT
+QUERY_BUDGETS = {
+    'index': 3,
+    'problem_detail': 1,
+    'serve_image': 0,
+    'topics': 1,
+    'topic_detail': 2,
+    'search': 2,
+    'knowledge_tree_data': 2,
+    'update_problem_metadata': 6,
+    'add_problem_topic': 5,
+    'reapply_topics': 6,
+    'remove_problem_topic': 5,
+    'group_detail': 1,
+    'add_group_topic': 3,
+    'remove_group_topic': 3,
+    'assign_topics': 6,
+    'bulk_metadata_api': 5,
+    'jobs_page': 1,
+    'api_job': 1,
+}
+
+SMALL_CORPUS = {'years': 2, 'images': 60, 'links': 180}
+
+
+def build_requests(db_path):
+    """The request made for every budgeted route, as (route, method, path, form data or JSON list)."""
+    conn = sqlite3.connect(db_path)
+    try:
+        # The FRQ with the most parts, and a topic its first part is not linked to yet
+        problem_id, filename, year, problem_num, group_id = conn.execute('''
+            SELECT problem_id, problem_number, year, problem_num, group_id FROM problems
+            WHERE problem_type = 'Free Response'
+            ORDER BY (SELECT COUNT(*) FROM problems other
+                      WHERE other.year = problems.year AND other.problem_num = problems.problem_num
+                        AND other.problem_type = 'Free Response') DESC, problem_id
+            LIMIT 1
+        ''').fetchone()
+        topic_id = conn.execute('''
+            SELECT topic_id FROM topics
+            WHERE topic_id NOT IN (SELECT topic_id FROM problem_topics WHERE problem_id = ?)
+            ORDER BY topic_id LIMIT 1
+        ''', (problem_id,)).fetchone()[0]
+        topic_numbers = [row[0] for row in conn.execute(
+            'SELECT topic_number FROM topics ORDER BY topic_id LIMIT 3')]
+        busiest_topic = conn.execute('''
+            SELECT topic_id FROM problem_topics
+            GROUP BY topic_id ORDER BY COUNT(*) DESC, topic_id LIMIT 1
+        ''').fetchone()[0]
+    finally:
+        conn.close()
+
+    metadata = {
+        'problem_id': problem_id,
+        'year': year,
+        'problem_type': 'Free Response',
+        'problem_num': problem_num,
+        'description': 'Budget check',
+        'difficulty': '3',
+    }
+    return [
+        ('index', 'GET', '/', None),
+        ('problem_detail', 'GET', f'/problem/{quote(filename)}', None),
+        ('serve_image', 'GET', f'/images/{quote(filename)}', None),
+        ('topics', 'GET', '/topics', None),
+        ('topic_detail', 'GET', f'/topic/{busiest_topic}', None),
+        ('search', 'GET', '/search?query=regression', None),
+        ('knowledge_tree_data', 'GET', '/api/knowledge_tree_data', None),
+        ('update_problem_metadata', 'POST', '/update_problem_metadata', metadata),
+        ('add_problem_topic', 'POST', '/add_problem_topic',
+         {'problem_id': problem_id, 'topic_id': topic_id, 'relevance_score': 4, 'apply_to_group': 'on'}),
+        ('reapply_topics', 'POST', '/reapply_topics', {'problem_id': problem_id}),
+        ('remove_problem_topic', 'POST', '/remove_problem_topic',
+         {'problem_id': problem_id, 'topic_id': topic_id, 'remove_from_group': 'on'}),
+        ('group_detail', 'GET', f'/group/{quote(group_id)}', None),
+        ('add_group_topic', 'POST', f'/group/{quote(group_id)}/add_topic', {'topic_id': topic_id, 'relevance_score': 4}),
+        ('remove_group_topic', 'POST', f'/group/{quote(group_id)}/remove_topic', {'topic_id': topic_id}),
+        ('assign_topics', 'POST', '/api/assignments',
+         [{'filename': filename, 'topic_number': number, 'relevance_score': 3} for number in topic_numbers]),
+        ('bulk_metadata_api', 'POST', '/api/metadata?apply=1',
+         [{'problem_id': problem_id, 'year': year + 1, 'difficulty': 2}]),
+        ('jobs_page', 'GET', '/jobs', None),
+        ('api_job', 'GET', '/api/jobs/1', None),
+    ]
+
+
+def measure_queries(corpus_dir):
+    """Statements executed by one request to every budgeted route: {route: count}."""
+    corpus_dir = os.path.abspath(corpus_dir)
+    requests = build_requests(os.path.join(corpus_dir, 'ap_stats.db'))
+    counts = {}
+
+    with running_from(corpus_dir), instrumentation.count_queries() as recorded:
+        from app import create_app
+
+        app = create_app({'TESTING': True, 'DATABASE': os.path.join(corpus_dir, 'ap_stats.db'),
+                          'COURSE_DIR': os.path.join(corpus_dir, 'AP_Statistics_Course')})
+        with app.test_client() as client:
+            # Budgets are for the steady state: load the shared course tree first,
+            # but measure the home page rendering rather than a page cache hit
+            for route, method, path, data in requests:
+                if method == 'GET':
+                    client.get(path).close()
+            app.extensions['page_cache'].clear()
+
+            for route, method, path, data in requests:
+                recorded.clear()
+                if isinstance(data, list):
+                    client.open(path, method=method, json=data).close()
+                else:
+                    client.open(path, method=method, data=data).close()
+                counts[route] = sum(count for endpoint, count in recorded if endpoint == route)
+
+            # Write the operations the POST routes logged while the corpus still exists
+            app.extensions['operation_log'].flush()
+
+    return counts
+
+
+def check_budgets(small, large, budgets=QUERY_BUDGETS):
+    """Failures as (route, message) pairs for the counts measured on both corpora."""
+    failures = []
+    for route, budget in budgets.items():
+        for label, counts in (('small', small), ('large', large)):
+            if counts.get(route, 0) > budget:
+                failures.append((route, f"{counts[route]} queries on the {label} corpus, budget is {budget}"))
+        if large.get(route, 0) > small.get(route, 0):
+            failures.append((route, f"queries grow with data size ({small.get(route, 0)} -> {large[route]})"))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the SQL query budget of every route.')
+    parser.add_argument('--years', type=int, default=synthetic_data.DEFAULT_YEARS, help='years in the large corpus')
+    parser.add_argument('--images', type=int, default=synthetic_data.DEFAULT_IMAGES, help='images in the large corpus')
+    parser.add_argument('--links', type=int, default=synthetic_data.DEFAULT_LINKS, help='links in the large corpus')
+    parser.add_argument('--seed', type=int, default=synthetic_data.DEFAULT_SEED, help='generator seed')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='apstats-budget-') as temp_dir:
+        small_dir = os.path.join(temp_dir, 'small')
+        large_dir = os.path.join(temp_dir, 'large')
+        synthetic_data.generate_corpus(small_dir, seed=args.seed, **SMALL_CORPUS)
+        synthetic_data.generate_corpus(large_dir, args.years, args.images, args.links, args.seed)
+        small = measure_queries(small_dir)
+        large = measure_queries(large_dir)
+
+    print(f"=== SQL queries per request ({SMALL_CORPUS['images']} vs {args.images} images) ===")
+    print(f"{'route':<26}{'small':>7}{'large':>7}{'budget':>8}")
+    for route, budget in QUERY_BUDGETS.items():
+        print(f"{route:<26}{small.get(route, 0):>7}{large.get(route, 0):>7}{budget:>8}")
+
+    failures = check_budgets(small, large)
+    if not failures:
+        print("\nAll routes are within their query budgets.")
+        return 0
+
+    print(f"\n{len(failures)} budget failure(s):")
+    for route, message in failures:
+        print(f"  - {route}: {message}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
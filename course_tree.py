@@ -0,0 +1,143 @@
+"""
+Immutable in-memory copy of the course structure (units and topics).
+
+Units and topics only change when the knowledge tree is imported, so the
+web app loads them once into a CourseTree and shares it between requests.
+Every request checks the structure version kept in app_meta (bumped by
+triggers on units and topics) and the tree is reloaded only when it has
+changed. Units and topics are read in course order from the integer
+unit_number and topic_seq columns (so "1.10" comes after "1.9") and kept
+in that order.
+"""
+
+import os
+import threading
+from types import MappingProxyType
+
+from ap_stats_db import get_structure_version
+
+
+class _Frozen:
+    """Base for slotted objects whose attributes cannot change once built."""
+    __slots__ = ()
+
+    def __init__(self, **values):
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__[:3])
+        return f"{type(self).__name__}({fields})"
+
+
+class Unit(_Frozen):
+    __slots__ = ('unit_id', 'unit_number', 'unit_name', 'full_path', 'topics')
+
+
+class Topic(_Frozen):
+    __slots__ = ('topic_id', 'unit_id', 'topic_number', 'topic_name', 'full_path', 'topic_seq', 'unit')
+
+    @property
+    def unit_number(self):
+        return self.unit.unit_number if self.unit else None
+
+    @property
+    def unit_name(self):
+        return self.unit.unit_name if self.unit else None
+
+
+class TopicLink(_Frozen):
+    """A topic linked to a problem; reads the topic's attributes through to it."""
+    __slots__ = ('topic', 'relevance_score', 'notes')
+
+    def __getattr__(self, name):
+        if name == 'topic':
+            raise AttributeError(name)
+        return getattr(self.topic, name)
+
+
+class CourseTree(_Frozen):
+    """All units and topics in course order, with lookups by id and number."""
+    __slots__ = ('version', 'units', 'topics', 'units_by_id', 'units_by_number',
+                 'topics_by_id', 'topics_by_number')
+
+    @classmethod
+    def load(cls, conn, version=None):
+        """Build the tree from the units and topics tables (two queries, both already in course order)."""
+        units = {}
+        for unit_id, unit_number, unit_name, full_path in conn.execute(
+                'SELECT unit_id, unit_number, unit_name, full_path FROM units ORDER BY unit_number'):
+            units[unit_id] = Unit(unit_id=unit_id, unit_number=unit_number, unit_name=unit_name,
+                                  full_path=full_path, topics=())
+
+        topics = []
+        topics_by_unit = {}
+        for topic_id, unit_id, topic_number, topic_name, full_path, seq in conn.execute('''
+                SELECT topic_id, unit_id, topic_number, topic_name, full_path, topic_seq
+                FROM topics ORDER BY unit_number, topic_seq'''):
+            topic = Topic(topic_id=topic_id, unit_id=unit_id, topic_number=topic_number, topic_name=topic_name,
+                          full_path=full_path, topic_seq=seq, unit=units.get(unit_id))
+            topics.append(topic)
+            topics_by_unit.setdefault(unit_id, []).append(topic)
+
+        ordered_units = list(units.values())
+        for unit in ordered_units:
+            # Set once while the tree is built, before anything else can see it
+            object.__setattr__(unit, 'topics', tuple(topics_by_unit.get(unit.unit_id, ())))
+        topics = tuple(topics)
+
+        return cls(
+            version=version,
+            units=tuple(ordered_units),
+            topics=topics,
+            units_by_id=MappingProxyType({unit.unit_id: unit for unit in ordered_units}),
+            units_by_number=MappingProxyType({unit.unit_number: unit for unit in ordered_units}),
+            topics_by_id=MappingProxyType({topic.topic_id: topic for topic in topics}),
+            topics_by_number=MappingProxyType({topic.topic_number: topic for topic in topics}),
+        )
+
+    def topic(self, topic_id):
+        """The topic with this id (an int or a numeric string), or None."""
+        try:
+            return self.topics_by_id.get(int(topic_id))
+        except (TypeError, ValueError):
+            return None
+
+    def linked_topics(self, links):
+        """(topic_id, relevance_score, notes) rows as TopicLinks, in the same order, skipping unknown topics."""
+        return [TopicLink(topic=self.topics_by_id[topic_id], relevance_score=relevance_score, notes=notes)
+                for topic_id, relevance_score, notes in links if topic_id in self.topics_by_id]
+
+    def search_topics(self, query):
+        """Topics whose number or name contains query, ignoring case."""
+        query = query.lower()
+        return [topic for topic in self.topics
+                if query in (topic.topic_number or '').lower() or query in (topic.topic_name or '').lower()]
+
+
+_trees = {}
+_trees_lock = threading.Lock()
+
+
+def get_course_tree(conn, db_path='ap_stats.db', version=None):
+    """
+    The shared tree for the database at db_path, reloaded if the structure has changed.
+
+    Pass the structure version if it was already read with another query.
+    """
+    key = os.path.abspath(db_path)
+    if version is None:
+        version = get_structure_version(conn)
+    tree = _trees.get(key)
+    if tree is None or tree.version != version:
+        with _trees_lock:
+            tree = _trees.get(key)
+            if tree is None or tree.version != version:
+                tree = _trees[key] = CourseTree.load(conn, version)
+    return tree
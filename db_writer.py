@@ -0,0 +1,205 @@
+"""
+Single writer for the database, so concurrent editors do not fight over the lock.
+
+SQLite lets one connection write at a time. When several teachers save at
+once, each request thread waits for the lock on its own and the slowest
+ones fail with "database is locked". With the writer enabled (DB_WRITER
+config value or APSTATS_DB_WRITER=1) the write routes hand their writes
+to one background thread instead. It takes operations from a queue, runs
+the ones that arrive within BATCH_WINDOW seconds of each other (up to
+BATCH_SIZE) in one transaction, each in its own savepoint, and resolves
+every request's future once the transaction is committed. Reads are not
+affected: they still run on the request's own connection. The operation
+log and the session store hand their writes to the same thread (a session
+database other than the app's, SESSION_DB, has its own lock and does not).
+The job runner still writes its jobs rows itself: a few one-row updates
+per job, also made by the serve.py master, which runs no writer thread.
+
+Without the writer, write() runs the operation on the request's own
+connection, in the same kind of transaction.
+
+An operation is a function taking a connection. It must not commit or
+roll back; raising an exception undoes only its own changes.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+
+from flask import current_app
+
+import instrumentation
+import metrics
+
+DEFAULT_BATCH_WINDOW = 0.005  # seconds to wait for more operations to join a batch
+DEFAULT_BATCH_SIZE = 50  # operations per transaction
+DEFAULT_TIMEOUT = 30.0  # seconds a request waits for its write
+
+
+def connect(db_path):
+    """A connection for running operations, with rows readable by column name."""
+    conn = instrumentation.connect(db_path, timeout=10)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+@contextmanager
+def transaction(conn):
+    """Run the block in an IMMEDIATE transaction, committed if it does not raise."""
+    # Taking the write lock up front means reads in the block see the data
+    # the writes are based on, and the lock is never upgraded halfway
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+class DbWriter:
+    """Background thread running queued write operations in batched transactions."""
+
+    def __init__(self, db_path, batch_window=DEFAULT_BATCH_WINDOW, batch_size=DEFAULT_BATCH_SIZE):
+        self.db_path = os.path.abspath(db_path)
+        self.batch_window = batch_window
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._thread_pid = None
+
+    def queue_depth(self):
+        """Operations waiting for the writer."""
+        return self._queue.qsize()
+
+    def submit(self, operation):
+        """Queue operation(conn) and return a Future for its result."""
+        future = Future()
+        self._queue.put((operation, future, time.perf_counter()))
+        self._start()
+        return future
+
+    def run(self, operation, timeout=DEFAULT_TIMEOUT):
+        """
+        Queue operation(conn) and wait for its result (or its exception).
+
+        After `timeout` seconds TimeoutError is raised and the operation is
+        cancelled if the writer has not started it yet. One already running
+        cannot be stopped and is still committed, so a timeout means the
+        outcome is unknown, not that the write failed.
+        """
+        future = self.submit(operation)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    def _start(self):
+        # A forked worker does not inherit the parent's thread, so start one per process
+        if self._thread is not None and self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+            self._thread.start()
+
+    def _next_batch(self):
+        """Block for one operation, then take the ones arriving within the batch window."""
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.batch_window
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = connect(self.db_path)
+        while True:
+            batch = self._next_batch()
+            # Futures cancelled by a request that gave up waiting are skipped
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if batch:
+                self._write_batch(conn, batch)
+
+    def _write_batch(self, conn, batch):
+        started = time.perf_counter()
+        outcomes = []
+        try:
+            with transaction(conn):
+                for index, (operation, future, queued) in enumerate(batch):
+                    conn.execute(f'SAVEPOINT op{index}')
+                    try:
+                        outcomes.append((True, operation(conn)))
+                    except Exception as e:
+                        conn.execute(f'ROLLBACK TO op{index}')
+                        outcomes.append((False, e))
+                    conn.execute(f'RELEASE op{index}')
+        except Exception as e:
+            # The commit (or a savepoint statement) failed: nothing in the batch was written
+            for operation, future, queued in batch:
+                future.set_exception(e)
+            metrics.record_db_write_batch(len(batch), time.perf_counter() - started, len(batch), ())
+            return
+
+        # Results are only handed out once they are committed
+        finished = time.perf_counter()
+        for (operation, future, queued), (ok, value) in zip(batch, outcomes):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+        metrics.record_db_write_batch(len(batch), finished - started,
+                                      sum(1 for ok, _ in outcomes if not ok),
+                                      [finished - queued for _, _, queued in batch])
+
+
+def write(operation, conn=None):
+    """
+    Run operation(conn) as one write of the current request and return its result.
+
+    Goes through the app's writer when it is enabled, otherwise runs in a
+    transaction on conn (the request's own connection) or a new one.
+    """
+    writer = current_app.extensions.get('db_writer')
+    if writer is not None:
+        return writer.run(operation)
+
+    if conn is not None:
+        with transaction(conn):
+            return operation(conn)
+
+    conn = connect(current_app.extensions['db_writer_path'])
+    try:
+        with transaction(conn):
+            return operation(conn)
+    finally:
+        conn.close()
+
+
+def init_app(app, db_path='ap_stats.db'):
+    """Set up write() for the app, with a writer thread if DB_WRITER (or APSTATS_DB_WRITER=1) is set."""
+    app.extensions['db_writer_path'] = db_path
+    enabled = app.config.get('DB_WRITER', os.environ.get('APSTATS_DB_WRITER', '') in ('1', 'true'))
+    if not enabled:
+        app.extensions['db_writer'] = None
+        return
+
+    writer = DbWriter(db_path,
+                      app.config.get('DB_WRITER_BATCH_WINDOW', DEFAULT_BATCH_WINDOW),
+                      app.config.get('DB_WRITER_BATCH_SIZE', DEFAULT_BATCH_SIZE))
+    app.extensions['db_writer'] = writer
+
+    def depth():
+        yield (), writer.queue_depth()
+    metrics.GaugeFunction('apstats_db_writer_queue_depth', 'Write operations waiting for the writer thread.', depth)
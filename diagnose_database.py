@@ -1,6 +1,9 @@
 import os
 import sqlite3
 
+from ap_stats_db import SchemaOutOfDate, check_schema
+from integrity import print_report, run_checks
+
 def diagnose_database():
     """Check the database and print detailed information."""
     # Check if the database file exists
@@ -31,6 +34,14 @@ def diagnose_database():
         except Exception as e:
             print(f"ERROR: Table '{table}' does not exist or cannot be accessed: {e}")
     
+    # The listings below use columns added by the schema migrations
+    try:
+        check_schema(conn)
+    except SchemaOutOfDate as e:
+        print(f"ERROR: {e}")
+        conn.close()
+        return
+    
     # Check units
     try:
         cursor.execute("SELECT * FROM units ORDER BY unit_number")
@@ -47,7 +58,7 @@ def diagnose_database():
             SELECT t.*, u.unit_number, u.unit_name 
             FROM topics t
             JOIN units u ON t.unit_id = u.unit_id
-            ORDER BY u.unit_number, t.topic_number
+            ORDER BY t.unit_number, t.topic_seq
         """)
         topics = cursor.fetchall()
         print(f"\nTopics ({len(topics)}):")
@@ -60,36 +71,14 @@ def diagnose_database():
     except Exception as e:
         print(f"ERROR: Failed to query topics: {e}")
     
-    # Check problems
-    try:
-        cursor.execute("SELECT * FROM problems ORDER BY problem_id")
-        problems = cursor.fetchall()
-        print(f"\nProblems ({len(problems)}):")
-        for problem in problems:
-            print(f"  - ID: {problem['problem_id']}, Number: {problem['problem_number']}, Year: {problem['year']}")
-    except Exception as e:
-        print(f"ERROR: Failed to query problems: {e}")
-    
-    # Check problem-topic relationships
+    # Check problems and problem-topic relationships as a whole instead of listing every row
     try:
-        cursor.execute("""
-            SELECT pt.*, p.problem_number, t.topic_number, t.topic_name, u.unit_number
-            FROM problem_topics pt
-            JOIN problems p ON pt.problem_id = p.problem_id
-            JOIN topics t ON pt.topic_id = t.topic_id
-            JOIN units u ON t.unit_id = u.unit_id
-            ORDER BY p.problem_id, t.topic_number
-        """)
-        relationships = cursor.fetchall()
-        print(f"\nProblem-Topic Relationships ({len(relationships)}):")
-        current_problem_id = None
-        for rel in relationships:
-            if rel['problem_id'] != current_problem_id:
-                print(f"\n  Problem: {rel['problem_number']} (ID: {rel['problem_id']})")
-                current_problem_id = rel['problem_id']
-            print(f"    - Topic: {rel['topic_number']} {rel['topic_name']} (Unit {rel['unit_number']}, Relevance: {rel['relevance_score']})")
+        report = run_checks(conn)
+        report['database'] = db_path
+        print()
+        print_report(report)
     except Exception as e:
-        print(f"ERROR: Failed to query problem-topic relationships: {e}")
+        print(f"ERROR: Failed to run integrity checks: {e}")
     
     # Close the connection
     conn.close()
@@ -1,173 +1,677 @@
 #!/usr/bin/env python3
 """
-Export script to create a clean JSON file of MCQ problems from the AP Stats database.
+Export script to create JSON files of problems from the AP Stats database.
 This script exports problems in the format expected by the main web application.
+
+Rows are streamed from the database cursor and grouped on the fly, so the
+export never holds the whole question bank in memory. MCQs are exported as
+single questions and FRQs as groups with their parts in order. Questions are
+written to compact per-unit shard files plus a small index manifest, so the
+app can load only the unit a student is studying.
 """
 
-import sqlite3
+import argparse
+import hashlib
 import json
 import os
+import re
+import sqlite3
+import sys
+import time
 from collections import defaultdict
+from itertools import groupby
+
+from ap_stats_db import SchemaOutOfDate, check_schema
+
+DEFAULT_OUTPUT_DIR = 'questions_export'
+LEGACY_OUTPUT_FILE = 'questions_export.json'
+INDEX_FILE = 'index.json'
+STATE_FILE = 'export_state.json'
+CHANGELOG_FILE = 'changelog.jsonl'
+LEGACY_STATE_KEY = 'legacy'
+LESSONS_FILE = 'lessons.json'
+DEFAULT_LESSONS_SOURCE = 'allUnitsData.js'
+BUNDLE_FILE = 'questions.sqlite'
+BUNDLE_PAGE_SIZE = 4096
+
+# Compact JSON output - the files are for machines, not for reading
+JSON_SEPARATORS = (',', ':')
 
 def connect_to_database(db_path='ap_stats.db'):
     """Connect to the SQLite database and return connection."""
     if not os.path.exists(db_path):
         raise FileNotFoundError(f"Database file '{db_path}' not found.")
-    
+
     conn = sqlite3.connect(db_path)
     conn.row_factory = sqlite3.Row  # This allows us to access columns by name
+    try:
+        check_schema(conn)  # The export reads columns added by schema migrations
+    except SchemaOutOfDate:
+        conn.close()
+        raise
     return conn
 
-def get_mcq_problems_data(conn):
+def iter_problem_rows(conn):
     """
-    Execute SQL query to get all MCQ problems with their associated topics and units.
-    Returns a list of problem data dictionaries.
+    Stream all linked problems with their topics and units, one row per link.
+
+    FRQs are ordered after MCQs and by year and stored group id (set by the
+    catalog from the file name), so all parts of an FRQ group arrive next to
+    each other. Rows of one problem are always consecutive.
     """
-    
-    # SQL query to get all necessary data with JOINs
     query = """
-    SELECT DISTINCT
+    SELECT
         p.problem_id,
         p.problem_number,
         p.year,
         p.source,
+        p.problem_type,
+        p.problem_num,
+        p.group_id,
+        p.part_num,
+        u.unit_number,
         u.full_path as unit_path,
-        t.topic_number
+        t.topic_number,
+        CASE WHEN p.problem_type = 'Free Response' OR p.problem_number LIKE '%FRQ%'
+             THEN 1 ELSE 0 END as is_frq
     FROM problems p
     JOIN problem_topics pt ON p.problem_id = pt.problem_id
     JOIN topics t ON pt.topic_id = t.topic_id
     JOIN units u ON t.unit_id = u.unit_id
-    WHERE p.problem_number LIKE '%MCQ%'
-    ORDER BY p.problem_id, t.topic_number
+    ORDER BY is_frq, p.year, p.group_id, CAST(p.problem_num AS INTEGER), p.problem_number,
+             p.problem_id, t.unit_number, t.topic_seq
     """
-    
-    cursor = conn.cursor()
-    cursor.execute(query)
-    return cursor.fetchall()
 
-def process_problem_data(raw_data):
+    # Iterating the cursor fetches rows lazily instead of calling fetchall()
+    return conn.execute(query)
+
+def iter_problems(rows):
+    """Group consecutive rows by problem_id into one problem dictionary each."""
+    for problem_id, problem_rows in groupby(rows, key=lambda row: row['problem_id']):
+        first = next(problem_rows)
+
+        # Construct the image path by combining unit path and problem filename
+        # Convert Windows backslashes to forward slashes for web compatibility
+        unit_path = first['unit_path'].replace('\\', '/')
+
+        problem = {
+            'id': problem_id,
+            'filename': first['problem_number'],
+            'questionImage': f"{unit_path}/{first['problem_number']}",
+            'year': first['year'],
+            'source': first['source'] if first['source'] else 'AP Exam',
+            'is_frq': bool(first['is_frq']),
+            'problem_num': first['problem_num'],
+            'group_id': first['group_id'],
+            'part_num': first['part_num'],
+            'units': set(),
+            'topics': set(),
+        }
+
+        for row in [first, *problem_rows]:
+            # Transform topic number from "X.Y" format to "X-Y" format
+            problem['topics'].add(row['topic_number'].replace('.', '-'))
+            problem['units'].add(row['unit_number'])
+
+        yield problem
+
+def lesson_sort_key(lesson_id):
+    """Sort lesson ids like "1-10" in natural order (after "1-9")."""
+    return tuple(int(part) if part.isdigit() else 0 for part in lesson_id.split('-'))
+
+def frq_group_id(problem):
+    """The group id of an FRQ part (e.g. 2019_FRQ_1), as stored by the catalog for the web app."""
+    # An FRQ whose file name has no FRQ number is a question on its own
+    return problem['group_id'] or f"{problem['year']}_FRQ_{problem['id']}"
+
+def iter_questions(problems):
     """
-    Process the raw database results into the final JSON structure.
-    Groups multiple topics per problem and transforms topic numbers.
+    Turn the problem stream into exported questions.
+
+    Each MCQ becomes one question. Consecutive FRQ parts with the same group id
+    become one FRQ question with its parts in order.
+    Yields (question, unit_numbers) tuples.
     """
-    
-    # Group problems by problem_id since one problem can have multiple topics
-    problems_dict = {}
-    
-    # Process each row from the database
-    for row in raw_data:
-        problem_id = row['problem_id']
-        
-        # Initialize problem entry if it doesn't exist
-        if problem_id not in problems_dict:
-            # Construct the image path by combining unit path and problem filename
-            # Convert Windows backslashes to forward slashes for web compatibility
-            unit_path = row['unit_path'].replace('\\', '/')
-            question_image = f"{unit_path}/{row['problem_number']}"
-            
-            problems_dict[problem_id] = {
-                'problem_data': {
-                    'id': problem_id,
-                    'questionImage': question_image,
-                    'year': row['year'],
-                    'source': row['source'] if row['source'] else 'AP Exam'
-                },
-                'topics': []
+    def group_key(problem):
+        return frq_group_id(problem) if problem['is_frq'] else problem['id']
+
+    for key, group in groupby(problems, key=group_key):
+        parts = list(group)  # A single MCQ, or the few parts of one FRQ
+        lesson_ids = set().union(*(part['topics'] for part in parts))
+        units = set().union(*(part['units'] for part in parts))
+        first = parts[0]
+
+        if not first['is_frq']:
+            question = {
+                'id': first['id'],
+                'type': 'MCQ',
+                'questionImage': first['questionImage'],
+                'year': first['year'],
+                'source': first['source'],
+                'linkedLessonIds': sorted(lesson_ids, key=lesson_sort_key),
+            }
+        else:
+            question = {
+                'id': key,
+                'type': 'FRQ',
+                'year': first['year'],
+                'source': first['source'],
+                'linkedLessonIds': sorted(lesson_ids, key=lesson_sort_key),
+                'parts': [
+                    {
+                        'id': part['id'],
+                        'part': index,
+                        'questionImage': part['questionImage'],
+                        'linkedLessonIds': sorted(part['topics'], key=lesson_sort_key),
+                    }
+                    for index, part in enumerate(
+                        sorted(parts, key=lambda p: (p['part_num'] or 0, p['filename'].lower())), 1)
+                ],
             }
-        
-        # Transform topic number from "X.Y" format to "X-Y" format
-        topic_number = row['topic_number']
-        linked_lesson_id = topic_number.replace('.', '-')
-        
-        # Add this topic to the problem's topic list (avoid duplicates)
-        if linked_lesson_id not in problems_dict[problem_id]['topics']:
-            problems_dict[problem_id]['topics'].append(linked_lesson_id)
-    
-    # Convert to final format
-    final_problems = []
-    for problem_id, problem_info in problems_dict.items():
-        problem_data = problem_info['problem_data']
-        problem_data['linkedLessonIds'] = sorted(problem_info['topics'])  # Sort for consistency
-        final_problems.append(problem_data)
-    
-    # Sort by problem ID for consistent output
-    final_problems.sort(key=lambda x: x['id'])
-    
-    return final_problems
-
-def write_json_export(problems_data, output_file='questions_export.json'):
-    """Write the processed problem data to a JSON file with pretty formatting."""
-    
+
+        yield question, units
+
+class JsonArrayWriter:
+    """
+    Write a compact JSON array to a file one item at a time.
+
+    Items go to a temporary file next to the target while a hash of the
+    content is computed. On close the temporary file only replaces the target
+    if the content changed, so unchanged files are never rewritten and
+    readers never see a partly written file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.temp_path = f"{path}.tmp"
+        self.count = 0
+        self._hash = hashlib.sha256()
+        self._file = open(self.temp_path, 'w', encoding='utf-8')
+        self._write('[')
+
+    def _write(self, text):
+        self._file.write(text)
+        self._hash.update(text.encode('utf-8'))
+
+    def write(self, item):
+        if self.count:
+            self._write(',')
+        self._write(json.dumps(item, ensure_ascii=False, separators=JSON_SEPARATORS))
+        self.count += 1
+
+    def close(self, previous_hash=None):
+        """Finish the file. Returns (content_hash, size_in_bytes, changed)."""
+        self._write(']')
+        self._file.close()
+        content_hash = self._hash.hexdigest()
+
+        changed = content_hash != previous_hash or not os.path.exists(self.path)
+        if changed:
+            os.replace(self.temp_path, self.path)
+        else:
+            os.remove(self.temp_path)
+
+        return content_hash, os.path.getsize(self.path), changed
+
+    def discard(self):
+        """Abandon the file, leaving any existing target untouched."""
+        self._file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+def atomic_write_json(path, data):
+    """Write a JSON file through a temporary file and rename it into place."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=JSON_SEPARATORS)
+    os.replace(temp_path, path)
+
+def load_json(path, default=None):
+    """Load a JSON file written by a previous export, if there is one."""
     try:
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(problems_data, f, indent=2, ensure_ascii=False)
-        
-        print(f"✅ Successfully exported {len(problems_data)} MCQ problems to '{output_file}'")
-        print(f"📊 Export Summary:")
-        print(f"   - Total MCQ problems: {len(problems_data)}")
-        
-        # Show some statistics
-        total_topics = sum(len(p['linkedLessonIds']) for p in problems_data)
-        print(f"   - Total topic associations: {total_topics}")
-        print(f"   - Average topics per problem: {total_topics/len(problems_data):.1f}")
-        
-        # Show year distribution
-        year_counts = defaultdict(int)
-        for problem in problems_data:
-            year_counts[problem['year']] += 1
-        
-        print(f"   - Year distribution:")
-        for year in sorted(year_counts.keys()):
-            print(f"     * {year}: {year_counts[year]} problems")
-            
-    except Exception as e:
-        print(f"❌ Error writing to file '{output_file}': {e}")
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return default
+
+def question_hash(question):
+    """Stable content hash of one exported question."""
+    content = json.dumps(question, ensure_ascii=False, sort_keys=True, separators=JSON_SEPARATORS)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+def shard_filename(unit_number):
+    """File name of the shard holding one unit's questions."""
+    return f"unit-{unit_number}.json"
+
+def is_shard_filename(filename):
+    """Whether a file name belongs to a unit shard."""
+    return re.fullmatch(r'unit-\d+\.json', filename) is not None
+
+def load_lesson_ids(lessons_source=DEFAULT_LESSONS_SOURCE):
+    """
+    Read the lesson ids (e.g. "1-10") from the app's allUnitsData.js.
+
+    Returns the ids in the order the app lists them.
+    """
+    with open(lessons_source, 'r', encoding='utf-8') as f:
+        content = f.read()
+    return re.findall(r'^\s*id:\s*["\']([^"\']+)["\']', content, re.MULTILINE)
+
+def build_lesson_index(lesson_questions, lesson_ids):
+    """
+    Build the lesson -> question ids reverse index.
+
+    Every lesson of the app is listed, in the app's order, so lessons without
+    practice questions get an empty list and a count of 0.
+    """
+    return {
+        'questionIds': {lesson_id: lesson_questions.get(lesson_id, []) for lesson_id in lesson_ids},
+        'counts': {lesson_id: len(lesson_questions.get(lesson_id, [])) for lesson_id in lesson_ids},
+    }
+
+def write_json_if_changed(path, data, previous_hash=None):
+    """Atomically write a JSON file unless its content hash is unchanged. Returns (hash, changed)."""
+    content = json.dumps(data, ensure_ascii=False, separators=JSON_SEPARATORS)
+    content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+    if content_hash == previous_hash and os.path.exists(path):
+        return content_hash, False
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(temp_path, path)
+    return content_hash, True
+
+def export_questions(conn, output_dir=DEFAULT_OUTPUT_DIR, legacy_file=LEGACY_OUTPUT_FILE, force=False,
+                     lessons_source=DEFAULT_LESSONS_SOURCE):
+    """
+    Stream all questions into per-unit shards and write the index manifest.
+
+    A question linked to topics in several units is written to each of those
+    unit shards. If `legacy_file` is set, MCQs are also written to it in the
+    original single-file format.
+
+    Content hashes from the previous export (kept in export_state.json) are
+    used to rewrite only the shards whose content changed. When anything
+    changed, the added, removed and changed question ids are appended to
+    changelog.jsonl for downstream cache invalidation.
+
+    A lesson -> question ids reverse index keyed by the allUnitsData.js
+    lesson ids is written to lessons.json. Every linked lesson id must exist
+    in `lessons_source`, otherwise nothing is written and ValueError is
+    raised. Returns the index manifest with a 'changes' summary of this run.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    start_time = time.perf_counter()
+
+    state_path = os.path.join(output_dir, STATE_FILE)
+    previous_state = load_json(state_path, {})
+    # --force ignores the stored hashes, so every file is rewritten, but the
+    # list of files is still needed to remove the shards of units now empty
+    previous_files = previous_state.get('files', {})
+    previous_hashes = {} if force else previous_files
+    previous_questions = {} if force else previous_state.get('questions', {})
+
+    lesson_ids = load_lesson_ids(lessons_source)
+    known_lessons = set(lesson_ids)
+    lesson_questions = defaultdict(list)
+    unknown_lessons = defaultdict(list)
+
+    shards = {}
+    legacy = JsonArrayWriter(legacy_file) if legacy_file else None
+    question_hashes = {}
+    counts = defaultdict(int)
+    year_counts = defaultdict(int)
+    total_links = 0
+
+    try:
+        rows = iter_problem_rows(conn)
+        for question, units in iter_questions(iter_problems(rows)):
+            question_hashes[str(question['id'])] = question_hash(question)
+            counts[question['type']] += 1
+            year_counts[question['year']] += 1
+            total_links += len(question['linkedLessonIds'])
+
+            for lesson_id in question['linkedLessonIds']:
+                if lesson_id in known_lessons:
+                    lesson_questions[lesson_id].append(question['id'])
+                else:
+                    unknown_lessons[lesson_id].append(question['id'])
+
+            for unit_number in sorted(units):
+                if unit_number not in shards:
+                    shards[unit_number] = JsonArrayWriter(
+                        os.path.join(output_dir, shard_filename(unit_number)))
+                shards[unit_number].write(question)
+
+            if legacy and question['type'] == 'MCQ':
+                legacy.write({key: value for key, value in question.items() if key != 'type'})
+
+        if unknown_lessons:
+            details = ', '.join(f"{lesson_id} (questions {questions})"
+                                for lesson_id, questions in sorted(unknown_lessons.items()))
+            raise ValueError(f"Lesson ids not found in {lessons_source}: {details}")
+    except Exception:
+        for writer in shards.values():
+            writer.discard()
+        if legacy:
+            legacy.discard()
         raise
 
+    # Finish the shards, replacing only those whose content changed
+    file_hashes = {}
+    shard_info = {}
+    changed_files = []
+    for unit_number in sorted(shards):
+        filename = shard_filename(unit_number)
+        content_hash, size, changed = shards[unit_number].close(previous_hashes.get(filename))
+        file_hashes[filename] = content_hash
+        shard_info[unit_number] = (filename, content_hash, size)
+        if changed:
+            changed_files.append(filename)
+
+    # Remove shards of units that no longer have any questions, including
+    # any left over from an export whose state file is gone
+    for filename in sorted(set(previous_files) | set(os.listdir(output_dir))):
+        if filename not in file_hashes and is_shard_filename(filename):
+            stale_path = os.path.join(output_dir, filename)
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
+            changed_files.append(filename)
+
+    if legacy:
+        content_hash, _, changed = legacy.close(previous_hashes.get(LEGACY_STATE_KEY))
+        file_hashes[LEGACY_STATE_KEY] = content_hash
+        if changed:
+            changed_files.append(legacy_file)
+
+    lesson_index = build_lesson_index(lesson_questions, lesson_ids)
+    content_hash, changed = write_json_if_changed(os.path.join(output_dir, LESSONS_FILE), lesson_index,
+                                                  previous_hashes.get(LESSONS_FILE))
+    file_hashes[LESSONS_FILE] = content_hash
+    if changed:
+        changed_files.append(LESSONS_FILE)
+
+    added = sorted(set(question_hashes) - set(previous_questions))
+    removed = sorted(set(previous_questions) - set(question_hashes))
+    changed = sorted(question_id for question_id, content_hash in question_hashes.items()
+                     if question_id in previous_questions and previous_questions[question_id] != content_hash)
+
+    index = {
+        'generatedAt': int(time.time()),
+        'totalQuestions': sum(counts.values()),
+        'questionTypes': dict(counts),
+        'totalLessonLinks': total_links,
+        'years': {str(year): count for year, count in sorted(year_counts.items(), key=lambda item: str(item[0]))},
+        'lessonIndex': LESSONS_FILE,
+        'lessonsWithQuestions': sum(1 for count in lesson_index['counts'].values() if count),
+        'units': [
+            {
+                'unit': unit_number,
+                'file': filename,
+                'questions': shards[unit_number].count,
+                'bytes': size,
+                'hash': content_hash,
+            }
+            for unit_number, (filename, content_hash, size) in shard_info.items()
+        ],
+    }
+
+    index_path = os.path.join(output_dir, INDEX_FILE)
+    if changed_files or not os.path.exists(index_path):
+        atomic_write_json(index_path, index)
+        atomic_write_json(state_path, {'files': file_hashes, 'questions': question_hashes})
+
+    if changed_files:
+        change_record = {
+            'generatedAt': index['generatedAt'],
+            'added': added,
+            'removed': removed,
+            'changed': changed,
+            'files': sorted(changed_files),
+        }
+        with open(os.path.join(output_dir, CHANGELOG_FILE), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(change_record, ensure_ascii=False, separators=JSON_SEPARATORS) + '\n')
+
+    index['changes'] = {'added': added, 'removed': removed, 'changed': changed, 'files': sorted(changed_files)}
+    index['durationSeconds'] = time.perf_counter() - start_time
+    return index
+
+BUNDLE_SCHEMA = """
+CREATE TABLE units (
+    unit_id INTEGER PRIMARY KEY,
+    unit_number INTEGER NOT NULL,
+    unit_name TEXT NOT NULL
+);
+CREATE TABLE topics (
+    topic_id INTEGER PRIMARY KEY,
+    unit_id INTEGER NOT NULL REFERENCES units (unit_id),
+    topic_number TEXT NOT NULL,
+    lesson_id TEXT NOT NULL,
+    topic_name TEXT NOT NULL
+);
+CREATE TABLE problems (
+    problem_id INTEGER PRIMARY KEY,
+    filename TEXT NOT NULL,
+    question_image TEXT NOT NULL,
+    year INTEGER,
+    problem_type TEXT NOT NULL,
+    group_id TEXT,
+    part INTEGER,
+    source TEXT
+);
+CREATE TABLE problem_topics (
+    topic_id INTEGER NOT NULL REFERENCES topics (topic_id),
+    problem_id INTEGER NOT NULL REFERENCES problems (problem_id),
+    PRIMARY KEY (topic_id, problem_id)
+) WITHOUT ROWID;
+"""
+
+# Created after loading so rows are inserted without index maintenance.
+# Each index covers its lookup, so queries never touch the base table.
+BUNDLE_INDEXES = """
+CREATE UNIQUE INDEX idx_topics_lesson ON topics (lesson_id, topic_id);
+CREATE INDEX idx_problem_topics_problem ON problem_topics (problem_id, topic_id);
+CREATE INDEX idx_problems_year_type ON problems (year, problem_type, problem_id);
+CREATE INDEX idx_problems_type_year ON problems (problem_type, year, problem_id);
+CREATE INDEX idx_problems_group ON problems (group_id, part, problem_id) WHERE group_id IS NOT NULL;
+"""
+
+def build_sqlite_bundle(conn, bundle_path, page_size=BUNDLE_PAGE_SIZE):
+    """
+    Build a compact, read-only SQLite bundle of the exported questions.
+
+    The bundle holds units, topics, problems (one row per MCQ or FRQ part)
+    and their links, with covering indexes for lookups by lesson, year, type
+    and FRQ group. It is built in memory with journaling off, analyzed and
+    then written out with VACUUM INTO, so the file is fully packed. The file
+    only replaces an existing bundle if its checksum changed, and the
+    checksum is written to a .sha256 file next to it.
+
+    Clients should open it read-only, e.g. file:questions.sqlite?immutable=1.
+    Returns a dict with the path, checksum, size, build time and whether it changed.
+    """
+    start_time = time.perf_counter()
+
+    staging = sqlite3.connect(':memory:')
+    try:
+        # Page size must be set before the first table is created
+        staging.execute(f"PRAGMA page_size = {int(page_size)}")
+        staging.execute('PRAGMA journal_mode = OFF')
+        staging.execute('PRAGMA synchronous = OFF')
+        staging.executescript(BUNDLE_SCHEMA)
+
+        staging.executemany('INSERT INTO units VALUES (?, ?, ?)',
+                            conn.execute('SELECT unit_id, unit_number, unit_name FROM units'))
+        staging.executemany(
+            'INSERT INTO topics VALUES (?, ?, ?, ?, ?)',
+            ((row['topic_id'], row['unit_id'], row['topic_number'],
+              row['topic_number'].replace('.', '-'), row['topic_name'])
+             for row in conn.execute('SELECT topic_id, unit_id, topic_number, topic_name FROM topics')))
+        topic_ids = dict(staging.execute('SELECT lesson_id, topic_id FROM topics'))
+
+        problem_rows = []
+        link_rows = []
+        for question, _ in iter_questions(iter_problems(iter_problem_rows(conn))):
+            if question['type'] == 'MCQ':
+                parts = [(question['id'], None, question)]
+            else:
+                parts = [(part['id'], part['part'], part) for part in question['parts']]
+
+            for problem_id, part_number, part in parts:
+                filename = part['questionImage'].rsplit('/', 1)[-1]
+                problem_rows.append((problem_id, filename, part['questionImage'], question['year'],
+                                     question['type'], None if part_number is None else question['id'],
+                                     part_number, question['source']))
+                link_rows.extend((topic_ids[lesson_id], problem_id)
+                                 for lesson_id in part['linkedLessonIds'] if lesson_id in topic_ids)
+
+        staging.executemany('INSERT INTO problems VALUES (?, ?, ?, ?, ?, ?, ?, ?)', problem_rows)
+        staging.executemany('INSERT OR IGNORE INTO problem_topics VALUES (?, ?)', link_rows)
+        staging.executescript(BUNDLE_INDEXES)
+        staging.commit()
+        staging.execute('ANALYZE')
+        staging.commit()
+
+        temp_path = f"{bundle_path}.tmp"
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        staging.execute('VACUUM INTO ?', (temp_path,))
+    finally:
+        staging.close()
+
+    checksum = hashlib.sha256()
+    with open(temp_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            checksum.update(chunk)
+    checksum = checksum.hexdigest()
+
+    checksum_path = f"{bundle_path}.sha256"
+    previous_checksum = None
+    if os.path.exists(checksum_path) and os.path.exists(bundle_path):
+        with open(checksum_path, 'r', encoding='utf-8') as f:
+            previous_checksum = (f.read().split() or [None])[0]
+
+    changed = checksum != previous_checksum
+    if changed:
+        os.replace(temp_path, bundle_path)
+        with open(f"{checksum_path}.tmp", 'w', encoding='utf-8') as f:
+            f.write(f"{checksum}  {os.path.basename(bundle_path)}\n")
+        os.replace(f"{checksum_path}.tmp", checksum_path)
+    else:
+        os.remove(temp_path)
+
+    return {
+        'path': bundle_path,
+        'sha256': checksum,
+        'bytes': os.path.getsize(bundle_path),
+        'problems': len(problem_rows),
+        'links': len(link_rows),
+        'durationSeconds': time.perf_counter() - start_time,
+        'changed': changed,
+    }
+
+def print_bundle_summary(bundle, index=None):
+    """Print the SQLite bundle report, compared to the JSON export if there is one."""
+    status = 'written' if bundle['changed'] else 'unchanged, not rewritten'
+    print(f"🗄️  SQLite bundle '{bundle['path']}' ({status}):")
+    print(f"   - Problems: {bundle['problems']}, topic links: {bundle['links']}")
+    print(f"   - Size: {bundle['bytes']} bytes")
+    print(f"   - Build time: {bundle['durationSeconds']:.3f}s")
+    print(f"   - SHA-256: {bundle['sha256']}")
+
+    if index and index['units']:
+        json_bytes = sum(shard['bytes'] for shard in index['units'])
+        print(f"   - JSON shards for comparison: {json_bytes} bytes in {index['durationSeconds']:.3f}s "
+              f"(bundle is {bundle['bytes'] / json_bytes:.2f}x the size)")
+
+def print_export_summary(index, output_dir):
+    """Print statistics about a finished export."""
+    print(f"✅ Successfully exported {index['totalQuestions']} questions to '{output_dir}/'")
+    print(f"📊 Export Summary:")
+    for question_type, count in sorted(index['questionTypes'].items()):
+        print(f"   - {question_type} questions: {count}")
+
+    if index['totalQuestions']:
+        print(f"   - Total lesson links: {index['totalLessonLinks']}")
+        print(f"   - Average lessons per question: {index['totalLessonLinks']/index['totalQuestions']:.1f}")
+
+    print(f"   - Year distribution:")
+    for year, count in index['years'].items():
+        print(f"     * {year}: {count} questions")
+
+    print(f"   - Lessons with practice questions: {index['lessonsWithQuestions']}")
+
+    print(f"   - Unit shards:")
+    for shard in index['units']:
+        print(f"     * {shard['file']}: {shard['questions']} questions, {shard['bytes']} bytes")
+
+    changes = index['changes']
+    if changes['files']:
+        print(f"   - Changes: {len(changes['added'])} added, {len(changes['removed'])} removed, "
+              f"{len(changes['changed'])} changed")
+        print(f"   - Rewritten files: {', '.join(changes['files'])}")
+    else:
+        print(f"   - No changes since the last export, nothing rewritten")
+
+    print(f"   - Export time: {index['durationSeconds']:.3f}s")
+
 def main():
     """Main function to orchestrate the export process."""
-    
-    print("🚀 Starting AP Stats MCQ Export Process...")
+    parser = argparse.ArgumentParser(description='Export AP Stats questions for the web app.')
+    parser.add_argument('--db', default='ap_stats.db', help='database to export from')
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR, help='directory for the unit shards and index')
+    parser.add_argument('--legacy-file', default=LEGACY_OUTPUT_FILE,
+                        help="single-file MCQ export for older clients ('' to skip)")
+    parser.add_argument('--lessons', default=DEFAULT_LESSONS_SOURCE,
+                        help='allUnitsData.js file listing the valid lesson ids')
+    parser.add_argument('--force', action='store_true', help='rewrite every file even if nothing changed')
+    parser.add_argument('--format', choices=['json', 'sqlite', 'both'], default='json',
+                        help='export JSON shards, a read-only SQLite bundle, or both')
+    parser.add_argument('--page-size', type=int, default=BUNDLE_PAGE_SIZE, help='page size of the SQLite bundle')
+    args = parser.parse_args()
+
+    print("🚀 Starting AP Stats Question Export Process...")
     print("=" * 50)
-    
+
+    conn = None
     try:
         # Step 1: Connect to database
         print("📁 Connecting to database...")
-        conn = connect_to_database()
-        
-        # Step 2: Get MCQ problems data
-        print("🔍 Querying MCQ problems from database...")
-        raw_data = get_mcq_problems_data(conn)
-        print(f"   Found {len(raw_data)} problem-topic associations")
-        
-        # Step 3: Process the data
-        print("⚙️  Processing and structuring data...")
-        processed_problems = process_problem_data(raw_data)
-        
-        # Step 4: Write to JSON file
-        print("💾 Writing export file...")
-        write_json_export(processed_problems)
-        
-        # Step 5: Show sample output
-        print("\n📋 Sample of exported data:")
-        if processed_problems:
-            sample = processed_problems[0]
-            print(f"   Problem ID: {sample['id']}")
-            print(f"   Image: {sample['questionImage']}")
-            print(f"   Year: {sample['year']}")
-            print(f"   Topics: {sample['linkedLessonIds']}")
-        
+        conn = connect_to_database(args.db)
+
+        # Step 2: Stream, group and write the questions
+        index = None
+        if args.format in ('json', 'both'):
+            print("💾 Streaming questions into unit shards...")
+            index = export_questions(conn, args.output_dir, args.legacy_file, args.force, args.lessons)
+            print_export_summary(index, args.output_dir)
+
+        # Step 3: Build the SQLite bundle
+        if args.format in ('sqlite', 'both'):
+            print("💾 Building SQLite bundle...")
+            os.makedirs(args.output_dir, exist_ok=True)
+            bundle_path = os.path.join(args.output_dir, BUNDLE_FILE)
+            if args.force and os.path.exists(bundle_path):
+                os.remove(bundle_path)
+            bundle = build_sqlite_bundle(conn, bundle_path, args.page_size)
+            print_bundle_summary(bundle, index)
+
         print("\n✨ Export completed successfully!")
-        
+
+    except SchemaOutOfDate as e:
+        print(f"❌ {e}")
+        return 1
+
     except Exception as e:
         print(f"❌ Export failed: {e}")
         raise
-    
+
     finally:
         # Close database connection
-        if 'conn' in locals():
+        if conn is not None:
             conn.close()
             print("📝 Database connection closed.")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,418 @@
+"""
+Per-request timing and SQL tracing for the AP Stats web app.
+
+Every request records its wall time, the number and total time of the SQL
+statements it ran, and the time spent scanning the course folders. The
+numbers are sent back in a Server-Timing header and aggregated per route,
+with latency percentiles available at /debug/metrics. Statements slower
+than a threshold are written, with their query plan, to the slow query log
+(see slow_queries.py for reading it).
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+from flask import abort, g, has_request_context, jsonify, request
+
+# Upper bounds (in milliseconds) of the latency histogram buckets
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf'))
+
+# Number of recent request durations kept per route for percentiles
+SAMPLES_PER_ROUTE = 2048
+
+LOCAL_ADDRESSES = ('127.0.0.1', '::1', 'localhost')
+
+DEFAULT_SLOW_QUERY_MS = 100
+DEFAULT_SLOW_QUERY_LOG = os.path.join('logs', 'slow_queries.log')
+
+
+def _request_stats():
+    """Per-request counters, or None outside of a request."""
+    if not has_request_context():
+        return None
+    stats = g.get('_instrumentation')
+    if stats is None:
+        stats = g._instrumentation = {
+            'sql_count': 0,
+            'executing': False,  # a cursor's execute() is running
+            'last_statement': None,
+            'sql_time': 0.0,
+            'fs_count': 0,
+            'fs_time': 0.0,
+            'scans': [],
+        }
+    return stats
+
+
+def record_query_time(duration):
+    """Add the time of one timed SQL call to the current request."""
+    stats = _request_stats()
+    if stats is not None:
+        stats['sql_time'] += duration
+
+
+def _trace_statement(statement):
+    """sqlite3 trace callback: count every statement the current request runs."""
+    # Statements run by triggers are reported as comments, and plans
+    # captured for the slow query log are not part of the request
+    if statement.startswith('--') or statement.startswith('EXPLAIN QUERY PLAN'):
+        return
+    stats = _request_stats()
+    if stats is not None:
+        # Newer Pythons report a statement again each time it fires a trigger
+        # (once per changed row), so a repeat within one execute call is not
+        # counted. The same statement run again by another call is: repeated
+        # queries (N+1 patterns) must show up in the count.
+        if stats['executing'] and statement == stats['last_statement']:
+            return
+        stats['last_statement'] = statement
+        stats['sql_count'] += 1
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Cursor that times its statements.
+
+    execute() runs a query up to its first row, and fetchall() is timed as
+    well. Rows read one at a time (iteration, fetchone, fetchmany) are not
+    timed: a Python call per row would cost more than many queries take.
+    When a statement is finished (fetchall returned, the cursor runs another
+    statement, or the cursor is closed) and its time is over the slow query
+    threshold, it is written to the slow query log.
+    """
+
+    _statement = None  # [sql, parameters, elapsed seconds] of the running statement
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            record_query_time(elapsed)
+            if self._statement is not None:
+                self._statement[2] += elapsed
+
+    def _finish_statement(self):
+        statement, self._statement = self._statement, None
+        threshold = _slow_query_log['threshold']
+        if statement is not None and threshold is not None and statement[2] >= threshold:
+            log_slow_query(self.connection, *statement)
+
+    def _run(self, method, *args):
+        stats = _request_stats()
+        if stats is None:
+            return self._timed(method, *args)
+        stats['executing'] = True
+        stats['last_statement'] = None
+        try:
+            return self._timed(method, *args)
+        finally:
+            stats['executing'] = False
+
+    def execute(self, sql, parameters=()):
+        self._finish_statement()
+        self._statement = [sql, parameters, 0.0]
+        return self._run(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish_statement()
+        # The plan is explained with the first parameter set; an iterator of
+        # parameter sets is not consumed here, so its statement is logged without one
+        first = seq_of_parameters[0] if isinstance(seq_of_parameters, (list, tuple)) and seq_of_parameters else None
+        self._statement = [sql, first, 0.0]
+        return self._run(super().executemany, sql, seq_of_parameters)
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._finish_statement()
+        return rows
+
+    def close(self):
+        self._finish_statement()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish_statement()
+        except Exception:
+            pass
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose statements are traced and timed."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            record_query_time(time.perf_counter() - start)
+
+
+# --- Slow query log ----------------------------------------------------------
+
+_slow_query_log = {'threshold': None, 'logger': None}
+
+
+def configure_slow_query_log(path, threshold_ms, max_bytes=5 * 1024 * 1024, backup_count=5):
+    """
+    Log statements slower than threshold_ms to a rotating JSON-lines file.
+
+    Each entry holds the normalized SQL, the shapes of the bound parameters,
+    the duration, the calling route and the EXPLAIN QUERY PLAN output. For
+    executemany() these are of the first parameter set, and there is no plan
+    when the parameter sets were given as an iterator rather than a list.
+    """
+    log_dir = os.path.dirname(path)
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+
+    logger = logging.getLogger('apstats.slow_queries')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+    handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+
+    _slow_query_log['logger'] = logger
+    _slow_query_log['threshold'] = threshold_ms / 1000
+
+
+def normalize_sql(sql):
+    """Collapse whitespace and replace literals so equal queries group together."""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    sql = re.sub(r'\(\s*\?(?:\s*,\s*\?)+\s*\)', '(?, ...)', sql)
+    return ' '.join(sql.split())
+
+
+def parameter_shapes(parameters):
+    """Describe bound parameters by type (and length for strings) without their values."""
+    def shape(value):
+        if isinstance(value, (str, bytes)):
+            return f"{type(value).__name__}({len(value)})"
+        return type(value).__name__
+
+    if parameters is None:
+        return None
+    if isinstance(parameters, dict):
+        return {key: shape(value) for key, value in parameters.items()}
+    return [shape(value) for value in parameters]
+
+
+def explain_query_plan(conn, sql, parameters):
+    """EXPLAIN QUERY PLAN output of a statement as a list of lines, or None."""
+    try:
+        cursor = sqlite3.Cursor(conn)  # A plain cursor, so the plan is not timed itself
+        rows = cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parameters or ()).fetchall()
+        cursor.close()
+    except sqlite3.Error:
+        return None
+    return [row[3] for row in rows]
+
+
+def log_slow_query(conn, sql, parameters, duration):
+    """Write one slow statement to the slow query log."""
+    logger = _slow_query_log['logger']
+    if logger is None:
+        return
+
+    entry = {
+        'time': time.time(),
+        'duration_ms': round(duration * 1000, 3),
+        'route': request.endpoint if has_request_context() else None,
+        'sql': normalize_sql(sql),
+        'params': parameter_shapes(parameters),
+        'plan': explain_query_plan(conn, sql, parameters) if parameters is not None else None,
+    }
+    logger.info(json.dumps(entry))
+
+
+def connect(db_path, **kwargs):
+    """Open an instrumented sqlite3 connection."""
+    conn = sqlite3.connect(db_path, factory=InstrumentedConnection, **kwargs)
+    conn.set_trace_callback(_trace_statement)
+    return conn
+
+
+@contextmanager
+def timed_scan(name='scan'):
+    """Time a filesystem scan and add it to the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        stats = _request_stats()
+        if stats is not None:
+            stats['fs_count'] += 1
+            stats['fs_time'] += duration
+            stats['scans'].append((name, duration))
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values), math.ceil(fraction * len(sorted_values))) - 1)
+    return sorted_values[rank]
+
+
+class RouteMetrics:
+    """Aggregated timings for the requests of one route."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.fs_count = 0
+        self.fs_time = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS_MS)
+        self.samples = deque(maxlen=SAMPLES_PER_ROUTE)
+
+    def record(self, duration, stats):
+        self.count += 1
+        self.total_time += duration
+        self.sql_count += stats['sql_count']
+        self.sql_time += stats['sql_time']
+        self.fs_count += stats['fs_count']
+        self.fs_time += stats['fs_time']
+        self.samples.append(duration)
+
+        duration_ms = duration * 1000
+        for index, bound in enumerate(LATENCY_BUCKETS_MS):
+            if duration_ms <= bound:
+                self.buckets[index] += 1
+                break
+
+    def summary(self):
+        samples = sorted(self.samples)
+        to_ms = lambda seconds: None if seconds is None else round(seconds * 1000, 3)
+        return {
+            'requests': self.count,
+            'mean_ms': to_ms(self.total_time / self.count) if self.count else None,
+            'p50_ms': to_ms(percentile(samples, 0.50)),
+            'p95_ms': to_ms(percentile(samples, 0.95)),
+            'p99_ms': to_ms(percentile(samples, 0.99)),
+            'histogram_ms': [
+                {'le': '+Inf' if bound == float('inf') else bound, 'count': count}
+                for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets)
+            ],
+            'sql_statements_per_request': round(self.sql_count / self.count, 2) if self.count else None,
+            'sql_ms_per_request': to_ms(self.sql_time / self.count) if self.count else None,
+            'fs_scans_per_request': round(self.fs_count / self.count, 2) if self.count else None,
+            'fs_ms_per_request': to_ms(self.fs_time / self.count) if self.count else None,
+        }
+
+
+route_metrics = {}
+_metrics_lock = threading.Lock()
+
+# Callables run after every request as listener(route, duration, stats, response)
+request_listeners = []
+
+
+def get_route_metrics():
+    """Summaries of all routes, keyed by endpoint name."""
+    with _metrics_lock:
+        return {route: metrics.summary() for route, metrics in sorted(route_metrics.items())}
+
+
+def reset_route_metrics():
+    """Forget all aggregated route timings."""
+    with _metrics_lock:
+        route_metrics.clear()
+
+
+@contextmanager
+def count_queries():
+    """
+    Record the SQL statement count of every request finished inside the block.
+
+    Yields a list that gets a (route, statement count) pair per request, e.g.
+    to check how many queries a route runs through the Flask test client.
+    """
+    counts = []
+
+    def listener(route, duration, stats, response):
+        counts.append((route, stats['sql_count']))
+
+    request_listeners.append(listener)
+    try:
+        yield counts
+    finally:
+        request_listeners.remove(listener)
+
+
+def _start_request():
+    g._request_start = time.perf_counter()
+    _request_stats()
+
+
+def _finish_request(response):
+    start = g.pop('_request_start', None)
+    stats = _request_stats()
+    if start is None or stats is None:
+        return response
+
+    duration = time.perf_counter() - start
+    route = request.endpoint or '<unmatched>'
+    with _metrics_lock:
+        metrics = route_metrics.get(route)
+        if metrics is None:
+            metrics = route_metrics[route] = RouteMetrics()
+        metrics.record(duration, stats)
+
+    for listener in request_listeners:
+        listener(route, duration, stats, response)
+
+    response.headers['Server-Timing'] = ', '.join([
+        f"app;dur={duration * 1000:.2f}",
+        f'db;dur={stats["sql_time"] * 1000:.2f};desc="{stats["sql_count"]} queries"',
+        f'fs;dur={stats["fs_time"] * 1000:.2f};desc="{stats["fs_count"]} scans"',
+    ])
+    return response
+
+
+def debug_metrics():
+    """Per-route latency percentiles and SQL/filesystem timings (local requests only)."""
+    if request.remote_addr not in LOCAL_ADDRESSES:
+        abort(404)
+    if request.args.get('reset') == 'true':
+        reset_route_metrics()
+    return jsonify({'routes': get_route_metrics()})
+
+
+def init_app(app):
+    """Register the request timing hooks, the slow query log and the /debug/metrics endpoint."""
+    threshold_ms = app.config.get('SLOW_QUERY_MS', os.environ.get('APSTATS_SLOW_QUERY_MS', DEFAULT_SLOW_QUERY_MS))
+    if threshold_ms is not None and float(threshold_ms) >= 0:
+        configure_slow_query_log(app.config.get('SLOW_QUERY_LOG', DEFAULT_SLOW_QUERY_LOG), float(threshold_ms))
+
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.add_url_rule('/debug/metrics', 'debug_metrics', debug_metrics)
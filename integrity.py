@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Integrity checks for the AP Stats database and course folders.
+
+All checks run on a fixed number of SQL queries, whatever the size of the
+database, and the course folders are walked and the image files verified
+in parallel. The result is a JSON report with a count and a few samples
+per check, so it can be read by other tools as well as by people.
+
+Checks:
+  orphan_links           problem_topics rows whose problem or topic does not exist
+  duplicate_links        problem/topic pairs linked more than once
+  missing_images         problems named after an image that is not in any unit folder
+  unregistered_images    images in the unit folders without a problems row
+  unreadable_images      image files that are empty or not PNG files
+  broken_frq_groups      FRQ groups with missing or repeated parts, or parts that disagree on metadata
+  inconsistent_metadata  problems whose year or type contradicts their file name
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from ap_stats_db import check_schema
+
+DEFAULT_DB_PATH = 'ap_stats.db'
+DEFAULT_COURSE_DIR = 'AP_Statistics_Course'
+DEFAULT_SAMPLES = 10
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def count_and_sample(conn, sql, parameters=(), sample_size=DEFAULT_SAMPLES):
+    """
+    Run a query that selects the offending rows plus a `total` window column.
+
+    The query must end with LIMIT ? (bound to sample_size); returns the
+    total number of matching rows and the sampled rows as dicts.
+    """
+    rows = conn.execute(sql, (*parameters, sample_size)).fetchall()
+    total = rows[0]['total'] if rows else 0
+    return total, [{key: row[key] for key in row.keys() if key != 'total'} for row in rows]
+
+
+def check_result(count, samples):
+    return {'count': count, 'samples': samples}
+
+
+def scan_unit_folder(unit_path):
+    """All PNG files under one unit folder, as (filename, path) pairs."""
+    found = []
+    for folder, _, files in os.walk(unit_path):
+        for filename in files:
+            if filename.lower().endswith('.png'):
+                found.append((filename, os.path.join(folder, filename)))
+    return found
+
+
+def verify_image(path):
+    """None if path is a non-empty PNG file, otherwise the reason it is not."""
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(len(PNG_SIGNATURE))
+    except OSError as e:
+        return str(e)
+    if not header:
+        return 'empty file'
+    if header != PNG_SIGNATURE:
+        return 'not a PNG file'
+    return None
+
+
+def scan_course(course_dir, workers=DEFAULT_WORKERS):
+    """Walk the unit folders and verify every image, in parallel. Returns (images, unreadable)."""
+    if not os.path.isdir(course_dir):
+        return [], []
+    unit_paths = [os.path.join(course_dir, d) for d in sorted(os.listdir(course_dir))
+                  if d.startswith('Unit') and os.path.isdir(os.path.join(course_dir, d))]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        images = [image for found in executor.map(scan_unit_folder, unit_paths) for image in found]
+        problems = executor.map(verify_image, [path for _, path in images])
+        unreadable = [{'path': path, 'problem': problem}
+                      for (_, path), problem in zip(images, problems) if problem]
+
+    return images, unreadable
+
+
+def check_frq_groups(problems, sample_size=DEFAULT_SAMPLES):
+    """
+    FRQ groups whose numbered parts are not 1..n or whose parts disagree on metadata.
+
+    Groups and part numbers are the group_id and part_num columns the catalog
+    stores; parts without a number ("Frq1 question.png") only take part in
+    the metadata comparison.
+    """
+    groups = defaultdict(list)
+    for problem in problems:
+        if problem['group_id']:
+            groups[problem['group_id']].append((problem['part_num'], problem))
+
+    broken = []
+    for group_id, parts in sorted(groups.items()):
+        numbers = sorted(number for number, _ in parts if number is not None)
+        reasons = []
+        if numbers != list(range(1, len(numbers) + 1)):
+            reasons.append(f"parts {numbers}")
+        for field in ('year', 'problem_type', 'problem_num'):
+            values = {str(problem[field]) for _, problem in parts}
+            if len(values) > 1:
+                reasons.append(f"{field} differs: {sorted(values)}")
+        if reasons:
+            broken.append({'group_id': group_id, 'problems': [problem['problem_number'] for _, problem in parts],
+                           'reasons': reasons})
+
+    return check_result(len(broken), broken[:sample_size])
+
+
+def run_checks(conn, course_dir=DEFAULT_COURSE_DIR, sample_size=DEFAULT_SAMPLES, workers=DEFAULT_WORKERS):
+    """Run every check and return the report as a dict."""
+    start_time = time.perf_counter()
+    conn.row_factory = sqlite3.Row
+    checks = {}
+
+    checks['orphan_links'] = check_result(*count_and_sample(conn, '''
+        SELECT pt.id, pt.problem_id, pt.topic_id,
+               p.problem_id IS NULL AS missing_problem, t.topic_id IS NULL AS missing_topic,
+               COUNT(*) OVER () AS total
+        FROM problem_topics pt
+        LEFT JOIN problems p ON p.problem_id = pt.problem_id
+        LEFT JOIN topics t ON t.topic_id = pt.topic_id
+        WHERE p.problem_id IS NULL OR t.topic_id IS NULL
+        ORDER BY pt.id
+        LIMIT ?
+    ''', sample_size=sample_size))
+
+    checks['duplicate_links'] = check_result(*count_and_sample(conn, '''
+        SELECT problem_id, topic_id, COUNT(*) AS links, COUNT(*) OVER () AS total
+        FROM problem_topics
+        GROUP BY problem_id, topic_id
+        HAVING COUNT(*) > 1
+        ORDER BY links DESC, problem_id, topic_id
+        LIMIT ?
+    ''', sample_size=sample_size))
+
+    # LIKE is case-insensitive, so this also catches "mcq" and "Frq" file names
+    checks['inconsistent_metadata'] = check_result(*count_and_sample(conn, '''
+        SELECT problem_id, problem_number, year, problem_type, problem_num, COUNT(*) OVER () AS total
+        FROM problems
+        WHERE (year IS NOT NULL AND instr(problem_number, CAST(year AS TEXT)) = 0)
+           OR (problem_number LIKE '%MCQ%' AND problem_type IS NOT NULL AND problem_type != 'Multiple Choice')
+           OR (problem_number LIKE '%FRQ%' AND problem_type IS NOT NULL AND problem_type != 'Free Response')
+        ORDER BY problem_id
+        LIMIT ?
+    ''', sample_size=sample_size))
+
+    problems = conn.execute('''
+        SELECT problem_id, problem_number, year, problem_type, problem_num, group_id, part_num FROM problems
+    ''').fetchall()
+    link_count = conn.execute('SELECT COUNT(*) FROM problem_topics').fetchone()[0]
+
+    checks['broken_frq_groups'] = check_frq_groups(problems, sample_size)
+
+    images, unreadable = scan_course(course_dir, workers)
+    folders_by_name = defaultdict(list)
+    for filename, path in images:
+        folders_by_name[filename].append(os.path.dirname(path))
+
+    image_problems = [problem for problem in problems
+                      if (problem['problem_number'] or '').lower().endswith('.png')]
+    missing = [{'problem_id': problem['problem_id'], 'problem_number': problem['problem_number']}
+               for problem in image_problems if problem['problem_number'] not in folders_by_name]
+    checks['missing_images'] = check_result(len(missing), missing[:sample_size])
+
+    registered = {problem['problem_number'] for problem in problems}
+    unregistered = [{'filename': filename, 'folders': folders}
+                    for filename, folders in sorted(folders_by_name.items()) if filename not in registered]
+    checks['unregistered_images'] = check_result(len(unregistered), unregistered[:sample_size])
+
+    checks['unreadable_images'] = check_result(len(unreadable), unreadable[:sample_size])
+
+    return {
+        'ok': not any(check['count'] for check in checks.values()),
+        'duration_seconds': round(time.perf_counter() - start_time, 3),
+        'totals': {'problems': len(problems), 'links': link_count, 'images': len(images)},
+        'checks': checks,
+    }
+
+
+def check_integrity(db_path=DEFAULT_DB_PATH, course_dir=DEFAULT_COURSE_DIR, sample_size=DEFAULT_SAMPLES,
+                    workers=DEFAULT_WORKERS):
+    """Open the database read-only, run every check and return the report."""
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"Database file '{db_path}' not found.")
+    # A URI built from the path by hand would break on '?', '#' or '%' in it
+    conn = sqlite3.connect(Path(db_path).absolute().as_uri() + '?mode=ro', uri=True)
+    try:
+        check_schema(conn)  # The FRQ group check reads columns added by the catalog migration
+        report = run_checks(conn, course_dir, sample_size, workers)
+    finally:
+        conn.close()
+    report['database'] = db_path
+    report['course_dir'] = course_dir
+    return report
+
+
+def print_report(report):
+    """Print a short human-readable summary of a report."""
+    totals = report['totals']
+    print(f"=== Integrity of {report['database']} ({totals['problems']} problems, {totals['links']} links, "
+          f"{totals['images']} images, {report['duration_seconds']:.2f}s) ===")
+    for name, check in report['checks'].items():
+        status = 'OK' if not check['count'] else f"{check['count']} found"
+        print(f"  {name:<24}{status}")
+        for sample in check['samples']:
+            print(f"      {json.dumps(sample)}")
+    print("No problems found." if report['ok'] else "Problems found, see the samples above.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the AP Stats database and course folders for problems.')
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help='database to check')
+    parser.add_argument('--course-dir', default=DEFAULT_COURSE_DIR, help='course folder with the unit folders')
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES, help='samples reported per check')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='threads used to verify images')
+    parser.add_argument('--summary', action='store_true', help='print a readable summary instead of JSON')
+    args = parser.parse_args()
+
+    report = check_integrity(args.db, args.course_dir, args.samples, args.workers)
+    if args.summary:
+        print_report(report)
+    else:
+        print(json.dumps(report, indent=2))
+    return 0 if report['ok'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,481 @@
+"""
+Background jobs for long maintenance operations started from the web app.
+
+Integrity checks, catalog syncs, exports and online backups take seconds
+to minutes, too long to run inside a request. Starting one from /jobs (or
+POST /api/jobs) records it in the jobs table and queues it for a small
+pool of worker threads (JOB_WORKERS, default 1), so maintenance never
+takes more than that many threads away from page requests and the request
+that started it returns at once. Only one job of each kind can be queued
+or running: starting another returns the existing one.
+
+A job reports its progress to its row as it runs; /api/jobs/<id> returns
+the row for polling and /jobs lists running and finished jobs with their
+durations. Cancelling a queued job keeps it from starting; a running job
+stops at its next progress report (an integrity check, which reports none
+while it runs, finishes). Jobs left queued or running by a process that
+has exited are marked failed when the app starts.
+
+Full re-imports (reset_database.py) delete and recreate the database file,
+so they stay a command-line operation for when the app is stopped.
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from flask import abort, flash, jsonify, redirect, render_template, request, url_for
+
+import db_writer
+import instrumentation
+import metrics
+from backup_database import DEFAULT_BACKUP_DIR, backup_database
+from catalog import DEFAULT_COURSE_DIR, sync_catalog
+from export_for_app import (BUNDLE_FILE, DEFAULT_LESSONS_SOURCE, DEFAULT_OUTPUT_DIR, LEGACY_OUTPUT_FILE,
+                            build_sqlite_bundle, connect_to_database, export_questions)
+from integrity import check_integrity
+
+DEFAULT_WORKERS = 1
+PROGRESS_INTERVAL = 0.5  # seconds between progress writes of a running job
+FINISHED_LIMIT = 50  # finished jobs listed on the jobs page
+
+
+class JobError(ValueError):
+    """A job cannot be started with the given kind or parameters."""
+
+
+class JobCancelled(Exception):
+    """Raised in a running job whose cancellation was requested."""
+
+
+class Job:
+    """What a job function gets: its parameters, paths and a way to report progress."""
+
+    def __init__(self, runner, job_id, params):
+        self.runner = runner
+        self.id = job_id
+        self.params = params
+        self.db_path = runner.db_path
+        self.course_dir = runner.course_dir
+        self.export_dir = runner.export_dir
+        self.backup_dir = runner.backup_dir
+        self._last_report = 0.0
+        self._last_message = None
+
+    def progress(self, fraction, message=None):
+        """Record progress (0 to 1); raises JobCancelled if the job should stop."""
+        if self.runner._cancel_requested(self.id):
+            raise JobCancelled()
+        now = time.monotonic()
+        if message == self._last_message and now - self._last_report < PROGRESS_INTERVAL:
+            return
+        self._last_report = now
+        self._last_message = message
+        # Cancellation may also be requested by another worker process, through the row
+        if self.runner._save_progress(self.id, fraction, message):
+            raise JobCancelled()
+
+
+# --- Job kinds ---------------------------------------------------------------
+
+def run_integrity_check(job):
+    """Run every integrity check; the result is the report of integrity.py."""
+    job.progress(0, 'Checking the database and course folders')
+    report = check_integrity(job.db_path, job.course_dir)
+    job.progress(1, 'Done' if report['ok'] else 'Problems found')
+    return report
+
+
+def run_catalog_sync(job):
+    """Register new course images and update stored image paths (see catalog.py)."""
+    job.progress(0, 'Scanning the course folders')
+    return db_writer.write(lambda db: sync_catalog(db, job.course_dir, commit=False))
+
+
+def run_export(job):
+    """Write the question export shards and/or the SQLite bundle (see export_for_app.py)."""
+    export_format = job.params.get('format', 'json')
+    conn = connect_to_database(job.db_path)
+    try:
+        result = {}
+        if export_format in ('json', 'both'):
+            job.progress(0, 'Writing the unit shards')
+            # The single-file MCQ export and allUnitsData.js sit next to the export folder
+            data_dir = os.path.dirname(job.export_dir)
+            index = export_questions(conn, job.export_dir, os.path.join(data_dir, LEGACY_OUTPUT_FILE),
+                                     lessons_source=os.path.join(data_dir, DEFAULT_LESSONS_SOURCE))
+            result['questions'] = index['totalQuestions']
+            result['changes'] = {name: len(values) for name, values in index['changes'].items()}
+            result['durationSeconds'] = index['durationSeconds']
+        if export_format in ('sqlite', 'both'):
+            job.progress(0.5 if 'questions' in result else 0, 'Building the SQLite bundle')
+            os.makedirs(job.export_dir, exist_ok=True)
+            result['bundle'] = build_sqlite_bundle(conn, os.path.join(job.export_dir, BUNDLE_FILE))
+    finally:
+        conn.close()
+    return result
+
+
+def run_backup(job):
+    """Take an online backup of the database (see backup_database.py)."""
+    def on_progress(copied, total):
+        job.progress(copied / total if total else 1, f"{copied} of {total} pages copied")
+
+    backup_path = backup_database(job.db_path, job.backup_dir, on_progress=on_progress)
+    return {'path': backup_path, 'bytes': os.path.getsize(backup_path)}
+
+
+JOB_KINDS = {
+    'integrity_check': {
+        'label': 'Integrity check',
+        'description': 'Check the database and course folders for broken links, missing images and FRQ groups.',
+        'run': run_integrity_check,
+    },
+    'catalog_sync': {
+        'label': 'Catalog sync',
+        'description': 'Register course images added since the app started and update image paths.',
+        'run': run_catalog_sync,
+    },
+    'export': {
+        'label': 'Export for the app',
+        'description': 'Write the question export (JSON shards, SQLite bundle or both).',
+        'run': run_export,
+        'params': {'format': ('json', 'sqlite', 'both')},
+    },
+    'backup': {
+        'label': 'Database backup',
+        'description': 'Take an online backup of the database into backups/.',
+        'run': run_backup,
+    },
+}
+
+
+def check_params(kind, params):
+    """The parameters of a new job, or JobError if the kind or a parameter is not known."""
+    if not isinstance(kind, str) or kind not in JOB_KINDS:
+        raise JobError(f"Unknown job kind: {kind}")
+    if not isinstance(params, dict):
+        raise JobError('params must be an object')
+    allowed = JOB_KINDS[kind].get('params', {})
+    for name, value in params.items():
+        if name not in allowed:
+            raise JobError(f"Unknown parameter for {kind}: {name}")
+        if value not in allowed[name]:
+            raise JobError(f"{name} must be one of {', '.join(allowed[name])}")
+    return params
+
+
+def job_dict(row):
+    """A jobs row as a dict, with params and result decoded and its duration."""
+    job = dict(row)
+    job['params'] = json.loads(job['params'] or '{}')
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    job['cancel_requested'] = bool(job['cancel_requested'])
+    job['label'] = JOB_KINDS[job['kind']]['label'] if job['kind'] in JOB_KINDS else job['kind']
+    end = job['finished'] or (time.time() if job['status'] == 'running' else None)
+    job['duration_seconds'] = round(end - job['started'], 3) if job['started'] and end else None
+    job['created_at'] = datetime.fromtimestamp(job['created']).isoformat(sep=' ', timespec='seconds')
+    return job
+
+
+def _process_alive(pid):
+    if pid == os.getpid():
+        return True
+    if pid is None or os.name != 'posix':
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobRunner:
+    """Queues jobs for a fixed number of worker threads and keeps their rows up to date."""
+
+    def __init__(self, app, db_path, course_dir=DEFAULT_COURSE_DIR, workers=DEFAULT_WORKERS,
+                 export_dir=None, backup_dir=None):
+        self.app = app
+        self.db_path = os.path.abspath(db_path)
+        self.course_dir = course_dir
+        self.workers = workers
+        # Exports and backups go next to the database, not into the server's working directory
+        data_dir = os.path.dirname(self.db_path)
+        self.export_dir = os.path.abspath(export_dir or os.path.join(data_dir, DEFAULT_OUTPUT_DIR))
+        self.backup_dir = os.path.abspath(backup_dir or os.path.join(data_dir, DEFAULT_BACKUP_DIR))
+        self._queue = queue.Queue()
+        self._pending = 0  # jobs queued or running in this process
+        self._cancelled = set()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._threads_pid = None
+
+    def _connect(self):
+        conn = instrumentation.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def start(self, kind, params=None):
+        """
+        Queue a job. Returns (job, created).
+
+        If a job of the same kind is already queued or running, that job is
+        returned with created False instead.
+        """
+        params = check_params(kind, params or {})
+        conn = self._connect()
+        try:
+            row = conn.execute('''
+                INSERT INTO jobs (kind, status, params, pid, created)
+                SELECT ?, 'queued', ?, ?, ?
+                WHERE NOT EXISTS (SELECT 1 FROM jobs WHERE kind = ? AND status IN ('queued', 'running'))
+                RETURNING *
+            ''', (kind, json.dumps(params), os.getpid(), time.time(), kind)).fetchone()
+            conn.commit()
+            if row is None:
+                row = conn.execute('''
+                    SELECT * FROM jobs WHERE kind = ? AND status IN ('queued', 'running')
+                ''', (kind,)).fetchone()
+                return job_dict(row), False
+        finally:
+            conn.close()
+
+        self._start_workers()
+        with self._lock:
+            self._pending += 1
+        self._queue.put((row['id'], kind, params))
+        return job_dict(row), True
+
+    def cancel(self, job_id):
+        """Ask a queued or running job to stop. Returns the job, or None if there is none."""
+        with self._lock:
+            self._cancelled.add(job_id)
+        conn = self._connect()
+        try:
+            conn.execute('''
+                UPDATE jobs SET cancel_requested = 1
+                WHERE id = ? AND status IN ('queued', 'running')
+            ''', (job_id,))
+            conn.commit()
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return job_dict(row) if row else None
+
+    def get(self, job_id):
+        """One job, or None."""
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return job_dict(row) if row else None
+
+    def recent(self, limit=FINISHED_LIMIT):
+        """Every queued or running job plus the newest `limit` finished ones, newest first."""
+        conn = self._connect()
+        try:
+            rows = conn.execute('''
+                SELECT * FROM jobs
+                WHERE status IN ('queued', 'running')
+                   OR id IN (SELECT id FROM jobs WHERE status NOT IN ('queued', 'running')
+                             ORDER BY id DESC LIMIT ?)
+                ORDER BY id DESC
+            ''', (limit,)).fetchall()
+        finally:
+            conn.close()
+        return [job_dict(row) for row in rows]
+
+    def fail_interrupted(self):
+        """Mark jobs left queued or running by processes that have exited as failed. Returns how many."""
+        conn = self._connect()
+        try:
+            lost = [row['id'] for row in conn.execute('''
+                SELECT id, pid FROM jobs WHERE status IN ('queued', 'running')
+            ''') if not _process_alive(row['pid'])]
+            if lost:
+                conn.execute(f'''
+                    UPDATE jobs SET status = 'failed', error = 'Interrupted: the app was stopped', finished = ?
+                    WHERE id IN ({', '.join('?' * len(lost))})
+                ''', (time.time(), *lost))
+                conn.commit()
+        finally:
+            conn.close()
+        return len(lost)
+
+    def wait_idle(self, timeout):
+        """Wait until this process has no queued or running job. Returns whether that happened in time."""
+        deadline = time.monotonic() + timeout
+        while self._pending and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return not self._pending
+
+    def _cancel_requested(self, job_id):
+        with self._lock:
+            return job_id in self._cancelled
+
+    def _save_progress(self, job_id, fraction, message):
+        """Write a running job's progress. Returns whether its cancellation was requested."""
+        conn = self._connect()
+        try:
+            row = conn.execute('''
+                UPDATE jobs SET progress = ?, message = ? WHERE id = ?
+                RETURNING cancel_requested
+            ''', (min(max(fraction, 0.0), 1.0), message, job_id)).fetchone()
+            conn.commit()
+        finally:
+            conn.close()
+        return bool(row and row[0])
+
+    def _start_workers(self):
+        # A forked worker process does not inherit the parent's threads, so start them per process
+        if self._threads and self._threads_pid == os.getpid():
+            return
+        with self._lock:
+            if self._threads and self._threads_pid == os.getpid():
+                return
+            self._threads_pid = os.getpid()
+            self._threads = [threading.Thread(target=self._work, name=f'job-worker-{number}', daemon=True)
+                             for number in range(self.workers)]
+            for thread in self._threads:
+                thread.start()
+
+    def _work(self):
+        while True:
+            job_id, kind, params = self._queue.get()
+            try:
+                self._run(job_id, kind, params)
+            except Exception as e:
+                print(f"Job {job_id} ({kind}) could not be recorded: {e}")
+            finally:
+                with self._lock:
+                    self._cancelled.discard(job_id)
+                    self._pending -= 1
+
+    def _run(self, job_id, kind, params):
+        started = time.time()
+        conn = self._connect()
+        try:
+            # A job cancelled while it was queued (in any process) does not start
+            if self._cancel_requested(job_id) or not conn.execute('''
+                UPDATE jobs SET status = 'running', started = ?, pid = ?
+                WHERE id = ? AND status = 'queued' AND NOT cancel_requested
+            ''', (started, os.getpid(), job_id)).rowcount:
+                conn.execute('''
+                    UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status = 'queued'
+                ''', (time.time(), job_id))
+                conn.commit()
+                metrics.record_job(kind, 'cancelled', None)
+                return
+            conn.commit()
+        finally:
+            conn.close()
+
+        status, result, error = 'succeeded', None, None
+        try:
+            with self.app.app_context():
+                result = JOB_KINDS[kind]['run'](Job(self, job_id, params))
+        except JobCancelled:
+            status = 'cancelled'
+        except Exception as e:
+            status, error = 'failed', f"{type(e).__name__}: {e}"
+
+        finished = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('''
+                UPDATE jobs
+                SET status = ?, progress = CASE WHEN ? = 'succeeded' THEN 1 ELSE progress END,
+                    result = ?, error = ?, finished = ?
+                WHERE id = ?
+            ''', (status, status, json.dumps(result, default=str) if result is not None else None,
+                  error, finished, job_id))
+            conn.commit()
+        finally:
+            conn.close()
+        metrics.record_job(kind, status, finished - started)
+
+
+def init_app(app, db_path='ap_stats.db', course_dir=DEFAULT_COURSE_DIR):
+    """Set up the job runner for the app and serve /jobs and /api/jobs."""
+    runner = JobRunner(app, db_path, course_dir, app.config.get('JOB_WORKERS', DEFAULT_WORKERS),
+                       app.config.get('EXPORT_DIR'), app.config.get('BACKUP_DIR'))
+    app.extensions['jobs'] = runner
+    if os.path.exists(db_path):
+        runner.fail_interrupted()
+
+    def jobs_page():
+        """Running and finished jobs, with buttons to start each kind."""
+        jobs = runner.recent()
+        active = [job for job in jobs if job['status'] in ('queued', 'running')]
+        finished = [job for job in jobs if job['status'] not in ('queued', 'running')]
+        return render_template('jobs.html', kinds=JOB_KINDS, active=active, finished=finished)
+
+    def start_job():
+        """Start a job from the jobs page."""
+        kind = request.form.get('kind', '')
+        params = {name: request.form[name] for name in JOB_KINDS.get(kind, {}).get('params', {})
+                  if request.form.get(name)}
+        try:
+            job, created = runner.start(kind, params)
+        except JobError as e:
+            flash(str(e))
+        else:
+            flash(f"{job['label']} started." if created else f"{job['label']} is already {job['status']}.")
+        return redirect(url_for('jobs_page'))
+
+    def cancel_job(job_id):
+        """Cancel a job from the jobs page."""
+        job = runner.cancel(job_id)
+        if job is None:
+            abort(404)
+        flash(f"Cancellation of {job['label'].lower()} #{job_id} requested.")
+        return redirect(url_for('jobs_page'))
+
+    def api_jobs():
+        """Running and recently finished jobs as JSON."""
+        return jsonify({'jobs': runner.recent()})
+
+    def api_start_job():
+        """Start a job: {"kind": ..., "params": {...}}. 202 for a new job, 200 for one already queued or running."""
+        payload = request.get_json(silent=True)
+        if payload is None:
+            payload = {}
+        if not isinstance(payload, dict):
+            return jsonify({'error': 'Expected an object with "kind" and "params"'}), 400
+        params = payload.get('params')
+        if params is not None and not isinstance(params, dict):
+            return jsonify({'error': 'params must be an object'}), 400
+        try:
+            job, created = runner.start(payload.get('kind', ''), params or {})
+        except JobError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(job), 202 if created else 200
+
+    def api_job(job_id):
+        """One job's status and progress, for polling."""
+        job = runner.get(job_id)
+        if job is None:
+            return jsonify({'error': 'job not found'}), 404
+        return jsonify(job)
+
+    def api_cancel_job(job_id):
+        """Ask a job to stop."""
+        job = runner.cancel(job_id)
+        if job is None:
+            return jsonify({'error': 'job not found'}), 404
+        return jsonify(job)
+
+    app.add_url_rule('/jobs', 'jobs_page', jobs_page)
+    app.add_url_rule('/jobs/start', 'start_job', start_job, methods=['POST'])
+    app.add_url_rule('/jobs/<int:job_id>/cancel', 'cancel_job', cancel_job, methods=['POST'])
+    app.add_url_rule('/api/jobs', 'api_jobs', api_jobs)
+    app.add_url_rule('/api/jobs', 'api_start_job', api_start_job, methods=['POST'])
+    app.add_url_rule('/api/jobs/<int:job_id>', 'api_job', api_job)
+    app.add_url_rule('/api/jobs/<int:job_id>/cancel', 'api_cancel_job', api_cancel_job, methods=['POST'])
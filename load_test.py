@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Load test for serve.py: throughput of the pre-forked server by worker count.
+
+The server is started against a synthetic corpus (synthetic_data.py) once
+for every worker count, and driven for a fixed time by client processes
+sending requests for the read routes of benchmark_routes.py over keep-alive
+connections. For every run the test reports requests per second, latency
+percentiles and errors, and the speedup over a single worker. With enough
+CPUs the speedup should follow the worker count up to the number of cores.
+
+Client and server share the machine, so the clients take CPU time the
+workers could otherwise use: the measured scaling is a lower bound.
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import instrumentation
+import synthetic_data
+from benchmark_routes import pick_targets
+
+SERVE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serve.py')
+DEFAULT_DURATION = 10.0  # seconds of measured load per worker count
+DEFAULT_WARMUP = 2.0  # seconds of unmeasured load before each measurement
+DEFAULT_THREADS = 4  # connections per client process
+STARTUP_TIMEOUT = 60.0  # seconds to wait for the server to answer
+
+
+def default_worker_counts():
+    """1, 2, 4, ... up to the number of CPUs (which is always included)."""
+    cpus = os.cpu_count() or 1
+    counts = []
+    count = 1
+    while count < cpus:
+        counts.append(count)
+        count *= 2
+    counts.append(cpus)
+    return counts
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(port, process, timeout=STARTUP_TIMEOUT):
+    """Wait until the server answers on port."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"serve.py exited with status {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"serve.py did not answer within {timeout:g}s")
+
+
+def start_server(corpus_dir, workers, port, metrics_dir):
+    """Start serve.py with `workers` workers against the corpus."""
+    env = dict(os.environ,
+               APSTATS_DB=os.path.join(corpus_dir, 'ap_stats.db'),
+               APSTATS_COURSE_DIR=os.path.join(corpus_dir, 'AP_Statistics_Course'))
+    process = subprocess.Popen(
+        [sys.executable, SERVE_SCRIPT, '--workers', str(workers), '--port', str(port),
+         '--metrics-dir', metrics_dir, '--watch-interval', '0'],
+        cwd=corpus_dir, env=env, stdout=subprocess.DEVNULL)
+    try:
+        wait_until_ready(port, process)
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    return process
+
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def client_thread(port, paths, offset, start, deadline, results):
+    """Request the paths in turn on one keep-alive connection; record latencies after start."""
+    latencies = []
+    errors = 0
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    index = offset
+    while True:
+        now = time.perf_counter()
+        if now >= deadline:
+            break
+        path = paths[index % len(paths)]
+        index += 1
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            ok = response.status < 400
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            ok = False
+        if now >= start:
+            if ok:
+                latencies.append((time.perf_counter() - now) * 1000)
+            else:
+                errors += 1
+    conn.close()
+    results.append((latencies, errors))
+
+
+def client_process(args):
+    """Run `threads` client connections; returns (latencies in ms, errors)."""
+    port, paths, threads, number, start_delay, duration = args
+    now = time.perf_counter()
+    start = now + start_delay
+    deadline = start + duration
+    results = []
+    pool = [threading.Thread(target=client_thread,
+                             args=(port, paths, number * threads + i, start, deadline, results))
+            for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return [value for latencies, _ in results for value in latencies], sum(errors for _, errors in results)
+
+
+def run_load(port, paths, processes, threads, warmup, duration):
+    """Load the server and return its throughput and latency percentiles."""
+    with multiprocessing.Pool(processes) as pool:
+        outcomes = pool.map(client_process, [(port, paths, threads, number, warmup, duration)
+                                             for number in range(processes)])
+    latencies = sorted(value for values, _ in outcomes for value in values)
+    errors = sum(errors for _, errors in outcomes)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'requests_per_second': round(len(latencies) / duration, 1),
+        'p50_ms': round(statistics.median(latencies), 2) if latencies else None,
+        'p95_ms': round(instrumentation.percentile(latencies, 0.95), 2) if latencies else None,
+        'p99_ms': round(instrumentation.percentile(latencies, 0.99), 2) if latencies else None,
+    }
+
+
+def run_load_test(corpus_dir, worker_counts, processes, threads, warmup, duration):
+    """Measure the server with every worker count against the corpus. Returns the results."""
+    corpus_dir = os.path.abspath(corpus_dir)
+    # Each URL once: the benchmark lists the home page twice (cache hit and rendering)
+    paths = list(dict.fromkeys(path for _, path in pick_targets(os.path.join(corpus_dir, 'ap_stats.db'))))
+    results = {
+        'cpus': os.cpu_count(),
+        'client_processes': processes,
+        'client_threads': threads,
+        'duration': duration,
+        'paths': paths,
+        'runs': [],
+    }
+    with tempfile.TemporaryDirectory(prefix='apstats-metrics-') as metrics_dir:
+        for workers in worker_counts:
+            print(f"{workers} worker(s): {processes * threads} connection(s) for {duration:g}s...", flush=True)
+            port = free_port()
+            process = start_server(corpus_dir, workers, port, metrics_dir)
+            try:
+                run = run_load(port, paths, processes, threads, warmup, duration)
+            finally:
+                stop_server(process)
+            run['workers'] = workers
+            results['runs'].append(run)
+
+    baseline = results['runs'][0]
+    for run in results['runs']:
+        if baseline['requests_per_second']:
+            run['speedup'] = round(run['requests_per_second'] / baseline['requests_per_second'], 2)
+            run['efficiency'] = round(run['speedup'] * baseline['workers'] / run['workers'], 2)
+    return results
+
+
+def print_results(results):
+    print(f"\n{results['cpus']} CPU(s), {results['client_processes']} client process(es) "
+          f"x {results['client_threads']} connection(s), {results['duration']:g}s per run")
+    print(f"{'Workers':>7} {'Req/s':>9} {'Speedup':>8} {'Effic.':>7} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'Errors':>7}")
+    for run in results['runs']:
+        print(f"{run['workers']:>7} {run['requests_per_second']:>9.1f} {run.get('speedup', 0):>8.2f} "
+              f"{run.get('efficiency', 0):>7.2f} {run['p50_ms'] or 0:>8.2f} {run['p95_ms'] or 0:>8.2f} "
+              f"{run['p99_ms'] or 0:>8.2f} {run['errors']:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure serve.py throughput by number of worker processes.')
+    parser.add_argument('--corpus', help='existing corpus directory (default: generate one in a temp dir)')
+    parser.add_argument('--images', type=int, default=synthetic_data.DEFAULT_IMAGES, help='images to generate')
+    parser.add_argument('--links', type=int, default=synthetic_data.DEFAULT_LINKS, help='topic links to generate')
+    parser.add_argument('--workers', help='comma-separated worker counts (default 1, 2, 4, ... up to the CPUs)')
+    parser.add_argument('--clients', type=int, help='client processes (default: the largest worker count)')
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS, help='connections per client process')
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION, help='measured seconds per run')
+    parser.add_argument('--warmup', type=float, default=DEFAULT_WARMUP, help='unmeasured seconds per run')
+    parser.add_argument('--min-efficiency', type=float,
+                        help='fail if a run with at most one worker per CPU scales below this (e.g. 0.7)')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    worker_counts = [int(count) for count in args.workers.split(',')] if args.workers else default_worker_counts()
+    processes = args.clients or max(worker_counts)
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    with tempfile.TemporaryDirectory(prefix='apstats-corpus-') as temp_dir:
+        corpus_dir = args.corpus
+        if not corpus_dir:
+            corpus_dir = temp_dir
+            print(f"Generating corpus ({args.images} images, {args.links} links) in {corpus_dir}...")
+            synthetic_data.generate_corpus(corpus_dir, images=args.images, links=args.links)
+        results = run_load_test(corpus_dir, worker_counts, processes, args.threads, args.warmup, args.duration)
+
+    print_results(results)
+    if output_path:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    cpus = results['cpus'] or 1
+    if max(worker_counts) > cpus:
+        print(f"\nNote: runs with more workers than the {cpus} CPU(s) cannot scale further.")
+    if any(run['errors'] for run in results['runs']):
+        print('\nSome requests failed.')
+        return 1
+    if args.min_efficiency is not None:
+        below = [run for run in results['runs']
+                 if run['workers'] <= cpus and run.get('efficiency', 0) < args.min_efficiency]
+        if below:
+            print(f"\nScaling below {args.min_efficiency:g} efficiency with "
+                  f"{', '.join(str(run['workers']) for run in below)} worker(s).")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,461 @@
+"""
+Prometheus metrics for the AP Stats web app.
+
+Metrics are kept in memory and served at /metrics in the Prometheus text
+exposition format, so a local collector can scrape them without any other
+service. Each metric guards its values with its own lock, held only for a
+dictionary update.
+
+When the app runs as several forked worker processes, set
+APSTATS_METRICS_DIR (or the METRICS_DIR config value) to a shared
+directory. Every process then saves a snapshot of its values there, from
+a background thread every SNAPSHOT_INTERVAL seconds while they change, and
+/metrics adds up the snapshots. Values are reset in a forked child so
+nothing the parent recorded is counted twice. A new worker folds the
+snapshots of exited processes (including one left under its own, reused,
+pid) into a retired-metrics file that is added up as well, so counters
+never go down when workers are replaced.
+"""
+
+import atexit
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, request
+
+import instrumentation
+from backup_database import get_backup_metrics
+
+try:
+    import fcntl
+except ImportError:  # No forked workers without POSIX, so no shared directory to lock
+    fcntl = None
+
+# Upper bounds (in seconds) of the latency histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Seconds between snapshot writes in multi-process mode
+SNAPSHOT_INTERVAL = 1.0
+
+# Values of exited processes in the metrics directory, and the lock guarding them
+RETIRED_FILE = 'retired-metrics.json'
+LOCK_FILE = 'metrics.lock'
+
+REGISTRY = []
+GAUGES = []
+
+
+class Metric:
+    """Base class for metrics with a fixed set of label names."""
+
+    metric_type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def reset(self):
+        """Drop all values (and replace a lock that may be held by a thread lost in a fork)."""
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def snapshot(self):
+        """Copy of the values, as a list of (label values, value) pairs."""
+        with self._lock:
+            return [(list(key), self._copy_value(value)) for key, value in self._values.items()]
+
+    @staticmethod
+    def _copy_value(value):
+        return value
+
+
+class Counter(Metric):
+    """A value that only goes up."""
+
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        _state['dirty'] = True
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+    def samples(self, key, value):
+        yield self.name, key, value
+
+
+class Histogram(Metric):
+    """Observations counted into cumulative buckets."""
+
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Counts per bucket (the last one is +Inf), sum, count
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+        _state['dirty'] = True
+
+    @staticmethod
+    def _copy_value(value):
+        return [list(value[0]), value[1], value[2]]
+
+    @staticmethod
+    def merge(total, value):
+        if total is None:
+            return [list(value[0]), value[1], value[2]]
+        return [[a + b for a, b in zip(total[0], value[0])], total[1] + value[1], total[2] + value[2]]
+
+    def samples(self, key, value):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), value[0]):
+            cumulative += count
+            yield f"{self.name}_bucket", key + (('le', _format_bound(bound)),), cumulative
+        yield f"{self.name}_sum", key, value[1]
+        yield f"{self.name}_count", key, value[2]
+
+
+class GaugeFunction:
+    """A gauge whose values are computed when the metrics are scraped."""
+
+    metric_type = 'gauge'
+
+    def __init__(self, name, documentation, function):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        GAUGES.append(self)
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+    return str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+# --- Metrics -----------------------------------------------------------------
+
+http_requests = Counter('apstats_http_requests_total', 'HTTP requests handled.',
+                        ('endpoint', 'method', 'status'))
+http_duration = Histogram('apstats_http_request_duration_seconds', 'HTTP request latency.', ('endpoint',))
+db_queries = Counter('apstats_db_queries_total', 'SQL statements executed.', ('endpoint',))
+db_query_seconds = Counter('apstats_db_query_seconds_total', 'Time spent executing SQL statements.', ('endpoint',))
+db_request_duration = Histogram('apstats_db_request_duration_seconds', 'Total SQL time per request.', ('endpoint',))
+image_bytes = Counter('apstats_image_bytes_served_total', 'Bytes of problem images served by serve_image.')
+scan_duration = Histogram('apstats_fs_scan_duration_seconds', 'Duration of course folder scans.', ('scan',))
+cache_requests = Counter('apstats_cache_requests_total', 'Cache lookups by result (hit or miss).',
+                         ('cache', 'result'))
+db_writes = Counter('apstats_db_writer_operations_total', 'Write operations run by the writer thread.', ('result',))
+db_write_batch_size = Histogram('apstats_db_writer_batch_size', 'Write operations per writer transaction.',
+                                buckets=(1, 2, 5, 10, 20, 50))
+db_write_batch_duration = Histogram('apstats_db_writer_batch_duration_seconds',
+                                    'Time to run and commit one writer transaction.')
+db_write_wait = Histogram('apstats_db_writer_wait_seconds',
+                          'Time from queueing a write operation to its commit.')
+jobs_finished = Counter('apstats_jobs_total', 'Background jobs finished, by kind and final status.', ('kind', 'status'))
+job_duration = Histogram('apstats_job_duration_seconds', 'Run time of background jobs.', ('kind',),
+                         buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800))
+
+
+def record_cache(cache, hit):
+    """Count one lookup in an in-process cache."""
+    cache_requests.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def record_db_write_batch(size, duration, failed, waits):
+    """Count one transaction of the database writer (see db_writer.py)."""
+    db_writes.inc(size - failed, result='ok')
+    if failed:
+        db_writes.inc(failed, result='error')
+    db_write_batch_size.observe(size)
+    db_write_batch_duration.observe(duration)
+    for wait in waits:
+        db_write_wait.observe(wait)
+
+
+def record_job(kind, status, duration):
+    """Count one finished background job (see jobs.py)."""
+    jobs_finished.inc(kind=kind, status=status)
+    if duration is not None:
+        job_duration.observe(duration, kind=kind)
+
+
+def _observe_request(route, duration, stats, response):
+    """instrumentation listener that turns one finished request into metrics."""
+    http_requests.inc(endpoint=route, method=request.method, status=response.status_code)
+    http_duration.observe(duration, endpoint=route)
+    db_queries.inc(stats['sql_count'], endpoint=route)
+    db_query_seconds.inc(stats['sql_time'], endpoint=route)
+    db_request_duration.observe(stats['sql_time'], endpoint=route)
+    for scan, scan_time in stats['scans']:
+        scan_duration.observe(scan_time, scan=scan)
+    if route == 'serve_image' and response.content_length:
+        image_bytes.inc(response.content_length)
+
+    if _state['directory']:
+        _start_snapshot_thread()
+
+
+# --- Multi-process support ---------------------------------------------------
+
+_state = {'directory': None, 'dirty': False, 'thread_pid': None}
+_thread_lock = threading.Lock()
+
+
+def _snapshot_path(pid=None):
+    return os.path.join(_state['directory'], f"metrics-{pid or os.getpid()}.json")
+
+
+def write_snapshot():
+    """Save this process's values to the shared metrics directory."""
+    if not _state['directory']:
+        return
+    _state['dirty'] = False
+    snapshot = {metric.name: metric.snapshot() for metric in REGISTRY}
+    _write_json(_snapshot_path(), snapshot)
+
+
+def _write_json(path, data):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _snapshot_loop():
+    while True:
+        time.sleep(SNAPSHOT_INTERVAL)
+        if _state['dirty']:
+            try:
+                write_snapshot()
+            except OSError as e:
+                print(f"Metrics snapshot write failed: {e}")
+
+
+def _start_snapshot_thread():
+    # A forked worker does not inherit the parent's thread, so start one per process
+    if _state['thread_pid'] == os.getpid():
+        return
+    with _thread_lock:
+        if _state['thread_pid'] == os.getpid():
+            return
+        _state['thread_pid'] = os.getpid()
+        threading.Thread(target=_snapshot_loop, name='metrics-snapshot', daemon=True).start()
+
+
+@contextmanager
+def _directory_lock(exclusive):
+    """Hold the metrics directory lock: exclusive to retire snapshots, shared to read them."""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(_state['directory'], LOCK_FILE), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _snapshot_pid(path):
+    name = os.path.basename(path)
+    try:
+        return int(name[len('metrics-'):-len('.json')])
+    except ValueError:
+        return None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merge(snapshots):
+    """Add up snapshots into {name: {label values tuple: value}}."""
+    merged = {metric.name: {} for metric in REGISTRY}
+    for snapshot in snapshots:
+        for metric in REGISTRY:
+            values = merged[metric.name]
+            for key, value in snapshot.get(metric.name, []):
+                key = tuple(key)
+                values[key] = metric.merge(values.get(key), value)
+    return merged
+
+
+def retire_stale_snapshots():
+    """
+    Fold the snapshots of processes that have exited, and any left under this
+    process's pid, into the retired values. Returns how many were folded.
+    """
+    if not _state['directory']:
+        return 0
+    with _directory_lock(exclusive=True):
+        stale = [path for path in glob.glob(os.path.join(_state['directory'], 'metrics-*.json'))
+                 if (pid := _snapshot_pid(path)) is not None and (pid == os.getpid() or not _pid_alive(pid))]
+        if not stale:
+            return 0
+        retired_path = os.path.join(_state['directory'], RETIRED_FILE)
+        snapshots = [snapshot for snapshot in map(_read_json, [retired_path, *stale]) if snapshot is not None]
+        merged = _merge(snapshots)
+        _write_json(retired_path, {name: [[list(key), value] for key, value in values.items()]
+                                   for name, values in merged.items()})
+        for path in stale:
+            os.remove(path)
+    return len(stale)
+
+
+def _reset_after_fork():
+    for metric in REGISTRY:
+        metric.reset()
+    _state['dirty'] = False
+    if _state['directory']:
+        try:
+            retire_stale_snapshots()
+        except OSError as e:
+            print(f"Retiring metrics snapshots failed: {e}")
+
+
+def collect():
+    """Merged values of every metric: {name: {label values tuple: value}}."""
+    snapshots = [{metric.name: metric.snapshot() for metric in REGISTRY}]
+
+    if _state['directory']:
+        own_path = _snapshot_path()
+        # Read under the lock, so snapshots being retired are counted exactly once
+        with _directory_lock(exclusive=False):
+            paths = [os.path.join(_state['directory'], RETIRED_FILE)]
+            paths += [path for path in glob.glob(os.path.join(_state['directory'], 'metrics-*.json'))
+                      if path != own_path]
+            # A file missing or being replaced right now is skipped
+            snapshots += [snapshot for snapshot in map(_read_json, paths) if snapshot is not None]
+
+    return _merge(snapshots)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    merged = collect()
+
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.metric_type}")
+        for key, value in sorted(merged[metric.name].items()):
+            labels = tuple(zip(metric.labelnames, key))
+            for sample_name, sample_labels, sample_value in metric.samples(labels, value):
+                lines.append(_format_sample(sample_name, sample_labels, sample_value))
+
+    for gauge in GAUGES:
+        lines.append(f"# HELP {gauge.name} {gauge.documentation}")
+        lines.append(f"# TYPE {gauge.name} gauge")
+        for labels, value in gauge.function():
+            if value is not None:
+                lines.append(_format_sample(gauge.name, labels, value))
+
+    return '\n'.join(lines) + '\n'
+
+
+def _format_sample(name, labels, value):
+    if labels:
+        label_text = ','.join(f'{label}="{_escape(label_value)}"' for label, label_value in labels)
+        return f"{name}{{{label_text}}} {_format_value(value)}"
+    return f"{name} {_format_value(value)}"
+
+
+# --- Gauges computed at scrape time ------------------------------------------
+
+def _database_sizes(db_path):
+    def sizes():
+        for suffix, kind in (('', 'db'), ('-wal', 'wal')):
+            path = db_path + suffix
+            yield (('file', kind),), os.path.getsize(path) if os.path.exists(path) else 0
+    return sizes
+
+
+def _backup_gauge(key):
+    def value():
+        yield (), get_backup_metrics()[key]
+    return value
+
+
+def init_app(app, db_path='ap_stats.db'):
+    """Collect request metrics from instrumentation and serve them at /metrics."""
+    # The listener is module-wide, so a second app in the same process must not add it again
+    if _observe_request not in instrumentation.request_listeners:
+        instrumentation.request_listeners.append(_observe_request)
+
+    GAUGES.clear()
+    GaugeFunction('apstats_db_file_size_bytes', 'Size of the SQLite database and its WAL file.',
+                  _database_sizes(db_path))
+    GaugeFunction('apstats_backup_last_duration_seconds', 'Duration of the last online backup.',
+                  _backup_gauge('last_duration_seconds'))
+    GaugeFunction('apstats_backup_last_size_bytes', 'Size of the last online backup.',
+                  _backup_gauge('last_size_bytes'))
+    GaugeFunction('apstats_backups', 'Online backups taken by this process.',
+                  _backup_gauge('backups_total'))
+
+    directory = app.config.get('METRICS_DIR') or os.environ.get('APSTATS_METRICS_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        _state['directory'] = directory
+        retire_stale_snapshots()
+        atexit.register(write_snapshot)
+
+    def metrics_endpoint():
+        """Prometheus scrape endpoint."""
+        return Response(render(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics_endpoint)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
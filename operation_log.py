@@ -0,0 +1,170 @@
+"""
+Server-side log of the write operations done through the web app.
+
+Routes that change topic links or metadata record what they did (counts,
+the parts and topics involved, how long it took and which browser session
+did it) here instead of flashing debug lines into the cookie session. The
+user only gets a short summary flash; the details are at
+/debug/operations.
+
+Entries are buffered in memory and written in batches by a background
+thread, so recording an operation adds no SQL to the request. When the
+app's single database writer is enabled (see db_writer.py), the batches
+are handed to it like every other write.
+"""
+
+import atexit
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from flask import abort, current_app, render_template, request, session
+
+from instrumentation import LOCAL_ADDRESSES
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_FLUSH_INTERVAL = 1.0  # seconds between background writes
+
+
+class OperationLog:
+    """Buffers operation entries and writes them to the operation_log table in batches."""
+
+    def __init__(self, db_path, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL, writer=None):
+        # Absolute, as the last entries may be written at exit from another directory
+        self.db_path = os.path.abspath(db_path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.writer = writer  # db_writer.DbWriter, or None to write on a connection of our own
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._writer = None
+        self._writer_pid = None
+
+    def record(self, operation, counts=None, details=None, duration=None, actor=None):
+        """Queue one entry; it is written by the background thread."""
+        entry = (
+            time.time(),
+            operation,
+            actor,
+            json.dumps(counts or {}),
+            round(duration * 1000, 3) if duration is not None else None,
+            json.dumps(details or {}, default=str),
+        )
+        with self._lock:
+            self._pending.append(entry)
+            full = len(self._pending) >= self.batch_size
+        self._start_writer()
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write all queued entries in one transaction. Returns how many were written."""
+        with self._lock:
+            entries, self._pending = self._pending, []
+        if not entries:
+            return 0
+
+        def insert(conn):
+            conn.executemany('''
+                INSERT INTO operation_log (created, operation, actor, counts, duration_ms, details)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', entries)
+
+        try:
+            if self.writer is not None:
+                self.writer.run(insert)
+            else:
+                conn = sqlite3.connect(self.db_path, timeout=10)
+                try:
+                    with conn:
+                        insert(conn)
+                finally:
+                    conn.close()
+        except sqlite3.Error:
+            # Keep the entries for the next attempt
+            with self._lock:
+                self._pending[:0] = entries
+            raise
+
+        return len(entries)
+
+    def recent(self, limit=100, operation=None):
+        """The newest entries (after writing the queued ones), with counts and details decoded."""
+        self.flush()
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            rows = conn.execute('''
+                SELECT * FROM operation_log
+                WHERE ? IS NULL OR operation = ?
+                ORDER BY created DESC
+                LIMIT ?
+            ''', (operation, operation, limit)).fetchall()
+        finally:
+            conn.close()
+
+        entries = []
+        for row in rows:
+            entry = dict(row)
+            entry['counts'] = json.loads(entry['counts'] or '{}')
+            entry['details'] = json.loads(entry['details'] or '{}')
+            entry['created_at'] = datetime.fromtimestamp(entry['created']).isoformat(sep=' ', timespec='seconds')
+            entries.append(entry)
+        return entries
+
+    def _start_writer(self):
+        # A forked worker does not inherit the parent's thread, so start one per process
+        if self._writer is not None and self._writer_pid == os.getpid():
+            return
+        with self._lock:
+            if self._writer is not None and self._writer_pid == os.getpid():
+                return
+            self._writer_pid = os.getpid()
+            self._writer = threading.Thread(target=self._run, name='operation-log-writer', daemon=True)
+            self._writer.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"Operation log write failed: {e}")
+
+
+def current_actor():
+    """An opaque id for the browser session making the request."""
+    if 'actor' not in session:
+        session['actor'] = secrets.token_hex(8)
+    return session['actor']
+
+
+def record_operation(operation, counts=None, details=None, started=None):
+    """Log an operation of the current request; `started` is its time.perf_counter() start."""
+    duration = time.perf_counter() - started if started is not None else None
+    current_app.extensions['operation_log'].record(operation, counts, details, duration, current_actor())
+
+
+def init_app(app, db_path='ap_stats.db'):
+    """Set up the operation log for the app and serve /debug/operations."""
+    log = OperationLog(db_path, app.config.get('OPERATION_LOG_BATCH_SIZE', DEFAULT_BATCH_SIZE),
+                       app.config.get('OPERATION_LOG_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL),
+                       app.extensions.get('db_writer'))
+    app.extensions['operation_log'] = log
+    atexit.register(log.flush)
+
+    def debug_operations():
+        """Recent operations with their details (local requests only)."""
+        if request.remote_addr not in LOCAL_ADDRESSES:
+            abort(404)
+        operation = request.args.get('operation') or None
+        limit = request.args.get('limit', 100, type=int)
+        return render_template('operations.html', operations=log.recent(limit, operation), operation=operation)
+
+    app.add_url_rule('/debug/operations', 'debug_operations', debug_operations)
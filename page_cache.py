@@ -0,0 +1,144 @@
+"""
+Shared cache of rendered pages that depend only on their URL and the data.
+
+A cached page is keyed by the view's own key (its canonical query
+parameters) plus the data version: the app_meta counter bumped by triggers
+on every change to units, topics, problems and problem_topics, and the
+modification times of the course folders. The same version gives the same
+ETag, so browsers and a reverse proxy can revalidate the page with
+If-None-Match and get a 304 without the page being rendered again.
+
+Pages are not cached, and are marked private, while the session has flash
+messages waiting for the user. A page whose key comes from the session
+(shared=False) is cached too, but its response is marked private.
+"""
+
+import hashlib
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, make_response, request, session
+
+import instrumentation
+import metrics
+from ap_stats_db import get_data_version
+from instrumentation import timed_scan
+
+DEFAULT_SIZE = 32  # rendered pages kept in memory
+DEFAULT_MAX_AGE = 0  # seconds shared caches may serve a page before revalidating
+DEFAULT_FINGERPRINT_TTL = 2.0  # seconds a course folder fingerprint is reused
+
+
+def course_fingerprint(base_path):
+    """Hash of the modification times of the course folder and its subfolders."""
+    # Adding, removing or renaming an image changes the time of its folder
+    fingerprint = []
+    for folder, subfolders, _ in os.walk(base_path):
+        subfolders.sort()
+        fingerprint.append((folder, os.stat(folder).st_mtime_ns))
+    return hashlib.sha1(repr(fingerprint).encode()).hexdigest()
+
+
+class PageCache:
+    """LRU cache of rendered page bodies, keyed by view key and data version."""
+
+    def __init__(self, db_path, course_dir, size=DEFAULT_SIZE, max_age=DEFAULT_MAX_AGE,
+                 fingerprint_ttl=DEFAULT_FINGERPRINT_TTL):
+        self.db_path = db_path
+        self.course_dir = course_dir
+        self.size = size
+        self.max_age = max_age
+        self.fingerprint_ttl = fingerprint_ttl
+        self._fingerprint = (float('-inf'), None)  # (expiry time, fingerprint)
+        # Changes on every start, so pages rendered by older code are not revalidated
+        self.generation = secrets.token_hex(4)
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def version(self):
+        """The data version and course folder fingerprint the pages depend on."""
+        conn = instrumentation.connect(self.db_path)
+        try:
+            data_version = get_data_version(conn)
+        finally:
+            conn.close()
+        return data_version, self.fingerprint()
+
+    def fingerprint(self):
+        """The course folder fingerprint, walked again at most every fingerprint_ttl seconds."""
+        # A walk costs more the larger the course is, so cache hits do not pay for one each
+        expires, fingerprint = self._fingerprint
+        now = time.monotonic()
+        if now >= expires:
+            with timed_scan('fingerprint'):
+                fingerprint = course_fingerprint(self.course_dir)
+            self._fingerprint = (now + self.fingerprint_ttl, fingerprint)
+        return fingerprint
+
+    def get(self, key):
+        with self._lock:
+            body = self._pages.get(key)
+            if body is not None:
+                self._pages.move_to_end(key)
+        metrics.record_cache('pages', body is not None)
+        return body
+
+    def put(self, key, body):
+        with self._lock:
+            self._pages[key] = body
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.size:
+                self._pages.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+
+def cached_page(key, render, shared=True):
+    """
+    Response for a page that depends only on key and the data; render() returns its HTML.
+
+    shared=False for a key read from the session: the response then must
+    not be stored by shared caches, which do not see the session.
+    """
+    cache = current_app.extensions['page_cache']
+
+    if '_flashes' in session:
+        # The page shows this user's messages, so it is neither cached nor shared
+        response = make_response(render())
+        response.cache_control.private = True
+        response.cache_control.no_store = True
+        return response
+
+    version = cache.version()
+    etag = hashlib.sha1(repr((cache.generation, key, version)).encode()).hexdigest()
+
+    if request.if_none_match.contains(etag):
+        body = b''  # make_conditional turns this into a 304
+    else:
+        body = cache.get((key, version))
+        if body is None:
+            body = render().encode()
+            cache.put((key, version), body)
+
+    response = current_app.response_class(body, mimetype='text/html')
+    response.set_etag(etag)
+    if shared:
+        response.cache_control.public = True
+        response.cache_control.max_age = cache.max_age
+    else:
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def init_app(app, db_path='ap_stats.db', course_dir='AP_Statistics_Course'):
+    """Set up the page cache (PAGE_CACHE_SIZE pages, PAGE_CACHE_MAX_AGE and PAGE_CACHE_FINGERPRINT_TTL seconds)."""
+    app.extensions['page_cache'] = PageCache(db_path, course_dir,
+                                             app.config.get('PAGE_CACHE_SIZE', DEFAULT_SIZE),
+                                             app.config.get('PAGE_CACHE_MAX_AGE', DEFAULT_MAX_AGE),
+                                             app.config.get('PAGE_CACHE_FINGERPRINT_TTL', DEFAULT_FINGERPRINT_TTL))
@@ -0,0 +1,175 @@
+"""
+Opt-in sampling profiler for single requests of the AP Stats web app.
+
+When profiling is enabled (PROFILING config value or APSTATS_PROFILING=1),
+a request with ?_profile=1 or an "X-Profile: 1" header is profiled: a
+background thread samples the stack of the request's thread every
+PROFILE_INTERVAL_MS milliseconds. The samples are saved in the collapsed
+stack format ("outer;inner;leaf count" per line) under PROFILE_DIR, which
+flamegraph.pl and speedscope.app read directly. Recent profiles are listed
+at /debug/profiles.
+
+The sampler needs the GIL to take a sample, so a busy request thread is
+sampled at most once per interpreter switch interval (5 ms by default).
+"""
+
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import abort, g, render_template, request, send_from_directory
+
+from instrumentation import LOCAL_ADDRESSES
+
+DEFAULT_PROFILE_DIR = 'profiles'
+DEFAULT_INTERVAL_MS = 1.0
+DEFAULT_KEEP = 50
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_PARAMETER = '_profile'
+
+
+class SamplingProfiler:
+    """Samples the call stack of one thread from a background thread."""
+
+    def __init__(self, thread_id, interval=DEFAULT_INTERVAL_MS / 1000):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling and return the profiled wall time in seconds."""
+        self._stop_event.set()
+        self._thread.join()
+        return time.perf_counter() - self.start_time
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse_stack(frame)] += 1
+                self.samples += 1
+
+    def collapsed(self):
+        """The samples in collapsed stack format, most frequent stack first."""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def collapse_stack(frame):
+    """A frame and its callers as 'outermost;...;innermost' function names."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def _profile_requested():
+    return request.args.get(PROFILE_PARAMETER) == '1' or request.headers.get(PROFILE_HEADER) == '1'
+
+
+def list_profiles(profile_dir=DEFAULT_PROFILE_DIR):
+    """Metadata of the saved profiles, newest first."""
+    profiles = []
+    for path in glob.glob(os.path.join(profile_dir, '*.json')):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    profiles.sort(key=lambda profile: profile['created'], reverse=True)
+    return profiles
+
+
+def save_profile(profiler, duration, profile_dir=DEFAULT_PROFILE_DIR, keep=DEFAULT_KEEP):
+    """Write the collapsed stacks and their metadata, and drop old profiles. Returns the file name."""
+    os.makedirs(profile_dir, exist_ok=True)
+    route = request.endpoint or 'unmatched'
+    now = datetime.now()
+    stem = f"{now.strftime('%Y%m%d-%H%M%S-%f')}-{route}"
+    filename = f"{stem}.collapsed"
+
+    with open(os.path.join(profile_dir, filename), 'w', encoding='utf-8') as f:
+        f.write(profiler.collapsed())
+    metadata = {
+        'file': filename,
+        'route': route,
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'duration_ms': round(duration * 1000, 3),
+        'samples': profiler.samples,
+        'interval_ms': profiler.interval * 1000,
+        'created': time.time(),
+        'created_at': now.isoformat(sep=' ', timespec='seconds'),
+    }
+    with open(os.path.join(profile_dir, f"{stem}.json"), 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=2)
+
+    for old_profile in list_profiles(profile_dir)[keep:]:
+        old_stem = os.path.splitext(old_profile['file'])[0]
+        for suffix in ('.collapsed', '.json'):
+            path = os.path.join(profile_dir, old_stem + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+
+    return filename
+
+
+def init_app(app):
+    """Profile requests that ask for it when profiling is enabled, and serve /debug/profiles."""
+    enabled = app.config.get('PROFILING', os.environ.get('APSTATS_PROFILING', '') in ('1', 'true'))
+    profile_dir = app.config.get('PROFILE_DIR', DEFAULT_PROFILE_DIR)
+    interval_ms = float(app.config.get('PROFILE_INTERVAL_MS', DEFAULT_INTERVAL_MS))
+    keep = int(app.config.get('PROFILE_KEEP', DEFAULT_KEEP))
+
+    def start_profile():
+        if enabled and _profile_requested():
+            g._profiler = SamplingProfiler(threading.get_ident(), interval_ms / 1000)
+            g._profiler.start()
+
+    def finish_profile(response):
+        profiler = g.pop('_profiler', None)
+        if profiler is not None:
+            duration = profiler.stop()
+            response.headers[PROFILE_HEADER] = save_profile(profiler, duration, profile_dir, keep)
+        return response
+
+    def stop_profile(exc):
+        # after_request is skipped when the view raises; the sampler must not outlive the request
+        profiler = g.pop('_profiler', None)
+        if profiler is not None:
+            save_profile(profiler, profiler.stop(), profile_dir, keep)
+
+    def local_only():
+        if request.remote_addr not in LOCAL_ADDRESSES:
+            abort(404)
+
+    def debug_profiles():
+        """Recent request profiles (local requests only)."""
+        local_only()
+        return render_template('profiles.html', profiles=list_profiles(profile_dir), enabled=enabled,
+                               parameter=PROFILE_PARAMETER, header=PROFILE_HEADER)
+
+    def debug_profile_file(filename):
+        """Download one collapsed stack file (local requests only)."""
+        local_only()
+        return send_from_directory(os.path.abspath(profile_dir), filename, mimetype='text/plain')
+
+    app.before_request(start_profile)
+    app.after_request(finish_profile)
+    app.teardown_request(stop_profile)
+    app.add_url_rule('/debug/profiles', 'debug_profiles', debug_profiles)
+    app.add_url_rule('/debug/profiles/<path:filename>', 'debug_profile_file', debug_profile_file)
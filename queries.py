@@ -0,0 +1,91 @@
+"""
+Read queries for the web app pages that need several kinds of rows at once.
+
+Each function answers one page with a single SQL statement: related rows
+are aggregated into JSON arrays by SQLite and decoded here, so a page
+costs one round trip however many topics or parts it shows.
+"""
+
+import json
+
+
+def get_problem_detail(conn, filename):
+    """
+    The problem named filename with its topic links and the other parts of its FRQ group.
+
+    Returns None if there is no such problem, otherwise a dict with:
+      problem            the problems row as a dict
+      topic_links        (topic_id, relevance_score, notes) tuples in course order
+      group_parts        the other parts of the FRQ group as dicts, in part order
+      structure_version  the course structure version (see course_tree.py)
+    """
+    cursor = conn.execute('''
+        SELECT p.*,
+               (SELECT json_group_array(json_array(topic_id, relevance_score, notes))
+                FROM (SELECT pt.topic_id, pt.relevance_score, pt.notes
+                      FROM problem_topics pt
+                      JOIN topics t ON t.topic_id = pt.topic_id
+                      WHERE pt.problem_id = p.problem_id
+                      ORDER BY t.unit_number, t.topic_seq)) AS topic_links,
+               (SELECT json_group_array(json_object('problem_id', problem_id,
+                                                    'problem_number', problem_number,
+                                                    'part_num', part_num))
+                FROM (SELECT g.problem_id, g.problem_number, g.part_num
+                      FROM problems g
+                      WHERE g.group_id = p.group_id AND g.problem_id != p.problem_id
+                      ORDER BY g.part_num, g.problem_number)) AS group_parts,
+               (SELECT value FROM app_meta WHERE key = 'structure_version') AS structure_version
+        FROM problems p
+        WHERE p.problem_number = ?
+        ORDER BY p.problem_id
+        LIMIT 1
+    ''', (filename,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+
+    problem = dict(zip([column[0] for column in cursor.description], row))
+    topic_links = problem.pop('topic_links')
+    group_parts = problem.pop('group_parts')
+    structure_version = problem.pop('structure_version')
+    return {
+        'problem': problem,
+        'topic_links': [tuple(link) for link in json.loads(topic_links)],
+        'group_parts': json.loads(group_parts) if problem['group_id'] else [],
+        'structure_version': structure_version or 0,
+    }
+
+
+def get_group_detail(conn, group_id):
+    """
+    All parts of the FRQ group group_id, each with its topic links.
+
+    Returns None if the group has no parts, otherwise a dict with:
+      parts              the problems rows as dicts in part order, each with
+                         its topic_links as (topic_id, relevance_score, notes)
+                         tuples in course order
+      structure_version  the course structure version (see course_tree.py)
+    """
+    cursor = conn.execute('''
+        SELECT p.*,
+               (SELECT json_group_array(json_array(topic_id, relevance_score, notes))
+                FROM (SELECT pt.topic_id, pt.relevance_score, pt.notes
+                      FROM problem_topics pt
+                      JOIN topics t ON t.topic_id = pt.topic_id
+                      WHERE pt.problem_id = p.problem_id
+                      ORDER BY t.unit_number, t.topic_seq)) AS topic_links,
+               (SELECT value FROM app_meta WHERE key = 'structure_version') AS structure_version
+        FROM problems p
+        WHERE p.group_id = ?
+        ORDER BY p.part_num, p.problem_number
+    ''', (group_id,))
+    columns = [column[0] for column in cursor.description]
+    parts = [dict(zip(columns, row)) for row in cursor]
+    if not parts:
+        return None
+
+    structure_version = 0
+    for part in parts:
+        part['topic_links'] = [tuple(link) for link in json.loads(part['topic_links'])]
+        structure_version = part.pop('structure_version') or 0
+    return {'parts': parts, 'structure_version': structure_version}
@@ -2,7 +2,9 @@ import os
 import sqlite3
 import re
 import glob
-import shutil
+
+from ap_stats_db import migrate, topic_seq
+from backup_database import backup_database
 
 def reset_database():
     """Reset the database and rebuild it from scratch."""
@@ -10,8 +12,7 @@ def reset_database():
     
     # Backup the existing database if it exists
     if os.path.exists(db_path):
-        backup_path = f"{db_path}.backup"
-        shutil.copy2(db_path, backup_path)
+        backup_path = backup_database(db_path)
         print(f"Backed up existing database to {backup_path}")
         
         # Delete the existing database
@@ -68,6 +69,7 @@ def reset_database():
     ''')
     
     conn.commit()
+    migrate(conn)
     print("Created database tables")
     
     # Import the knowledge tree
@@ -81,6 +83,7 @@ def reset_database():
         lines = file.readlines()
     
     current_unit_id = None
+    current_unit_number = None
     
     for line in lines:
         line = line.strip()
@@ -109,6 +112,7 @@ def reset_database():
                 
                 conn.commit()
                 current_unit_id = cursor.lastrowid
+                current_unit_number = unit_number
                 print(f"Added unit: {unit_name}")
         
         # Process topic lines
@@ -131,9 +135,10 @@ def reset_database():
                 
                 # Insert topic into database
                 cursor.execute('''
-                INSERT INTO topics (unit_id, topic_number, topic_name, full_path)
-                VALUES (?, ?, ?, ?)
-                ''', (current_unit_id, topic_number, topic_name, full_path))
+                INSERT INTO topics (unit_id, topic_number, topic_name, full_path, unit_number, topic_seq)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ''', (current_unit_id, topic_number, topic_name, full_path,
+                      current_unit_number, topic_seq(topic_number)))
                 
                 conn.commit()
                 print(f"Added topic: {topic}")
@@ -223,7 +228,7 @@ def reset_database():
         
         # Create the relationship
         cursor.execute('''
-            INSERT INTO problem_topics (problem_id, topic_id, relevance_score, notes)
+            INSERT OR IGNORE INTO problem_topics (problem_id, topic_id, relevance_score, notes)
             VALUES (?, ?, ?, ?)
         ''', (problem_id, topic_id, 5, "Added during database reset"))
         
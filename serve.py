@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Production server for the AP Stats web app: pre-forked worker processes.
+
+The master process builds the app with create_app(), which syncs the catalog,
+compiles the templates, loads the course tree and renders the home page. It
+then binds the listening socket and forks the workers, so every worker starts
+with all of that already in memory, shared with the master copy-on-write
+instead of loaded once per process. Each worker serves requests from the
+shared socket with werkzeug's threaded WSGI server; the kernel hands every
+new connection to one of them.
+
+The master only supervises:
+
+- a worker that dies is replaced;
+- SIGHUP, or a change in the course folder (images added, removed or
+  renamed), reloads gracefully: a new app is built and a new set of workers
+  forked, then the old workers stop taking connections and exit once their
+  requests and background jobs are finished (after at most
+  --graceful-timeout seconds);
+- SIGTERM or SIGINT stops the workers the same way and exits.
+
+Code changes are not picked up by a reload; restart the server for those.
+
+Usage:
+    python serve.py [--host 127.0.0.1] [--port 8000] [--workers N]
+"""
+
+import argparse
+import gc
+import glob
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+from werkzeug.wsgi import ClosingIterator
+
+from app import create_app
+from metrics import RETIRED_FILE
+from page_cache import course_fingerprint
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8000
+DEFAULT_WATCH_INTERVAL = 2.0  # seconds between checks of the course folder
+DEFAULT_GRACEFUL_TIMEOUT = 30.0  # seconds a stopping worker may spend on its last requests
+BACKLOG = 1024  # connections the kernel queues for the workers
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """Request handler without werkzeug's line per request on stderr."""
+
+    def log_request(self, code='-', size='-'):
+        pass
+
+
+class InFlight:
+    """WSGI middleware counting the requests being handled, so a stopping worker can wait for them."""
+
+    def __init__(self, app):
+        self.app = app
+        self.count = 0
+        self.stopping = False
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        with self._lock:
+            self.count += 1
+        if self.stopping:
+            # Keep-alive connections are closed after their response, not reused
+            def start_response(status, headers, exc_info=None, start_response=start_response):
+                return start_response(status, headers + [('Connection', 'close')], exc_info)
+        try:
+            response = self.app(environ, start_response)
+        except BaseException:
+            self._done()
+            raise
+        # The request is finished once the server has sent the body and closed it
+        return ClosingIterator(response, self._done)
+
+    def _done(self):
+        with self._lock:
+            self.count -= 1
+
+    def wait(self, timeout):
+        """Wait until no request is being handled. Returns whether that happened in time."""
+        deadline = time.monotonic() + timeout
+        while self.count and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return not self.count
+
+
+def listen(host, port):
+    """The listening socket shared by every worker."""
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(BACKLOG)
+    # Every worker is woken up for a new connection but only one gets it; the others
+    # must not block in accept(), where they would no longer see a shutdown request
+    sock.setblocking(False)
+    return sock
+
+
+def run_worker(app, sock, graceful_timeout, access_log=False):
+    """Serve app on sock until SIGTERM, then finish the requests in progress and exit."""
+    # Ctrl-C reaches the whole process group; only the master acts on it
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    in_flight = InFlight(app)
+    host, port = sock.getsockname()[:2]
+    server = make_server(host, port, in_flight, threaded=True, fd=sock.fileno(),
+                         request_handler=None if access_log else QuietRequestHandler)
+
+    def stop(signum, frame):
+        in_flight.stopping = True
+        # shutdown() waits for serve_forever() to return, so it cannot run in this thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+    signal.signal(signal.SIGTERM, stop)
+
+    server.serve_forever()
+    server.server_close()
+    deadline = time.monotonic() + graceful_timeout
+    if not in_flight.wait(graceful_timeout):
+        print(f"Worker {os.getpid()}: {in_flight.count} request(s) still running after "
+              f"{graceful_timeout:g}s, exiting anyway", file=sys.stderr)
+    # Job threads are daemon threads: exiting now would stop a backup or export halfway
+    if not app.extensions['jobs'].wait_idle(max(deadline - time.monotonic(), 0)):
+        print(f"Worker {os.getpid()}: background jobs still running after {graceful_timeout:g}s, "
+              f"exiting anyway", file=sys.stderr)
+    sys.exit(0)  # Runs the atexit handlers: operation log flush, metrics snapshot
+
+
+class Master:
+    """Forks the workers and keeps the right number of them running with the current app."""
+
+    def __init__(self, sock, workers, config, watch_interval=DEFAULT_WATCH_INTERVAL,
+                 graceful_timeout=DEFAULT_GRACEFUL_TIMEOUT, access_log=False):
+        self.sock = sock
+        self.workers = workers
+        self.config = config
+        self.watch_interval = watch_interval
+        self.graceful_timeout = graceful_timeout
+        self.access_log = access_log
+        self.app = None
+        self.generation = 0
+        self.children = {}  # pid -> generation
+        self.fingerprint = None
+        self.reload_requested = False
+        self.stop_requested = False
+
+    def build_app(self):
+        """Create and warm up the app the next workers will share."""
+        gc.unfreeze()
+        self.fingerprint = course_fingerprint(self.config['COURSE_DIR'])
+        started = time.perf_counter()
+        self.app = create_app(self.config)
+        self.generation += 1
+        # Objects moved to the permanent generation are skipped by the workers' garbage
+        # collector, which would otherwise touch (and so copy) the pages holding them
+        gc.collect()
+        gc.freeze()
+        print(f"Loaded the app (generation {self.generation}) in {time.perf_counter() - started:.2f}s")
+
+    def spawn(self):
+        """Fork one worker for the current app."""
+        # Output still buffered here would be printed again by the child
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            # The worker ends with SystemExit, which unwinds to the top so the atexit handlers run
+            try:
+                run_worker(self.app, self.sock, self.graceful_timeout, self.access_log)
+            except SystemExit:
+                raise
+            except BaseException:
+                traceback.print_exc()
+                sys.exit(1)
+        self.children[pid] = self.generation
+        return pid
+
+    def stop_children(self, generation=None):
+        """Ask the workers (of one generation, or all) to finish their requests and exit."""
+        for pid, child_generation in list(self.children.items()):
+            if generation is None or child_generation == generation:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+    def reap(self):
+        """Forget exited workers and return their pids."""
+        exited = []
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            generation = self.children.pop(pid, None)
+            if generation == self.generation and not self.stop_requested:
+                print(f"Worker {pid} exited unexpectedly (status {status}), starting a new one",
+                      file=sys.stderr)
+            exited.append(pid)
+        return exited
+
+    def reload(self, reason):
+        """Start workers for a freshly built app, then stop the previous ones."""
+        print(f"Reloading: {reason}")
+        previous = self.generation
+        try:
+            self.build_app()
+        except Exception:
+            traceback.print_exc()
+            print('Reload failed, the current workers keep running', file=sys.stderr)
+            return
+        for _ in range(self.workers):
+            self.spawn()
+        self.stop_children(previous)
+
+    def run(self):
+        signal.signal(signal.SIGHUP, lambda signum, frame: setattr(self, 'reload_requested', True))
+        signal.signal(signal.SIGTERM, lambda signum, frame: setattr(self, 'stop_requested', True))
+        signal.signal(signal.SIGINT, lambda signum, frame: setattr(self, 'stop_requested', True))
+
+        self.build_app()
+        for _ in range(self.workers):
+            self.spawn()
+        host, port = self.sock.getsockname()[:2]
+        print(f"Serving on http://{host}:{port}/ with {self.workers} worker(s) (master pid {os.getpid()})")
+
+        next_check = time.monotonic() + self.watch_interval
+        while not self.stop_requested:
+            time.sleep(0.2)
+            if self.reap():
+                # Jobs started by a worker that has exited will never finish
+                self.app.extensions['jobs'].fail_interrupted()
+
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload('SIGHUP')
+            elif self.watch_interval and time.monotonic() >= next_check:
+                next_check = time.monotonic() + self.watch_interval
+                if course_fingerprint(self.config['COURSE_DIR']) != self.fingerprint:
+                    self.reload('the course folder changed')
+
+            current = sum(1 for generation in self.children.values() if generation == self.generation)
+            for _ in range(self.workers - current):
+                self.spawn()
+
+        print('Stopping the workers...')
+        self.stop_children()
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self.children and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in self.children:
+            os.kill(pid, signal.SIGKILL)
+        self.app.extensions['jobs'].fail_interrupted()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the AP Stats web app with pre-forked worker processes.')
+    parser.add_argument('--host', default=os.environ.get('APSTATS_HOST', DEFAULT_HOST),
+                        help=f'address to listen on (default {DEFAULT_HOST})')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('APSTATS_PORT', DEFAULT_PORT)),
+                        help=f'port to listen on (default {DEFAULT_PORT})')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('APSTATS_WORKERS', os.cpu_count() or 1)),
+                        help='worker processes (default: APSTATS_WORKERS or the number of CPUs)')
+    parser.add_argument('--watch-interval', type=float, default=DEFAULT_WATCH_INTERVAL,
+                        help='seconds between checks of the course folder, 0 to only reload on SIGHUP')
+    parser.add_argument('--graceful-timeout', type=float, default=DEFAULT_GRACEFUL_TIMEOUT,
+                        help='seconds a stopping worker may spend finishing its requests')
+    parser.add_argument('--metrics-dir', default=os.environ.get('APSTATS_METRICS_DIR'),
+                        help='directory where workers share their metrics (default instance/metrics)')
+    parser.add_argument('--access-log', action='store_true', help='print a line per request')
+    args = parser.parse_args()
+
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+
+    metrics_dir = args.metrics_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'metrics')
+    # Snapshots of a previous run would be added to this run's counters
+    for path in glob.glob(os.path.join(metrics_dir, 'metrics-*.json')) + glob.glob(
+            os.path.join(metrics_dir, RETIRED_FILE)):
+        os.remove(path)
+
+    config = {
+        'DATABASE': os.path.abspath(os.environ.get('APSTATS_DB', 'ap_stats.db')),
+        'COURSE_DIR': os.path.abspath(os.environ.get('APSTATS_COURSE_DIR', 'AP_Statistics_Course')),
+        'METRICS_DIR': metrics_dir,
+    }
+    if not os.path.exists(config['DATABASE']):
+        print(f"Database not found: {config['DATABASE']}", file=sys.stderr)
+        return 1
+
+    sock = listen(args.host, args.port)
+    master = Master(sock, args.workers, config, args.watch_interval, args.graceful_timeout, args.access_log)
+    master.run()
+    sock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+"""
+Server-side sessions for the AP Stats web app, stored in SQLite.
+
+Flask's default session serializes and signs the whole session into the
+cookie, so the filters, flashes and anything else kept in it travel with
+every page and image request. With this interface the cookie only holds
+an opaque random session id; the data lives in the sessions table (in
+ap_stats.db unless SESSION_DB names another file).
+
+A session row is only written when its data changes or it is about to
+expire, and requests without a session cookie do not touch the database.
+Sessions kept in the app database are written by the app's single
+database writer when it is enabled (see db_writer.py).
+Expired rows are deleted at most once every SESSION_SWEEP_INTERVAL seconds.
+"""
+
+import secrets
+import sqlite3
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from ap_stats_db import create_sessions_table
+
+DEFAULT_SWEEP_INTERVAL = 3600  # seconds between deletions of expired sessions
+
+SESSION_ID_BYTES = 32
+
+
+class SqliteSession(CallbackDict, SessionMixin):
+    """Session data plus the id and stored state it was loaded with."""
+
+    def __init__(self, initial=None, sid=None, stored=None, expires=None):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.stored = stored  # serialized data as last written, None for a new session
+        self.expires = expires
+        self.modified = False
+        self.accessed = False
+
+    # Reading a value makes the response depend on the session (Vary: Cookie);
+    # checking for a key with `in` does not
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super().setdefault(key, default)
+
+
+class SqliteSessionInterface(SessionInterface):
+    """Keeps session data in a SQLite table, keyed by an opaque cookie."""
+
+    serializer = TaggedJSONSerializer()
+    session_class = SqliteSession
+
+    def __init__(self, db_path, sweep_interval=DEFAULT_SWEEP_INTERVAL, writer=None):
+        self.db_path = db_path
+        self.sweep_interval = sweep_interval
+        self.writer = writer  # db_writer.DbWriter for db_path, or None to write on a connection of our own
+        self._last_sweep = 0.0
+        self._sweep_lock = threading.Lock()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid:
+            return self.session_class()
+
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT data, expires FROM sessions WHERE id = ? AND expires > ?',
+                               (sid, time.time())).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return self.session_class()
+
+        data, expires = row
+        try:
+            initial = self.serializer.loads(data)
+        except ValueError:
+            return self.session_class()
+        return self.session_class(initial, sid, data, expires)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            # An emptied session is deleted along with its cookie
+            if session.sid is not None and session.modified:
+                self._execute('DELETE FROM sessions WHERE id = ?', (session.sid,))
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+                response.vary.add('Cookie')
+            return
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        now = time.time()
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        data = self.serializer.dumps(dict(session))
+        new_session = session.sid is None
+        # Sliding expiry: refresh a session once half of its lifetime has passed
+        refresh = not new_session and session.expires - now < lifetime / 2
+        if not new_session and data == session.stored and not refresh:
+            return
+
+        if new_session:
+            session.sid = secrets.token_urlsafe(SESSION_ID_BYTES)
+        session.expires = now + lifetime
+        self._execute('''
+            INSERT INTO sessions (id, data, expires) VALUES (?, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET data = excluded.data, expires = excluded.expires
+        ''', (session.sid, data, session.expires))
+        session.stored = data
+        self._sweep(now)
+
+        if new_session or refresh or session.permanent:
+            response.set_cookie(name, session.sid,
+                                expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app),
+                                domain=domain, path=path,
+                                secure=self.get_cookie_secure(app),
+                                samesite=self.get_cookie_samesite(app))
+
+    def _execute(self, sql, parameters=()):
+        if self.writer is not None:
+            return self.writer.run(lambda conn: conn.execute(sql, parameters).rowcount)
+        conn = self._connect()
+        try:
+            with conn:
+                return conn.execute(sql, parameters).rowcount
+        finally:
+            conn.close()
+
+    def _sweep(self, now):
+        if now - self._last_sweep < self.sweep_interval:
+            return
+        with self._sweep_lock:
+            if now - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = now
+        try:
+            self.sweep(now)
+        except sqlite3.Error as e:
+            print(f"Session sweep failed: {e}")
+
+    def sweep(self, now=None):
+        """Delete the expired sessions. Returns how many were deleted."""
+        return self._execute('DELETE FROM sessions WHERE expires <= ?', (now or time.time(),))
+
+
+def init_app(app, db_path='ap_stats.db'):
+    """Store the app's sessions in SQLite (SESSION_DB, default the app database)."""
+    session_db = app.config.get('SESSION_DB', db_path)
+    writer = app.extensions.get('db_writer')
+    if session_db != db_path:
+        writer = None  # Another file, with a write lock of its own
+        # A separate session database only needs the sessions table
+        conn = sqlite3.connect(session_db)
+        try:
+            create_sessions_table(conn)
+            conn.commit()
+        finally:
+            conn.close()
+    app.session_interface = SqliteSessionInterface(
+        session_db, app.config.get('SESSION_SWEEP_INTERVAL', DEFAULT_SWEEP_INTERVAL), writer)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Query the slow query log written by the web app.
+
+By default statements are grouped by their normalized SQL and listed with
+how often they were slow, their average and worst duration, the routes
+that ran them and the last captured query plan. Plans that contain a full
+table scan are flagged.
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import time
+from collections import defaultdict
+
+from instrumentation import DEFAULT_SLOW_QUERY_LOG
+
+# "SCAN problems" is a full table scan, "SCAN t USING INDEX ..." is not
+FULL_SCAN_PATTERN = re.compile(r'^SCAN (?!.*\bUSING\b)(?!CONSTANT ROW)')
+
+
+def read_entries(log_path=DEFAULT_SLOW_QUERY_LOG):
+    """Read all entries of the log and its rotated files, oldest first."""
+    # Rotated files are log.1 (newest) to log.N (oldest)
+    rotated = [path for path in glob.glob(f"{log_path}.*") if path.rsplit('.', 1)[1].isdigit()]
+    rotated.sort(key=lambda path: int(path.rsplit('.', 1)[1]), reverse=True)
+
+    for path in rotated + [log_path]:
+        if not os.path.exists(path):
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def has_full_scan(entry):
+    """Whether the captured plan of an entry contains a full table scan."""
+    return any(FULL_SCAN_PATTERN.match(step) for step in entry.get('plan') or [])
+
+
+def filter_entries(entries, route=None, min_ms=None, since_hours=None, full_scans=False):
+    """Filter log entries by route, duration, age and plan."""
+    oldest = time.time() - since_hours * 3600 if since_hours else None
+    for entry in entries:
+        if route and entry.get('route') != route:
+            continue
+        if min_ms is not None and entry['duration_ms'] < min_ms:
+            continue
+        if oldest and entry['time'] < oldest:
+            continue
+        if full_scans and not has_full_scan(entry):
+            continue
+        yield entry
+
+
+def summarize(entries):
+    """Group entries by normalized SQL, slowest total time first."""
+    groups = defaultdict(lambda: {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'routes': set(), 'last': None})
+    for entry in entries:
+        group = groups[entry['sql']]
+        group['count'] += 1
+        group['total_ms'] += entry['duration_ms']
+        group['max_ms'] = max(group['max_ms'], entry['duration_ms'])
+        group['routes'].add(entry.get('route') or '-')
+        group['last'] = entry
+
+    return sorted(groups.items(), key=lambda item: item[1]['total_ms'], reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show statements from the slow query log.')
+    parser.add_argument('--log', default=DEFAULT_SLOW_QUERY_LOG, help='slow query log file')
+    parser.add_argument('--route', help='only statements run by this route (endpoint name)')
+    parser.add_argument('--min-ms', type=float, help='only statements slower than this')
+    parser.add_argument('--since', type=float, help='only statements from the last N hours')
+    parser.add_argument('--full-scans', action='store_true', help='only statements whose plan has a full table scan')
+    parser.add_argument('--top', type=int, default=20, help='number of statements to show')
+    parser.add_argument('--raw', action='store_true', help='print matching entries as JSON lines instead')
+    args = parser.parse_args()
+
+    entries = filter_entries(read_entries(args.log), args.route, args.min_ms, args.since, args.full_scans)
+
+    if args.raw:
+        for entry in entries:
+            print(json.dumps(entry))
+        return
+
+    groups = summarize(entries)
+    if not groups:
+        print(f"No slow queries found in {args.log}")
+        return
+
+    print(f"=== Slow queries in {args.log} ({len(groups)} distinct statements) ===")
+    for sql, group in groups[:args.top]:
+        last = group['last']
+        flag = '  [FULL SCAN]' if has_full_scan(last) else ''
+        print(f"\n{group['count']}x, avg {group['total_ms'] / group['count']:.1f} ms, "
+              f"max {group['max_ms']:.1f} ms, routes: {', '.join(sorted(group['routes']))}{flag}")
+        print(f"  SQL: {sql}")
+        print(f"  Params: {last.get('params')}")
+        for step in last.get('plan') or []:
+            print(f"  Plan: {step}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Generate a synthetic AP Stats corpus for load and benchmark testing.
+
+A corpus is a directory with its own ap_stats.db and AP_Statistics_Course
+tree, laid out exactly like the real ones, so the web app can be run from
+it. The units and topics come from the real knowledge tree; the problems,
+their images and their topic links are made up at whatever scale is asked
+for. Images are tiny placeholder PNGs. The same seed always produces the
+same corpus.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sqlite3
+import struct
+import time
+import zlib
+
+from ap_stats_db import APStatsDatabase
+from catalog import sync_catalog
+
+TREE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'APStats-StructuredTree.txt')
+MANIFEST_FILE = 'corpus.json'
+
+DEFAULT_YEARS = 10
+DEFAULT_IMAGES = 5000
+DEFAULT_LINKS = 50000
+DEFAULT_SEED = 0
+LAST_YEAR = 2024
+
+FRQS_PER_YEAR = 6
+SUBFOLDER_SHARE = 0.3  # share of images stored in a topic subfolder rather than the unit folder
+
+# Filename patterns seen in the real course folders
+MCQ_NAMES = ('{year}_AP_MCQ_{num:02d}.png', '{year} apstats exam MCQ{num}.png', '{year}APexamMCQ{num}.png')
+FRQ_NAMES = ('{year}APexam FRQ{num}-{part}.png', '{year} APexam Frq{num}-{part}.png')
+
+DESCRIPTION_WORDS = (
+    'sample', 'survey', 'experiment', 'boxplot', 'histogram', 'regression', 'residual', 'correlation',
+    'probability', 'binomial', 'geometric', 'normal', 'confidence', 'interval', 'significance', 'test',
+    'proportion', 'mean', 'slope', 'chi-square', 'sampling', 'distribution', 'variance', 'outlier',
+)
+
+
+def placeholder_png():
+    """Bytes of a valid 1x1 grey PNG."""
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data
+                + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+    header = struct.pack('>IIBBBBB', 1, 1, 8, 0, 0, 0, 0)  # 1x1, 8-bit greyscale
+    pixels = zlib.compress(b'\x00\x80')  # filter byte + one pixel
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', pixels) + chunk(b'IEND', b'')
+
+
+def create_database(db_path):
+    """Create the schema and import the real knowledge tree."""
+    with contextlib.redirect_stdout(io.StringIO()):  # import_knowledge_tree prints every line
+        db = APStatsDatabase(db_path)
+        db.import_knowledge_tree(TREE_FILE)
+    return db.conn
+
+
+def plan_problems(rng, years, images):
+    """
+    Decide the problems of every exam year.
+
+    Returns (filename, year, problem_type, problem_num) tuples. Each year gets
+    FRQS_PER_YEAR free response questions of 2 to 4 parts and is filled up
+    with multiple choice questions until the year has its share of images.
+    """
+    first_year = LAST_YEAR - years + 1
+    problems = []
+
+    for index, year in enumerate(range(first_year, LAST_YEAR + 1)):
+        # Spread the remainder over the first years
+        year_images = images // years + (1 if index < images % years else 0)
+
+        frq_parts = []
+        for num in range(1, FRQS_PER_YEAR + 1):
+            name = rng.choice(FRQ_NAMES)
+            for part in range(1, rng.randint(2, 4) + 1):
+                frq_parts.append((name.format(year=year, num=num, part=part), year, 'Free Response', str(num)))
+        frq_parts = frq_parts[:year_images]
+
+        for num in range(1, year_images - len(frq_parts) + 1):
+            name = rng.choice(MCQ_NAMES).format(year=year, num=num)
+            problems.append((name, year, 'Multiple Choice', str(num)))
+        problems.extend(frq_parts)
+
+    return problems
+
+
+def generate_corpus(target_dir, years=DEFAULT_YEARS, images=DEFAULT_IMAGES, links=DEFAULT_LINKS,
+                    seed=DEFAULT_SEED, force=False):
+    """
+    Build a synthetic corpus in target_dir and return its manifest.
+
+    The corpus has `images` problems (one image each) spread over `years`
+    exam years and `links` problem-topic links. Existing corpus files in
+    target_dir are only replaced when force is set.
+    """
+    db_path = os.path.join(target_dir, 'ap_stats.db')
+    course_dir = os.path.join(target_dir, 'AP_Statistics_Course')
+    if os.path.exists(db_path) or os.path.exists(course_dir):
+        if not force:
+            raise FileExistsError(f"{target_dir} already contains a corpus (use force to replace it)")
+        if os.path.exists(db_path):
+            os.remove(db_path)
+        shutil.rmtree(course_dir, ignore_errors=True)
+
+    os.makedirs(target_dir, exist_ok=True)
+    start_time = time.perf_counter()
+    rng = random.Random(seed)
+    conn = create_database(db_path)
+
+    # Topics by unit, with the folder each one maps to inside target_dir
+    units = conn.execute('SELECT unit_id, full_path FROM units ORDER BY unit_number').fetchall()
+    unit_topics = {unit_id: [] for unit_id, _ in units}
+    for topic_id, unit_id, full_path in conn.execute(
+            'SELECT topic_id, unit_id, full_path FROM topics ORDER BY topic_id'):
+        unit_topics[unit_id].append((topic_id, full_path))
+    all_topic_ids = [topic_id for topics in unit_topics.values() for topic_id, _ in topics]
+    unit_paths = dict(units)
+
+    problems = plan_problems(rng, years, images)
+    problem_rows = []
+    link_rows = []
+    image_paths = []
+
+    for problem_id, (filename, year, problem_type, problem_num) in enumerate(problems, 1):
+        description = ' '.join(rng.sample(DESCRIPTION_WORDS, 3))
+        problem_rows.append((problem_id, filename, f"{year} exam: {description}", f"{year} AP Exam",
+                             year, rng.randint(1, 5), problem_type, problem_num))
+
+        # Links are spread as evenly as possible, the primary topic first
+        count = links // len(problems) + (1 if problem_id <= links % len(problems) else 0)
+        unit_id = rng.choice(list(unit_topics))
+        primary_id, primary_path = rng.choice(unit_topics[unit_id])
+        others = [topic_id for topic_id in all_topic_ids if topic_id != primary_id]
+        topic_ids = [primary_id] + rng.sample(others, min(max(count - 1, 0), len(others)))
+        for topic_id in topic_ids[:count]:
+            link_rows.append((problem_id, topic_id, rng.randint(1, 5), None))
+
+        folder = primary_path if rng.random() < SUBFOLDER_SHARE else unit_paths[unit_id]
+        image_paths.append(os.path.join(target_dir, *folder.replace('\\', '/').split('/'), filename))
+
+    conn.executemany('''
+        INSERT INTO problems (problem_id, problem_number, description, source, year, difficulty,
+                              problem_type, problem_num)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', problem_rows)
+    conn.executemany('''
+        INSERT INTO problem_topics (problem_id, topic_id, relevance_score, notes)
+        VALUES (?, ?, ?, ?)
+    ''', link_rows)
+    conn.commit()
+    conn.close()
+
+    png = placeholder_png()
+    for unit_path in unit_paths.values():
+        os.makedirs(os.path.join(target_dir, *unit_path.replace('\\', '/').split('/')), exist_ok=True)
+    for image_path in image_paths:
+        os.makedirs(os.path.dirname(image_path), exist_ok=True)
+        with open(image_path, 'wb') as f:
+            f.write(png)
+
+    # Group ids, part numbers and image paths come from the files just written
+    conn = sqlite3.connect(db_path)
+    sync_catalog(conn, course_dir)
+    conn.close()
+
+    manifest = {
+        'seed': seed,
+        'years': years,
+        'images': len(problem_rows),
+        'links': len(link_rows),
+        'topics': len(all_topic_ids),
+        'generated_seconds': round(time.perf_counter() - start_time, 3),
+    }
+    with open(os.path.join(target_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+
+def load_manifest(target_dir):
+    """The manifest of a generated corpus, or None if target_dir is not one."""
+    path = os.path.join(target_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic AP Stats corpus for benchmarking.')
+    parser.add_argument('target', help='directory to create the corpus in')
+    parser.add_argument('--years', type=int, default=DEFAULT_YEARS, help='number of exam years')
+    parser.add_argument('--images', type=int, default=DEFAULT_IMAGES, help='number of problem images')
+    parser.add_argument('--links', type=int, default=DEFAULT_LINKS, help='number of problem-topic links')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='random seed')
+    parser.add_argument('--force', action='store_true', help='replace an existing corpus in the target')
+    args = parser.parse_args()
+
+    manifest = generate_corpus(args.target, args.years, args.images, args.links, args.seed, args.force)
+    print(f"Generated corpus in {args.target}")
+    print(f"  - {manifest['years']} exam years, {manifest['images']} images, {manifest['links']} topic links")
+    print(f"  - Took {manifest['generated_seconds']:.2f}s")
+    print(f"Run the app from it with: cd {args.target} && python {os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')}")
+
+
+if __name__ == "__main__":
+    main()
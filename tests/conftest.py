@@ -0,0 +1,53 @@
+import os
+import shutil
+import sqlite3
+import sys
+
+import pytest
+
+# The modules live at the top of the repository
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from ap_stats_db import ensure_schema  # noqa: E402
+from app import create_app  # noqa: E402
+
+
+@pytest.fixture
+def committed_database(tmp_path):
+    """Path of a copy of the committed database, which has not been migrated."""
+    path = tmp_path / 'ap_stats.db'
+    shutil.copy(os.path.join(REPO_DIR, 'ap_stats.db'), path)
+    return str(path)
+
+
+@pytest.fixture
+def database(committed_database):
+    """Path of a migrated copy of the committed database."""
+    ensure_schema(committed_database)
+    return committed_database
+
+
+@pytest.fixture
+def conn(database):
+    """A connection to the migrated copy of the committed database."""
+    conn = sqlite3.connect(database)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def course_dir(tmp_path):
+    """An empty course folder; tests add the unit folders they need."""
+    path = tmp_path / 'course'
+    path.mkdir()
+    return path
+
+
+@pytest.fixture
+def make_app(database, course_dir):
+    """Factory for test apps on the migrated database, without warm-up or template cache."""
+    def make_app(**config):
+        return create_app({'DATABASE': database, 'COURSE_DIR': str(course_dir), 'TEMPLATE_CACHE_DIR': None,
+                           'WARM_UP': False, 'TESTING': True, **config})
+    return make_app
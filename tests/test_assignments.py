@@ -0,0 +1,37 @@
+import pytest
+
+from assignments import apply_assignments
+from course_tree import get_course_tree
+
+
+@pytest.fixture
+def topics(conn, database):
+    return get_course_tree(conn, database).topics_by_number
+
+
+def links(conn):
+    """The topic links of problem 1 as (problem_id, topic_id, relevance_score)."""
+    return set(conn.execute('SELECT problem_id, topic_id, relevance_score FROM problem_topics WHERE problem_id = 1'))
+
+
+@pytest.mark.parametrize('item, error', [
+    ({'problem_id': 1, 'topic_number': ['1.1']}, 'topic_number must be a string'),
+    ({'filename': ['x'], 'topic_number': '1.1'}, 'filename must be a string'),
+    ({'problem_id': True, 'topic_number': '1.1'}, 'problem_id must be an integer'),
+])
+def test_malformed_items_are_item_errors(conn, topics, item, error):
+    before = links(conn)
+    applied, results = apply_assignments(conn, [item], topics)
+
+    assert not applied
+    assert results == [{'index': 0, 'status': 'error', 'error': error}]
+    assert links(conn) == before
+
+
+def test_valid_item_is_created(conn, topics):
+    before = links(conn)
+    applied, results = apply_assignments(conn, [{'problem_id': 1, 'topic_number': '1.1'}], topics)
+
+    assert applied
+    assert results[0]['status'] == 'created'
+    assert links(conn) == before | {(1, topics['1.1'].topic_id, 5)}
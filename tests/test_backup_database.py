@@ -0,0 +1,68 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+from backup_database import backup_database, get_backup_metrics, list_backups
+
+
+def table_counts(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        return {table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] for table in tables}
+    finally:
+        conn.close()
+
+
+def test_backup_restores_the_database(database, tmp_path):
+    backup_dir = tmp_path / 'backups'
+    expected = table_counts(database)
+    progress = []
+
+    backup_path = backup_database(database, str(backup_dir), pages=8, step_sleep=0,
+                                  on_progress=lambda copied, total: progress.append((copied, total)))
+
+    assert list_backups(database, str(backup_dir)) == [backup_path]
+    assert os.listdir(backup_dir) == [os.path.basename(backup_path)]
+    assert len(progress) > 1 and progress[-1][0] == progress[-1][1]
+    assert get_backup_metrics()['last_backup_path'] == backup_path
+
+    # Restoring is copying the backup over the database: the later changes are gone
+    conn = sqlite3.connect(database)
+    with conn:
+        conn.execute('DELETE FROM problems')
+    conn.close()
+    shutil.copy(backup_path, database)
+
+    assert table_counts(database) == expected
+    conn = sqlite3.connect(database)
+    assert conn.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+    conn.close()
+
+
+def test_failed_backup_leaves_no_file(database, tmp_path):
+    backup_dir = tmp_path / 'backups'
+    failures = get_backup_metrics()['failures_total']
+
+    def abort(copied, total):
+        raise RuntimeError('stop')
+
+    with pytest.raises(RuntimeError):
+        backup_database(database, str(backup_dir), pages=8, step_sleep=0, on_progress=abort)
+
+    assert os.listdir(backup_dir) == []
+    assert get_backup_metrics()['failures_total'] == failures + 1
+    assert get_backup_metrics()['last_error'] == 'stop'
+
+
+def test_old_backups_are_rotated(database, tmp_path):
+    backup_dir = str(tmp_path / 'backups')
+    paths = []
+    for age in range(3):
+        paths.append(backup_database(database, backup_dir, keep=2, step_sleep=0))
+        # Backups are ordered by modification time, which can tie within a test
+        os.utime(paths[-1], (1000 + age, 1000 + age))
+
+    assert list_backups(database, backup_dir) == [paths[2], paths[1]]
@@ -0,0 +1,23 @@
+import pytest
+
+from bulk_metadata import plan_changes
+
+
+@pytest.mark.parametrize('row, error', [
+    ({'filename': ['x'], 'year': 2019}, 'filename must be a string'),
+    ({'problem_id': 1.7, 'year': 2019}, 'problem_id must be an integer'),
+    ({'problem_id': True, 'year': 2019}, 'problem_id must be an integer'),
+])
+def test_malformed_rows_are_row_errors(conn, row, error):
+    plan = plan_changes(conn, [row])
+
+    assert not plan['valid']
+    assert plan['results'] == [{'index': 0, 'status': 'error', 'error': error}]
+
+
+def test_csv_values_are_parsed(conn):
+    year = conn.execute('SELECT year FROM problems WHERE problem_id = 1').fetchone()[0]
+    plan = plan_changes(conn, [{'problem_id': '1', 'year': str(year + 1)}])
+
+    assert plan['valid']
+    assert plan['diff'][0]['changes']['year'] == [year, year + 1]
@@ -0,0 +1,56 @@
+import sqlite3
+
+import pytest
+
+from course_tree import get_course_tree
+
+
+def test_tree_is_shared_until_the_structure_changes(conn, database):
+    tree = get_course_tree(conn, database)
+    assert get_course_tree(conn, database) is tree
+
+    # Linking problems to topics is not a structure change
+    with conn:
+        conn.execute('DELETE FROM problem_topics')
+    assert get_course_tree(conn, database) is tree
+
+    with conn:
+        conn.execute("UPDATE topics SET topic_name = 'Renamed' WHERE topic_number = '1.1'")
+    reloaded = get_course_tree(conn, database)
+    assert reloaded is not tree
+    assert reloaded.topics_by_number['1.1'].topic_name == 'Renamed'
+    assert tree.topics_by_number['1.1'].topic_name != 'Renamed'  # Requests holding the old tree are unaffected
+
+
+def test_tree_is_in_course_order_and_immutable(conn, database):
+    unit_id = conn.execute('SELECT unit_id FROM units WHERE unit_number = 1').fetchone()[0]
+    with conn:
+        for number in ('1.11', '1.9'):
+            conn.execute('DELETE FROM topics WHERE topic_number = ?', (number,))
+        conn.execute('''
+            INSERT INTO topics (unit_id, topic_number, topic_name, unit_number, topic_seq)
+            VALUES (?, '1.11', 'Eleventh', 1, 11), (?, '1.9', 'Ninth', 1, 9)
+        ''', (unit_id, unit_id))
+    tree = get_course_tree(conn, database)
+
+    numbers = [topic.topic_number for topic in tree.units_by_number[1].topics]
+    assert numbers.index('1.9') < numbers.index('1.10') < numbers.index('1.11')
+    assert [topic.topic_number for topic in tree.topics][:len(numbers)] == numbers
+
+    topic = tree.topics_by_number['1.9']
+    assert topic.unit.unit_number == 1 and tree.topic(str(topic.topic_id)) is topic
+    with pytest.raises(AttributeError):
+        topic.topic_name = 'Changed'
+    with pytest.raises(TypeError):
+        tree.topics_by_number['1.9'] = topic
+
+
+def test_pages_show_an_imported_topic_change(make_app, database):
+    client = make_app().test_client()
+    assert 'Renamed topic' not in client.get('/topics').get_data(as_text=True)
+
+    conn = sqlite3.connect(database)
+    with conn:
+        conn.execute("UPDATE topics SET topic_name = 'Renamed topic' WHERE topic_number = '2.1'")
+    conn.close()
+    assert 'Renamed topic' in client.get('/topics').get_data(as_text=True)
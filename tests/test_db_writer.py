@@ -0,0 +1,76 @@
+import sqlite3
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import pytest
+
+from db_writer import DbWriter
+from operation_log import OperationLog
+
+
+def test_timed_out_write_is_not_applied(tmp_path):
+    db_path = str(tmp_path / 'writer.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE t (value TEXT)')
+    conn.commit()
+    conn.close()
+
+    writer = DbWriter(db_path, batch_window=0)
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow(db):
+        started.set()
+        release.wait(5)
+        db.execute("INSERT INTO t VALUES ('slow')")
+
+    blocking = writer.submit(slow)
+    assert started.wait(5)
+
+    # The writer is busy with the slow write, so this one times out while still queued
+    with pytest.raises(FutureTimeoutError):
+        writer.run(lambda db: db.execute("INSERT INTO t VALUES ('late')"), timeout=0.05)
+
+    release.set()
+    blocking.result(5)
+    writer.run(lambda db: None, timeout=5)  # Everything queued before it has been handled
+
+    conn = sqlite3.connect(db_path)
+    values = [row[0] for row in conn.execute('SELECT value FROM t')]
+    conn.close()
+    assert values == ['slow']
+
+
+def count_runs(writer):
+    calls = []
+    run = writer.run
+
+    def counting_run(operation, timeout=30.0):
+        calls.append(operation)
+        return run(operation, timeout)
+    writer.run = counting_run
+    return calls
+
+
+def test_operation_log_is_written_by_the_writer(database):
+    writer = DbWriter(database, batch_window=0)
+    calls = count_runs(writer)
+    log = OperationLog(database, writer=writer)
+    log.record('test_operation', {'links': 1})
+
+    assert log.flush() == 1
+    assert len(calls) == 1
+    assert [entry['operation'] for entry in log.recent()] == ['test_operation']
+
+
+def test_sessions_are_written_by_the_writer(database, make_app):
+    app = make_app(DB_WRITER=True)
+    calls = count_runs(app.extensions['db_writer'])
+
+    client = app.test_client()
+    client.get('/problem/missing.png')  # Flashes a message, so the session is saved
+    assert len(calls) == 2  # The new session and the first sweep of expired ones
+
+    conn = sqlite3.connect(database)
+    assert conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0] == 1
+    conn.close()
@@ -0,0 +1,118 @@
+import json
+import os
+import sqlite3
+from collections import Counter
+
+import pytest
+
+from ap_stats_db import SchemaOutOfDate
+from export_for_app import (build_sqlite_bundle, connect_to_database, export_questions, iter_problem_rows,
+                            iter_problems, iter_questions)
+
+LESSONS_SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'allUnitsData.js')
+
+
+@pytest.fixture
+def conn(database):
+    conn = connect_to_database(database)
+    yield conn
+    conn.close()
+
+
+def export(conn, output_dir, force=False):
+    return export_questions(conn, str(output_dir), legacy_file=None, force=force, lessons_source=LESSONS_SOURCE)
+
+
+def unlink_unit(conn, unit_number):
+    conn.execute('''
+        DELETE FROM problem_topics
+        WHERE topic_id IN (SELECT topic_id FROM topics t JOIN units u ON u.unit_id = t.unit_id
+                           WHERE u.unit_number = ?)
+    ''', (unit_number,))
+
+
+def test_frq_groups_follow_the_stored_group_id(conn):
+    # A lower-case "frq1" is not an FRQ group for the catalog, though it shares the number of one
+    conn.execute('''
+        UPDATE problems SET problem_number = '2017 APexam frq1 content.png', problem_num = '1'
+        WHERE problem_number = '2017 APexam frq3 content.png'
+    ''')
+    questions = [question for question, _ in iter_questions(iter_problems(iter_problem_rows(conn)))]
+    frqs = {question['id']: question for question in questions if question['type'] == 'FRQ'}
+
+    # Every group is exported once, with all of its parts
+    assert not [key for key, count in Counter(q['id'] for q in questions).items() if count > 1]
+    group_sizes = dict(conn.execute('''
+        SELECT group_id, COUNT(*) FROM problems
+        WHERE group_id IS NOT NULL AND problem_id IN (SELECT problem_id FROM problem_topics)
+        GROUP BY group_id
+    '''))
+    assert {key: len(question['parts']) for key, question in frqs.items() if key in group_sizes} == group_sizes
+
+
+def test_export_refuses_a_database_that_was_not_migrated(committed_database):
+    with pytest.raises(SchemaOutOfDate):
+        connect_to_database(committed_database)
+    conn = sqlite3.connect(committed_database)
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == 0
+    conn.close()
+
+
+def test_export_rewrites_only_changed_shards(conn, tmp_path):
+    output_dir = tmp_path / 'export'
+    first = export(conn, output_dir)
+    assert [unit['file'] for unit in first['units']] == [f"unit-{number}.json" for number in range(1, 10)]
+
+    assert export(conn, output_dir)['changes'] == {'added': [], 'removed': [], 'changed': [], 'files': []}
+
+    # Unlinking every problem of unit 9 removes its shard and the questions only it had
+    unit9 = {question['id'] for question in json.loads((output_dir / 'unit-9.json').read_text())}
+    unlink_unit(conn, 9)
+    changes = export(conn, output_dir)['changes']
+    assert 'unit-9.json' in changes['files'] and 'unit-1.json' not in changes['files']
+    assert changes['removed'] and set(changes['removed']) <= {str(question_id) for question_id in unit9}
+    assert not (output_dir / 'unit-9.json').exists()
+
+    changelog = (output_dir / 'changelog.jsonl').read_text().splitlines()
+    assert len(changelog) == 2  # The unchanged run added no entry
+
+
+def test_forced_export_removes_stale_shards(conn, tmp_path):
+    output_dir = tmp_path / 'export'
+    export(conn, output_dir)
+    unlink_unit(conn, 8)
+
+    changes = export(conn, output_dir, force=True)['changes']
+    assert 'unit-1.json' in changes['files']  # Rewritten although unchanged
+    assert not (output_dir / 'unit-8.json').exists()
+
+
+def test_sqlite_bundle_matches_the_export(conn, tmp_path):
+    bundle_path = str(tmp_path / 'questions.sqlite')
+    bundle = build_sqlite_bundle(conn, bundle_path)
+    assert bundle['changed']
+
+    questions = [question for question, _ in iter_questions(iter_problems(iter_problem_rows(conn)))]
+    parts = sum(len(question['parts']) if question['type'] == 'FRQ' else 1 for question in questions)
+    checksum = (tmp_path / 'questions.sqlite.sha256').read_text().split()[0]
+    assert (bundle['problems'], checksum) == (parts, bundle['sha256'])
+
+    reader = sqlite3.connect(f"{(tmp_path / 'questions.sqlite').as_uri()}?immutable=1", uri=True)
+    assert reader.execute('SELECT COUNT(*) FROM problems').fetchone()[0] == parts
+    lesson = {str(question['id']) for question in questions if '1-7' in question['linkedLessonIds']}
+    found = reader.execute('''
+        SELECT DISTINCT COALESCE(p.group_id, p.problem_id) FROM topics t
+        JOIN problem_topics pt ON pt.topic_id = t.topic_id
+        JOIN problems p ON p.problem_id = pt.problem_id
+        WHERE t.lesson_id = ?
+    ''', ('1-7',))
+    assert lesson and {str(row[0]) for row in found} == lesson
+    plan = ' '.join(row[3] for row in reader.execute(
+        'EXPLAIN QUERY PLAN SELECT topic_id FROM topics WHERE lesson_id = ?', ('1-7',)))
+    assert 'COVERING INDEX idx_topics_lesson' in plan
+    reader.close()
+
+    # An unchanged catalog leaves the bundle alone; a changed one replaces it
+    assert not build_sqlite_bundle(conn, bundle_path)['changed']
+    unlink_unit(conn, 9)
+    assert build_sqlite_bundle(conn, bundle_path)['changed']
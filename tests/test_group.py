@@ -0,0 +1,85 @@
+import sqlite3
+
+import pytest
+
+GROUP_ID = '2018_FRQ_6'
+
+
+@pytest.fixture
+def client(make_app):
+    return make_app().test_client()
+
+
+def group_links(database, topic_id):
+    """Parts of the group linked to the topic, by problem id."""
+    conn = sqlite3.connect(database)
+    try:
+        return {problem_id for (problem_id,) in conn.execute('''
+            SELECT pt.problem_id FROM problem_topics pt JOIN problems p ON p.problem_id = pt.problem_id
+            WHERE p.group_id = ? AND pt.topic_id = ?
+        ''', (GROUP_ID, topic_id))}
+    finally:
+        conn.close()
+
+
+def group_parts(database):
+    conn = sqlite3.connect(database)
+    try:
+        return [row[0] for row in conn.execute(
+            'SELECT problem_id FROM problems WHERE group_id = ? ORDER BY part_num', (GROUP_ID,))]
+    finally:
+        conn.close()
+
+
+def unused_topic(database):
+    conn = sqlite3.connect(database)
+    try:
+        return conn.execute('''
+            SELECT topic_id FROM topics WHERE topic_id NOT IN (
+                SELECT topic_id FROM problem_topics JOIN problems USING (problem_id) WHERE group_id = ?)
+            ORDER BY topic_id LIMIT 1
+        ''', (GROUP_ID,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_group_page_shows_every_part(client, database):
+    response = client.get(f'/group/{GROUP_ID}')
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    assert '2018' in page
+    for problem_id in group_parts(database):
+        assert f'value="{problem_id}"' in page
+
+
+def test_unknown_group_redirects_home(client):
+    response = client.get('/group/1999_FRQ_9')
+    assert response.status_code == 302
+    assert response.headers['Location'] == '/'
+
+
+def test_topic_is_added_to_every_part_and_removed_from_one(client, database):
+    topic_id = unused_topic(database)
+    parts = group_parts(database)
+
+    response = client.post(f'/group/{GROUP_ID}/add_topic', data={'topic_id': topic_id})
+    assert response.headers['Location'] == f'/group/{GROUP_ID}'
+    assert group_links(database, topic_id) == set(parts)
+    assert 'Topic added to 3 part(s)' in client.get(f'/group/{GROUP_ID}').get_data(as_text=True)
+
+    client.post(f'/group/{GROUP_ID}/add_topic', data={'topic_id': topic_id})
+    assert 'already linked' in client.get(f'/group/{GROUP_ID}').get_data(as_text=True)
+
+    client.post(f'/group/{GROUP_ID}/remove_topic', data={'topic_id': topic_id, 'problem_id': parts[0]})
+    assert group_links(database, topic_id) == set(parts[1:])
+
+
+def test_topic_is_added_to_the_selected_parts(client, database):
+    topic_id = unused_topic(database)
+    parts = group_parts(database)
+
+    client.post(f'/group/{GROUP_ID}/add_topic', data={'topic_id': topic_id, 'problem_id': parts[:2]})
+    assert group_links(database, topic_id) == set(parts[:2])
+
+    client.post(f'/group/{GROUP_ID}/remove_topic', data={'topic_id': topic_id})
+    assert group_links(database, topic_id) == set()
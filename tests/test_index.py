@@ -0,0 +1,45 @@
+import pytest
+
+
+@pytest.fixture
+def make_client(make_app, course_dir):
+    (course_dir / 'Unit 3- Collecting Data').mkdir()
+
+    def make_client(**config):
+        return make_app(**config).test_client()
+    return make_client
+
+
+def test_filters_are_remembered_in_the_session_by_default(make_client):
+    client = make_client()
+    response = client.get('/?unit_filter=3&show_uncategorized=true')
+    assert response.status_code == 200
+    assert response.cache_control.private and 'public' not in response.headers['Cache-Control']
+    assert 'Cookie' in response.vary
+
+    # The plain home page shows the filters chosen last
+    page = client.get('/').get_data(as_text=True)
+    assert 'Show All Problems' in page
+    assert 'href="/?show_uncategorized=true&amp;unit_filter="' in page  # "All Units" clears the unit filter
+
+    client.get('/?show_uncategorized=false&unit_filter=')
+    assert 'Show Only Uncategorized' in client.get('/').get_data(as_text=True)
+
+
+def test_url_filters_are_shared_and_not_remembered(make_client):
+    client = make_client(URL_FILTERS=True)
+    response = client.get('/?show_uncategorized=true')
+    assert response.status_code == 200
+    assert response.cache_control.public
+    assert 'Show Only Uncategorized' in client.get('/').get_data(as_text=True)
+
+
+def test_redirect_keeps_other_arguments_named_like_url_for_parameters(make_client):
+    client = make_client(URL_FILTERS=True)
+    response = client.get('/?unit_filter=+3+&endpoint=x&_external=1&page=2&page=3')
+    assert response.status_code == 302
+    assert response.headers['Location'] == '/?unit_filter=3&endpoint=x&_external=1&page=2&page=3'
+
+
+def test_canonical_url_is_not_redirected(make_client):
+    assert make_client(URL_FILTERS=True).get('/?unit_filter=3').status_code == 200
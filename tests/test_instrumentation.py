@@ -0,0 +1,53 @@
+import json
+
+import pytest
+from flask import Flask, g
+
+import instrumentation
+
+
+@pytest.fixture
+def conn():
+    conn = instrumentation.connect(':memory:', isolation_level=None)
+    conn.executescript('''
+        CREATE TABLE t (id INTEGER PRIMARY KEY, value INTEGER);
+        CREATE TABLE changes (count INTEGER);
+        INSERT INTO changes VALUES (0);
+        CREATE TRIGGER t_changed AFTER UPDATE ON t BEGIN UPDATE changes SET count = count + 1; END;
+        INSERT INTO t (value) VALUES (1), (2), (3);
+    ''')
+    yield conn
+    conn.close()
+
+
+def sql_count(run):
+    with Flask(__name__).test_request_context('/'):
+        run()
+        return g._instrumentation['sql_count']
+
+
+def test_repeated_identical_statements_are_all_counted(conn):
+    def run():
+        for _ in range(3):
+            conn.execute('SELECT COUNT(*) FROM t').fetchone()
+
+    assert sql_count(run) == 3
+
+
+def test_statement_firing_a_trigger_per_row_is_counted_once(conn):
+    assert sql_count(lambda: conn.execute('UPDATE t SET value = value + 1')) == 1
+
+
+
+def test_slow_executemany_is_logged_with_its_plan(conn, tmp_path):
+    log_path = tmp_path / 'slow.log'
+    instrumentation.configure_slow_query_log(str(log_path), 0)
+    try:
+        cursor = conn.cursor()
+        cursor.executemany('UPDATE t SET value = ? WHERE id = ?', [(1, 1), (2, 2)])
+        cursor.close()
+    finally:
+        instrumentation._slow_query_log['threshold'] = None
+    entry = json.loads(log_path.read_text().splitlines()[-1])
+    assert entry['params'] == ['int', 'int']
+    assert entry['plan']
@@ -0,0 +1,25 @@
+import os
+import shutil
+import sqlite3
+
+from integrity import check_integrity
+
+
+def test_frq_groups_are_checked_by_stored_group_id(database, tmp_path):
+    # Special characters in the path must not be taken for URI syntax
+    folder = tmp_path / 'odd?#%dir'
+    folder.mkdir()
+    path = str(folder / 'ap_stats.db')
+    shutil.copy(database, path)
+    conn = sqlite3.connect(path)
+    # A part number the group does not have, and a part without a number whose year disagrees
+    conn.execute("UPDATE problems SET part_num = 3 WHERE problem_number = '2019APexam FRQ3-2.png'")
+    conn.execute("UPDATE problems SET year = 2016 WHERE problem_number = '2017 APexam Frq1 question.png'")
+    conn.commit()
+    conn.close()
+
+    report = check_integrity(path, str(tmp_path / 'no-course'))
+
+    broken = {group['group_id']: group['reasons'] for group in report['checks']['broken_frq_groups']['samples']}
+    assert broken == {'2019_FRQ_3': ['parts [1, 3]'], '2017_FRQ_1': ["year differs: ['2016', '2017']"]}
+    assert os.path.exists(path)
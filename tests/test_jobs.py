@@ -0,0 +1,124 @@
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+import jobs
+
+
+@pytest.fixture
+def gate(monkeypatch):
+    """A 'blocking' job kind that runs until the returned event is set, reporting progress."""
+    release = threading.Event()
+    started = threading.Event()
+
+    def run_blocking(job):
+        started.set()
+        while not release.wait(0.01):
+            job.progress(0.5, 'Waiting')
+        return {'done': True}
+
+    monkeypatch.setitem(jobs.JOB_KINDS, 'blocking', {'label': 'Blocking', 'description': '', 'run': run_blocking})
+    release.started = started
+    yield release
+    release.set()
+
+
+@pytest.fixture
+def runner(database):
+    return jobs.JobRunner(Flask(__name__), database)
+
+
+def test_wait_idle_waits_for_running_jobs(runner, gate):
+    runner.start('blocking')
+    assert gate.started.wait(5)
+    assert not runner.wait_idle(0.1)
+
+    gate.set()
+    assert runner.wait_idle(5)
+
+
+def wait_for(runner, job_id, **expected):
+    """The job once its fields have the expected values (the worker thread updates the row)."""
+    deadline = time.monotonic() + 5
+    while True:
+        job = runner.get(job_id)
+        if all(job[name] == value for name, value in expected.items()) or time.monotonic() > deadline:
+            return job
+        time.sleep(0.01)
+
+
+def test_job_runs_to_completion_with_progress(runner, gate):
+    job, created = runner.start('blocking')
+    assert created and job['status'] == 'queued'
+    assert gate.started.wait(5)
+
+    running = wait_for(runner, job['id'], message='Waiting')
+    assert (running['status'], running['progress']) == ('running', 0.5)
+    duplicate, created = runner.start('blocking')  # One job of a kind at a time
+    assert (duplicate['id'], created) == (job['id'], False)
+
+    gate.set()
+    assert runner.wait_idle(5)
+    finished = runner.get(job['id'])
+    assert (finished['status'], finished['progress'], finished['result']) == ('succeeded', 1, {'done': True})
+    assert finished['duration_seconds'] is not None
+
+
+def test_running_and_queued_jobs_can_be_cancelled(runner, gate, monkeypatch):
+    ran = []
+    monkeypatch.setitem(jobs.JOB_KINDS, 'quick', {'label': 'Quick', 'description': '', 'run': ran.append})
+
+    running, _ = runner.start('blocking')
+    queued, _ = runner.start('quick')  # Waits behind the blocking job for the only worker thread
+    assert gate.started.wait(5)
+
+    assert runner.cancel(queued['id'])['cancel_requested']
+    assert runner.cancel(running['id'])['cancel_requested']
+    assert runner.wait_idle(5)
+
+    assert runner.get(running['id'])['status'] == 'cancelled'
+    assert runner.get(queued['id'])['status'] == 'cancelled'
+    assert not ran
+    assert runner.cancel(12345) is None
+
+
+def test_failed_and_interrupted_jobs(runner, monkeypatch):
+    def fail(job):
+        raise OSError('disk full')
+    monkeypatch.setitem(jobs.JOB_KINDS, 'failing', {'label': 'Failing', 'description': '', 'run': fail})
+
+    job, _ = runner.start('failing')
+    assert runner.wait_idle(5)
+    assert (runner.get(job['id'])['status'], runner.get(job['id'])['error']) == ('failed', 'OSError: disk full')
+
+    # A job left running by a process that no longer exists
+    conn = runner._connect()
+    with conn:
+        lost = conn.execute('''
+            INSERT INTO jobs (kind, status, params, pid, created) VALUES ('backup', 'running', '{}', ?, 0)
+        ''', (2 ** 22 + 1,)).lastrowid
+    conn.close()
+    assert runner.fail_interrupted() == 1
+    assert runner.get(lost)['status'] == 'failed'
+
+
+def test_jobs_api(make_app, gate):
+    client = make_app().test_client()
+
+    assert client.post('/api/jobs', json=['blocking']).status_code == 400
+    assert client.post('/api/jobs', json={'kind': 'nope'}).status_code == 400
+    assert client.post('/api/jobs', json={'kind': 'blocking', 'params': {'x': 1}}).status_code == 400
+
+    response = client.post('/api/jobs', json={'kind': 'blocking'})
+    assert response.status_code == 202
+    job_id = response.get_json()['id']
+    assert client.post('/api/jobs', json={'kind': 'blocking'}).status_code == 200
+    assert client.get(f'/api/jobs/{job_id}').get_json()['kind'] == 'blocking'
+    assert [job['id'] for job in client.get('/api/jobs').get_json()['jobs']] == [job_id]
+
+    assert client.post(f'/api/jobs/{job_id}/cancel').get_json()['cancel_requested']
+    assert client.get('/api/jobs/999').status_code == 404
+    assert client.application.extensions['jobs'].wait_idle(5)
+    assert client.get(f'/api/jobs/{job_id}').get_json()['status'] == 'cancelled'
@@ -0,0 +1,65 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import metrics
+
+KEY = ('index', 'GET', '200')
+
+
+@pytest.fixture
+def metrics_dir(tmp_path, monkeypatch):
+    monkeypatch.setitem(metrics._state, 'directory', str(tmp_path))
+    monkeypatch.setattr(metrics.http_requests, '_values', {})
+    return tmp_path
+
+
+def write_snapshot(directory, pid, requests):
+    snapshot = {metrics.http_requests.name: [[list(KEY), requests]]}
+    with open(os.path.join(directory, f"metrics-{pid}.json"), 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f)
+
+
+def exited_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def requests_total():
+    return metrics.collect()[metrics.http_requests.name].get(KEY)
+
+
+def test_counts_of_exited_workers_are_kept_when_retired(metrics_dir):
+    write_snapshot(metrics_dir, os.getppid(), 5)
+    write_snapshot(metrics_dir, exited_pid(), 7)
+    # A snapshot under this process's pid was left by an earlier process that had it
+    write_snapshot(metrics_dir, os.getpid(), 3)
+    assert requests_total() == 5 + 7  # This process's own file is replaced by its live values
+
+    assert metrics.retire_stale_snapshots() == 2
+    assert set(os.listdir(metrics_dir)) == {metrics.RETIRED_FILE, metrics.LOCK_FILE,
+                                            f"metrics-{os.getppid()}.json"}
+    assert requests_total() == 5 + 7 + 3
+
+    # Retiring again adds to the retired values
+    write_snapshot(metrics_dir, exited_pid(), 1)
+    metrics.retire_stale_snapshots()
+    assert requests_total() == 5 + 7 + 3 + 1
+
+
+def test_snapshot_is_written_without_waiting_for_another_request(metrics_dir, monkeypatch):
+    monkeypatch.setattr(metrics, 'SNAPSHOT_INTERVAL', 0.01)
+    monkeypatch.setitem(metrics._state, 'thread_pid', None)
+    metrics.http_requests.inc(**dict(zip(metrics.http_requests.labelnames, KEY)))
+    metrics._start_snapshot_thread()
+
+    path = metrics_dir / f"metrics-{os.getpid()}.json"
+    deadline = time.monotonic() + 5
+    while not path.exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert json.loads(path.read_text())[metrics.http_requests.name] == [[list(KEY), 1]]
@@ -0,0 +1,22 @@
+import threading
+
+import pytest
+from flask import Flask
+
+import profiling
+
+
+def test_sampler_stops_when_the_view_raises(tmp_path):
+    app = Flask(__name__)
+    app.config.update(TESTING=True, PROFILING=True, PROFILE_DIR=str(tmp_path))
+    profiling.init_app(app)
+
+    @app.route('/boom')
+    def boom():
+        raise RuntimeError('boom')
+
+    with pytest.raises(RuntimeError):
+        app.test_client().get('/boom?_profile=1')
+
+    assert not [thread for thread in threading.enumerate() if thread.name == 'request-profiler']
+    assert [profile['route'] for profile in profiling.list_profiles(str(tmp_path))] == ['boom']
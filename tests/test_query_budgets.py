@@ -0,0 +1,23 @@
+import pytest
+
+import synthetic_data
+from check_query_budgets import QUERY_BUDGETS, SMALL_CORPUS, check_budgets, measure_queries
+
+# Big enough that a per-row query shows up as a higher count, small enough for every test run
+LARGE_CORPUS = {'years': 4, 'images': 600, 'links': 2000}
+
+
+@pytest.fixture(scope='module')
+def query_counts(tmp_path_factory):
+    """Statements per route on the small and on the large synthetic corpus."""
+    corpora = tmp_path_factory.mktemp('budgets')
+    synthetic_data.generate_corpus(str(corpora / 'small'), **SMALL_CORPUS)
+    synthetic_data.generate_corpus(str(corpora / 'large'), **LARGE_CORPUS)
+    return measure_queries(str(corpora / 'small')), measure_queries(str(corpora / 'large'))
+
+
+@pytest.mark.parametrize('route', QUERY_BUDGETS)
+def test_route_within_query_budget(query_counts, route):
+    small, large = query_counts
+    assert route in small, f"{route} was not requested"
+    assert check_budgets(small, large, {route: QUERY_BUDGETS[route]}) == []
@@ -0,0 +1,93 @@
+import http.client
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+from conftest import REPO_DIR
+from load_test import free_port, stop_server, wait_until_ready
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'), reason='serve.py forks its workers')
+
+
+def get(port, path='/'):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    try:
+        conn.request('GET', path)
+        return conn.getresponse().status
+    finally:
+        conn.close()
+
+
+def wait_for_output(log_path, text, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with open(log_path, encoding='utf-8') as f:
+            if text in f.read():
+                return
+        time.sleep(0.1)
+    raise AssertionError(f"serve.py did not print {text!r} within {timeout}s")
+
+
+def worker_pids(process):
+    """Pids of the master's worker processes, or None where /proc does not list them."""
+    try:
+        with open(f'/proc/{process.pid}/task/{process.pid}/children') as f:
+            return set(map(int, f.read().split()))
+    except OSError:
+        return None
+
+
+def wait_for_new_workers(process, previous, count, timeout=30):
+    """Wait until the master runs `count` workers, none of them from the previous set."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        pids = worker_pids(process)
+        if pids is None or (len(pids) == count and not pids & previous):
+            return
+        time.sleep(0.1)
+    raise AssertionError(f"serve.py did not replace its workers within {timeout}s")
+
+
+@pytest.fixture
+def server(database, course_dir, tmp_path):
+    port = free_port()
+    log_path = tmp_path / 'serve.log'
+    env = dict(os.environ, APSTATS_DB=database, APSTATS_COURSE_DIR=str(course_dir), PYTHONUNBUFFERED='1')
+    with open(log_path, 'w', encoding='utf-8') as log:
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(REPO_DIR, 'serve.py'), '--workers', '2', '--port', str(port),
+             '--metrics-dir', str(tmp_path / 'metrics'), '--watch-interval', '0.2', '--graceful-timeout', '5'],
+            cwd=tmp_path, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        wait_until_ready(port, process)
+        yield process, port, log_path
+    finally:
+        if process.poll() is None:
+            stop_server(process)
+
+
+def test_reload_keeps_serving(server, course_dir):
+    process, port, log_path = server
+
+    workers = worker_pids(process)
+    process.send_signal(signal.SIGHUP)
+    wait_for_output(log_path, 'Loaded the app (generation 2)')
+    wait_for_new_workers(process, workers or set(), 2)  # The previous workers have exited
+    assert [get(port) for _ in range(5)] == [200] * 5
+
+    # A new folder in the course reloads without a signal
+    workers = worker_pids(process)
+    (course_dir / 'Unit 3- Collecting Data').mkdir()
+    wait_for_output(log_path, 'Reloading: the course folder changed')
+    wait_for_output(log_path, 'Loaded the app (generation 3)')
+    wait_for_new_workers(process, workers or set(), 2)
+    assert [get(port) for _ in range(5)] == [200] * 5
+
+    stop_server(process)
+    assert process.returncode == 0
+    output = log_path.read_text(encoding='utf-8')
+    assert 'exited unexpectedly' not in output and 'Traceback' not in output
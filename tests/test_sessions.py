@@ -0,0 +1,91 @@
+import sqlite3
+import time
+
+import pytest
+from flask import session
+
+
+@pytest.fixture
+def app(make_app):
+    app = make_app()
+
+    @app.route('/test/remember/<value>')
+    def remember(value):
+        session['value'] = value
+        return ''
+
+    @app.route('/test/recall')
+    def recall():
+        return session.get('value', '')
+
+    @app.route('/test/forget')
+    def forget():
+        session.clear()
+        return ''
+
+    return app
+
+
+def stored_sessions(database):
+    conn = sqlite3.connect(database)
+    try:
+        return conn.execute('SELECT id, data, expires FROM sessions').fetchall()
+    finally:
+        conn.close()
+
+
+def session_cookie(client):
+    cookie = client.get_cookie('session')
+    return cookie and cookie.value
+
+
+def test_session_data_stays_on_the_server(app, database):
+    client = app.test_client()
+    response = client.get('/test/recall')
+    assert 'Set-Cookie' not in response.headers
+    assert stored_sessions(database) == []
+
+    client.get('/test/remember/filters')
+    [(sid, data, expires)] = stored_sessions(database)
+    assert session_cookie(client) == sid and 'filters' not in sid
+    assert 'filters' in data
+
+    # Reading the session neither rewrites the row nor sends the cookie again
+    response = client.get('/test/recall')
+    assert response.get_data(as_text=True) == 'filters'
+    assert 'Set-Cookie' not in response.headers and 'Cookie' in response.vary
+    assert stored_sessions(database) == [(sid, data, expires)]
+
+    client.get('/test/forget')
+    assert stored_sessions(database) == []
+    assert session_cookie(client) is None
+
+
+def test_session_is_refreshed_halfway_through_its_lifetime(app, database):
+    client = app.test_client()
+    client.get('/test/remember/filters')
+    [(sid, data, expires)] = stored_sessions(database)
+
+    lifetime = app.permanent_session_lifetime.total_seconds()
+    conn = sqlite3.connect(database)
+    with conn:
+        conn.execute('UPDATE sessions SET expires = ?', (time.time() + lifetime / 2 - 60,))
+    conn.close()
+
+    response = client.get('/test/recall')
+    assert 'Set-Cookie' in response.headers
+    [(refreshed_sid, _, refreshed_expires)] = stored_sessions(database)
+    assert refreshed_sid == sid and refreshed_expires >= expires
+
+
+def test_expired_sessions_are_ignored_and_swept(app, database):
+    client = app.test_client()
+    client.get('/test/remember/filters')
+    conn = sqlite3.connect(database)
+    with conn:
+        conn.execute('UPDATE sessions SET expires = ?', (time.time() - 1,))
+    conn.close()
+
+    assert client.get('/test/recall').get_data(as_text=True) == ''
+    assert app.session_interface.sweep() == 1
+    assert stored_sessions(database) == []